@@ -1,7 +1,11 @@
 import os
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html
+from dash import dcc, html, Input, Output, callback
+
+from utils import api, responses, warehouse
+from utils.components import warm_figure_templates
+from utils.sites import ALL_SITES, site_names
 
 # Determine the base directory
 base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -21,6 +25,9 @@ app = dash.Dash(
     external_stylesheets=[dbc.themes.BOOTSTRAP],
 )
 server = app.server
+responses.init_app(server)
+api.init_app(server)
+warm_figure_templates()
 
 # Sidebar layout
 sidebar = html.Div(
@@ -42,6 +49,17 @@ sidebar = html.Div(
             className="sidebar-logo",
         ),
         html.Hr(),
+        # Site shown on every dashboard, or the rollup of all sites
+        html.Label("Site:"),
+        dcc.Dropdown(
+            id="site-filter",
+            options=[{"label": "All Sites", "value": ALL_SITES}],
+            value=ALL_SITES,
+            clearable=False,
+            persistence=True,
+            persistence_type="local",
+        ),
+        html.Hr(),
         dbc.Nav(
             [
                 dbc.NavLink("Upload Data", href="/upload_data", active="exact"),
@@ -49,6 +67,7 @@ sidebar = html.Div(
                 dbc.NavLink("Process Data", href="/process_data", active="exact"),
                 dbc.NavLink("Utilization Overview", href="/overview", active="exact"),
                 dbc.NavLink("Utilization by Specialty", href="/specialty", active="exact"),
+                dbc.NavLink("Room Turnover", href="/turnover", active="exact"),
             ],
             vertical=True,
             pills=True,
@@ -82,30 +101,49 @@ sidebar = html.Div(
     },
 )
 
-# Content area
-content = html.Div(
-    [
-        dcc.Store(id="shared-store-files", storage_type="local"),
-        dcc.Store(id="shared-store-processed", storage_type="local"),
-        dcc.Store(id="shared-store-replacement", storage_type="memory"),
-        dash.page_container,
-    ],
-    style={
-        "margin-left": "250px",
-        "padding": "20px",
-        "background-color": "#f8f9fa",
-        "height": "100vh",
-        "overflow": "auto",
-    },
-)
+# Content area; a browser without processed datasets starts from each site's one saved in the database
+def content():
+    sites = warehouse.current_sites()
+    return html.Div(
+        [
+            dcc.Store(id="shared-store-files", storage_type="local"),
+            dcc.Store(id="shared-store-processed", storage_type="local", data={"sites": sites} if sites else None),
+            dcc.Store(id="shared-store-replacement", storage_type="memory"),
+            dash.page_container,
+        ],
+        style={
+            "margin-left": "250px",
+            "padding": "20px",
+            "background-color": "#f8f9fa",
+            "height": "100vh",
+            "overflow": "auto",
+        },
+    )
 
-# App layout
-app.layout = html.Div(
-    [
-        sidebar,
-        content,
-    ],
+
+# App layout, built per page load so it picks up the latest saved dataset
+def serve_layout():
+    return html.Div(
+        [
+            sidebar,
+            content(),
+        ],
+    )
+
+
+app.layout = serve_layout
+
+
+# Callback to list the sites with uploaded or processed data
+@callback(
+    Output("site-filter", "options"),
+    Input("shared-store-files", "data"),
+    Input("shared-store-processed", "data"),
 )
+def update_site_options(shared_files, processed_data):
+    sites = site_names(shared_files, processed_data)
+    return [{"label": "All Sites", "value": ALL_SITES}] + [{"label": site, "value": site} for site in sites]
+
 
 if __name__ == "__main__":
     app.run_server(debug=False, host='0.0.0.0')
@@ -0,0 +1,349 @@
+"""Load test for the dashboard callbacks.
+
+Virtual users replay scripted sessions against the Dash callback endpoint
+of a running server: open a dashboard page (firing its callbacks the way
+the browser does on load), then change the year, month and specialty
+filters at random. Before the sessions start, synthetic data is uploaded
+and processed, once for all users or once per user.
+
+    gunicorn App:server --workers 4 --threads 4 --bind 127.0.0.1:8050
+    python loadtest.py --url http://127.0.0.1:8050 --users 20 --iterations 30 --output build-a.json
+    python loadtest.py --url http://127.0.0.1:8050 --users 20 --iterations 30 --compare build-a.json
+
+Without --url the app is served in-process on a local port. Sessions are
+seeded, so two runs with the same options send the same requests and
+their results (throughput, latency percentiles, error rates and response
+cache hits per callback) can be compared across builds.
+"""
+import argparse
+import json
+import logging
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from utils.synthetic import synthetic_datasets, upload_contents
+
+CALLBACK_PATH = "/_dash-update-component"
+
+# Callbacks each page fires on load, by one of their outputs, in the order the browser resolves them
+PAGE_CALLBACKS = {
+    "overview": [
+        "year-filter.options",
+        "overview-dataset-summary.children",
+        "month-filter.options",
+        "utilization-rate-line.figure",
+        "utilization-rate-bar.figure",
+        "trend-specialty.options",
+        "utilization-trend.figure",
+    ],
+    "specialty": [
+        "year-filter.options",
+        "month-filter.options",
+        "specialty-filter.options",
+        "specialty-utilization-bar.figure",
+        "occupancy-heatmap.figure",
+        "surgeon-table.data",
+    ],
+    "turnover": [
+        "year-filter.options",
+        "month-filter.options",
+        "specialty-filter.options",
+        "turnover-room-bar.figure",
+    ],
+}
+
+# Component values the page layouts start from
+LAYOUT_DEFAULTS = {
+    "grain-filter.value": "month",
+    "trend-view.value": "yoy",
+    "surgeon-table.page_current": 0,
+    "surgeon-table.page_size": 10,
+    "surgeon-table.sort_by": [],
+    "site-filter.value": "__all__",
+}
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+class Dependencies:
+    """The app's callbacks as served by /_dash-dependencies, looked up by output."""
+
+    def __init__(self, specs):
+        self.specs = [spec for spec in specs if not spec.get("clientside_function")]
+
+    def find(self, output):
+        for spec in self.specs:
+            if output in spec["output"].strip(".").split("..."):
+                return spec
+        raise KeyError(f"No callback has the output {output}")
+
+    @staticmethod
+    def name(spec):
+        return spec["output"].strip(".").split("...")[0]
+
+
+class Recorder:
+    """Thread-safe latency, error and cache-hit records per callback."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def add(self, name, seconds, ok, size, cache):
+        with self.lock:
+            self.samples[name].append((seconds, ok, size, cache))
+
+    def summary(self, elapsed):
+        callbacks = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = np.array([seconds for seconds, _, _, _ in samples]) * 1000
+            errors = sum(not ok for _, ok, _, _ in samples)
+            cached = [cache for _, _, _, cache in samples if cache]
+            callbacks[name] = {
+                "requests": len(samples),
+                "throughput": round(len(samples) / elapsed, 2),
+                "error_rate": round(errors / len(samples), 4),
+                "mean_ms": round(float(latencies.mean()), 1),
+                **{f"p{q}_ms": round(float(np.percentile(latencies, q)), 1) for q in PERCENTILES},
+                "max_ms": round(float(latencies.max()), 1),
+                "mean_bytes": int(np.mean([size for _, _, size, _ in samples])),
+                "cache_hit_rate": round(cached.count("hit") / len(cached), 4) if cached else None,
+            }
+        total = sum(summary["requests"] for summary in callbacks.values())
+        errors = sum(summary["requests"] * summary["error_rate"] for summary in callbacks.values())
+        latencies = np.array([seconds for samples in self.samples.values() for seconds, _, _, _ in samples]) * 1000
+        overall = {
+            "requests": total,
+            "throughput": round(total / elapsed, 2) if elapsed else 0,
+            "error_rate": round(errors / total, 4) if total else 0,
+            **{f"p{q}_ms": round(float(np.percentile(latencies, q)), 1) for q in PERCENTILES if total},
+        }
+        return {"overall": overall, "callbacks": callbacks}
+
+
+class Session:
+    """One browser's component values and the callback requests it sends."""
+
+    def __init__(self, url, dependencies, recorder, values=None):
+        self.url = url.rstrip("/")
+        self.dependencies = dependencies
+        self.recorder = recorder
+        self.values = dict(LAYOUT_DEFAULTS, **(values or {}))
+        self.http = requests.Session()
+
+    def fire(self, output, changed):
+        """Send the callback with this output; returns False when it failed."""
+        spec = self.dependencies.find(output)
+        outputs = [
+            {"id": item.rsplit(".", 1)[0], "property": item.rsplit(".", 1)[1]}
+            for item in spec["output"].strip(".").split("...")
+        ]
+
+        def values(items):
+            return [{"id": item["id"], "property": item["property"], "value": self.values.get(f"{item['id']}.{item['property']}")} for item in items]
+
+        body = {
+            "output": spec["output"],
+            "outputs": outputs if spec["output"].startswith("..") else outputs[0],
+            "inputs": values(spec["inputs"]),
+            "state": values(spec["state"]),
+            "changedPropIds": changed,
+        }
+        start = time.perf_counter()
+        try:
+            response = self.http.post(self.url + CALLBACK_PATH, json=body, timeout=600)
+            ok = response.status_code in (200, 204)
+            size = len(response.content)
+            cache = response.headers.get("X-Response-Cache")
+        except requests.RequestException:
+            response, ok, size, cache = None, False, 0, None
+        self.recorder.add(Dependencies.name(spec), time.perf_counter() - start, ok, size, cache)
+
+        if ok and response.status_code == 200:
+            for component, props in response.json().get("response", {}).items():
+                for prop, value in props.items():
+                    # Partial updates only make sense against the browser's copy
+                    if not (isinstance(value, dict) and "__dash_patch_update" in value):
+                        self.values[f"{component}.{prop}"] = value
+        return ok
+
+    def upload_and_process(self, site_contents):
+        """Upload each site's files ({site: contents}) and process every site at once."""
+        uploaded = True
+        for site, contents in site_contents.items():
+            self.values.update(
+                {
+                    "upload-site.value": site,
+                    "upload-nu.contents": [contents["nu"]],
+                    "upload-sg.contents": [contents["sg"]],
+                    "upload-dm.contents": [contents["dm"]],
+                    "upload-nu.filename": ["elective_cases.xlsx"],
+                    "upload-sg.filename": ["surgeons.xlsx"],
+                    "upload-dm.filename": ["available_time.xlsm"],
+                }
+            )
+            uploaded = uploaded and self.fire(
+                "shared-store-files.data", ["upload-nu.contents", "upload-sg.contents", "upload-dm.contents"]
+            )
+        self.values["process-data-btn.n_clicks"] = 1
+        processed = uploaded and self.fire("shared-store-processed.data", ["process-data-btn.n_clicks"])
+        for key in list(self.values):
+            if key.startswith("upload-"):
+                del self.values[key]
+        return processed and bool(self.values.get("shared-store-processed.data"))
+
+    def open_page(self, page):
+        for output in PAGE_CALLBACKS[page]:
+            spec = self.dependencies.find(output)
+            self.fire(output, [f"{item['id']}.{item['property']}" for item in spec["inputs"]])
+
+    def change(self, page, changed):
+        """Fire the page's callbacks that take any of the changed values as input."""
+        for output in PAGE_CALLBACKS[page]:
+            spec = self.dependencies.find(output)
+            triggers = [f"{item['id']}.{item['property']}" for item in spec["inputs"]]
+            if any(trigger in changed for trigger in triggers):
+                self.fire(output, [trigger for trigger in triggers if trigger in changed])
+
+    def options(self, component):
+        return [option["value"] for option in self.values.get(f"{component}.options") or [] if not option.get("disabled")]
+
+
+def run_user(user, args, url, dependencies, recorder, stores, contents):
+    rng = random.Random(args.seed * 1000 + user)
+    session = Session(url, dependencies, recorder)
+    if args.setup == "per-user":
+        if not session.upload_and_process(contents):
+            return
+    else:
+        session.values.update(stores)
+
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    for _ in range(args.iterations):
+        if deadline and time.perf_counter() > deadline:
+            break
+        page = rng.choice(sorted(PAGE_CALLBACKS))
+        session.values.update({"year-filter.value": None, "month-filter.value": None, "specialty-filter.value": None})
+        session.open_page(page)
+        for _ in range(args.changes):
+            time.sleep(args.think_time)
+            changed = []
+            years = session.options("year-filter")
+            if years:
+                session.values["year-filter.value"] = rng.choice(years)
+                changed.append("year-filter.value")
+            session.values["month-filter.value"] = sorted(rng.sample(range(1, 13), rng.randint(1, 12)))
+            changed.append("month-filter.value")
+            specialties = session.options("specialty-filter")
+            if page != "overview" and specialties:
+                session.values["specialty-filter.value"] = rng.choice(specialties)
+                changed.append("specialty-filter.value")
+            session.change(page, changed)
+
+
+def serve_locally():
+    from werkzeug.serving import make_server
+
+    from App import server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    httpd = make_server("127.0.0.1", 0, server, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}"
+
+
+def build_label():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result, baseline=None):
+    overall = result["overall"]
+    print(f"Build {result['build']}: {overall['requests']} requests in {result['elapsed_s']}s, "
+          f"{overall['throughput']} req/s, error rate {overall['error_rate']:.2%}")
+    header = f"{'callback':40} {'reqs':>6} {'req/s':>7} {'err':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'cache':>6}"
+    print(header)
+    for name, summary in result["callbacks"].items():
+        hit_rate = "" if summary["cache_hit_rate"] is None else f"{summary['cache_hit_rate']:.0%}"
+        line = (f"{name:40} {summary['requests']:>6} {summary['throughput']:>7} {summary['error_rate']:>6.1%} "
+                f"{summary['p50_ms']:>8} {summary['p95_ms']:>8} {summary['p99_ms']:>8} {hit_rate:>6}")
+        before = (baseline or {}).get("callbacks", {}).get(name)
+        if before:
+            line += f"   p95 {summary['p95_ms'] - before['p95_ms']:+.1f} ms vs {baseline['build']}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", help="server to test; served in-process when omitted")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=10, help="page visits per user")
+    parser.add_argument("--changes", type=int, default=3, help="filter changes per page visit")
+    parser.add_argument("--duration", type=float, default=0, help="stop users after this many seconds (0: no limit)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between filter changes")
+    parser.add_argument("--cases", type=int, default=5000, help="synthetic elective cases")
+    parser.add_argument("--years", type=int, nargs="+", default=[2023, 2024], help="years the synthetic cases span")
+    parser.add_argument("--sites", type=int, default=1, help="sites to upload synthetic data for; pages show their rollup")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--setup", choices=["once", "per-user"], default="once",
+                        help="upload and process once for all users, or in every user's session")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    url = args.url or serve_locally()
+    dependencies = Dependencies(requests.get(url.rstrip("/") + "/_dash-dependencies", timeout=60).json())
+    # One site keeps the default site name, so single-site runs are unchanged
+    contents = {
+        (f"Site {index + 1}" if args.sites > 1 else None): upload_contents(
+            synthetic_datasets(args.cases, years=tuple(args.years), seed=args.seed + index)
+        )
+        for index in range(args.sites)
+    }
+
+    setup = Recorder()
+    stores = {}
+    if args.setup == "once":
+        session = Session(url, dependencies, setup)
+        setup_start = time.perf_counter()
+        if not session.upload_and_process(contents):
+            raise SystemExit("Upload or processing failed; see the server log.")
+        setup_elapsed = time.perf_counter() - setup_start
+        stores = {key: session.values[key] for key in ["shared-store-files.data", "shared-store-processed.data"]}
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for future in [pool.submit(run_user, user, args, url, dependencies, recorder, stores, contents) for user in range(args.users)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "build": build_label(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("url", "output", "compare")},
+        "elapsed_s": round(elapsed, 2),
+        **recorder.summary(elapsed),
+    }
+    if setup.samples:
+        result["setup"] = setup.summary(setup_elapsed)["callbacks"]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(result, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
 import dash
-from dash import dcc, html, Input, Output, State, callback, dash_table
+from dash import dcc, html, Input, Output, State, Patch, callback, ctx, dash_table
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
+from utils import warehouse
+from utils.cache import LRUCache
+from utils.capacity import CapacityCalendar
+from utils.components import MONTH_NAMES, month_options
+from utils.manifest import describe_manifest
+from utils.sites import combine_utilization, site_manifest, site_versions, stale_sites, sum_frames
+from utils.utilization import GRAIN_LABELS, MonthlyTrends, aggregate_utilization
+
 dash.register_page(__name__, path="/overview")
 
+# Time grains offered for the utilization line chart
+OVERVIEW_GRAINS = ["day", "week", "month", "quarter", "fiscal_year"]
+
+# Views offered for the trend chart: year over year, or a trailing window of months
+TREND_VIEWS = {"yoy": "Year over Year", "rolling_3": "Rolling 3 Months", "rolling_6": "Rolling 6 Months", "rolling_12": "Rolling 12 Months"}
+
+TABLE_COLUMNS = ["Specialty", "Month", "Year", "TotalPatientInRoomHours", "Total Available Hours", "UtilizationRate"]
+
+# Per-dataset intermediate results shared by the overview callbacks
+_cache = LRUCache(maxsize=64)
+
 # Layout for the Overview Page
 layout = html.Div(
     [
         html.H1("Overview Dashboard", style={"textAlign": "center"}),
+        html.P(id="overview-dataset-summary", style={"textAlign": "center", "color": "grey"}),
 
         # Month and Year filters
         html.Div(
@@ -24,20 +44,7 @@ layout = html.Div(
                 html.Label("Select Month(s):"),
                 dcc.Checklist(
                     id="month-filter",
-                    options=[
-                        {"label": html.Span("January", style={"padding": "5px"}), "value": 1},
-                        {"label": html.Span("February", style={"padding": "5px"}), "value": 2},
-                        {"label": html.Span("March", style={"padding": "5px"}), "value": 3},
-                        {"label": html.Span("April", style={"padding": "5px"}), "value": 4},
-                        {"label": html.Span("May", style={"padding": "5px"}), "value": 5},
-                        {"label": html.Span("June", style={"padding": "5px"}), "value": 6},
-                        {"label": html.Span("July", style={"padding": "5px"}), "value": 7},
-                        {"label": html.Span("August", style={"padding": "5px"}), "value": 8},
-                        {"label": html.Span("September", style={"padding": "5px"}), "value": 9},
-                        {"label": html.Span("October", style={"padding": "5px"}), "value": 10},
-                        {"label": html.Span("November", style={"padding": "5px"}), "value": 11},
-                        {"label": html.Span("December", style={"padding": "5px"}), "value": 12},
-                    ],
+                    options=month_options(),
                     inline=True,
                     style={"marginBottom": "20px"},
                 ),
@@ -49,6 +56,11 @@ layout = html.Div(
             [
                 # Total Utilization Rate Card
                 html.Div(
+                    dcc.Graph(
+                        id="total-utilization-gauge",
+                        config={"displayModeBar": False},  # Hide the mode bar for a cleaner look
+                        style={"height": "100%", "width": "100%"},  # Ensure responsiveness
+                    ),
                     id="total-utilization-card",
                     style={
                         "backgroundColor": "#f9f9f9",
@@ -114,16 +126,49 @@ layout = html.Div(
         html.Div(
             [
                 html.H3("Utilization Rate Over Time", style={"textAlign": "center"}),
+                dcc.RadioItems(
+                    id="grain-filter",
+                    options=[{"label": GRAIN_LABELS[grain], "value": grain} for grain in OVERVIEW_GRAINS],
+                    value="month",
+                    inline=True,
+                    inputStyle={"marginRight": "5px", "marginLeft": "15px"},
+                    style={"textAlign": "center"},
+                ),
                 dcc.Graph(id="utilization-rate-line"),
             ],
             style={"marginTop": "20px"},
         ),
 
+        # Year-over-year and trailing-window utilization across every year in the dataset
+        html.Div(
+            [
+                html.H3("Utilization Trends", style={"textAlign": "center"}),
+                dcc.RadioItems(
+                    id="trend-view",
+                    options=[{"label": label, "value": view} for view, label in TREND_VIEWS.items()],
+                    value="yoy",
+                    inline=True,
+                    inputStyle={"marginRight": "5px", "marginLeft": "15px"},
+                    style={"textAlign": "center"},
+                ),
+                dcc.Dropdown(
+                    id="trend-specialty",
+                    options=[],  # Placeholder; will update dynamically
+                    placeholder="All Specialties",
+                    style={"width": "50%", "margin": "10px auto"},
+                ),
+                dcc.Graph(id="utilization-trend"),
+            ],
+            style={"marginTop": "20px"},
+        ),
+
         # Bar chart for utilization rate by specialty
         html.Div(
             [
                 html.H3("Utilization Rate by Specialty", style={"textAlign": "center"}),
                 dcc.Graph(id="utilization-rate-bar"),
+                # Whether the bar chart holds a full bar figure that filter changes can patch
+                dcc.Store(id="utilization-rate-bar-filled", data=False),
             ],
             style={"marginTop": "20px"},
         ),
@@ -132,150 +177,169 @@ layout = html.Div(
         html.Div(
             [
                 html.H3("Merged Data Table", style={"textAlign": "center", "marginTop": "20px"}),
-                html.Div(id="merged-data-table"),
+                dash_table.DataTable(
+                    id="merged-data-table",
+                    columns=[{"name": col, "id": col} for col in TABLE_COLUMNS],
+                    page_size=10,
+                    style_table={"overflowX": "auto"},
+                ),
             ]
         ),
-        
-        dcc.Store(id="shared-store-processed")
     ],
     style={"padding": "20px"},
 )
 
-# Callback to populate year dropdown
+# Callback to populate year dropdown from the dataset manifest
 @callback(
     Output("year-filter", "options"),
     Input("shared-store-processed", "data"),
+    Input("site-filter", "value"),
 )
-def update_year_options(processed_data):
-    if not processed_data or "total" not in processed_data:
+def update_year_options(processed_data, selected_site):
+    manifest = site_manifest(processed_data, selected_site)
+    if not manifest:
         return []
-    df = pd.DataFrame(processed_data["total"])
-    years = df["Year"].dropna().unique()
-    return [{"label": str(year), "value": year} for year in sorted(years)]
+    return [{"label": str(year), "value": year} for year in manifest["years"]]
 
 
-# Callback to update the dashboard based on filters
+# Callback to describe the loaded dataset under the page title
 @callback(
-    [
-        Output("utilization-rate-line", "figure"),
-        Output("utilization-rate-bar", "figure"),
-        Output("total-utilization-card", "children"),
-        Output("top-5-card", "children"),
-        Output("bottom-5-card", "children"),
-        Output("merged-data-table", "children"),
-    ],
-    [
-        Input("shared-store-files", "data"),
-        Input("shared-store-processed", "data"),
-        Input("year-filter", "value"),
-        Input("month-filter", "value"),
-    ],
+    Output("overview-dataset-summary", "children"),
+    Input("shared-store-processed", "data"),
+    Input("shared-store-files", "data"),
+    Input("site-filter", "value"),
 )
+def update_dataset_summary(processed_data, shared_data, selected_site):
+    stale = stale_sites(shared_data, processed_data, selected_site)
+    if stale:
+        return f"The elective cases of {', '.join(stale)} were uploaded again after processing. Please process the data again."
+    return describe_manifest(site_manifest(processed_data, selected_site))
 
-def update_dashboard(shared_data, processed_data, selected_year, selected_months):
-    if not processed_data or "total" not in processed_data:
-        return (
-            px.line(title="No data available."),
-            px.bar(title="No data available."),
-            html.Div("No data available.", style={"color": "red"}),
-            html.Div("No data available.", style={"color": "red"}),
-            html.Div("No data available.", style={"color": "red"}),
-            dash_table.DataTable(data=[], columns=[]),
-        )
 
-    # Step 1: Convert processed data to DataFrame
-    df = pd.DataFrame(processed_data["total"])
+# Callback to disable months that have no cases in the selected year
+@callback(
+    Output("month-filter", "options"),
+    Input("year-filter", "value"),
+    State("shared-store-processed", "data"),
+    State("site-filter", "value"),
+)
+def update_month_options(selected_year, processed_data, selected_site):
+    manifest = site_manifest(processed_data, selected_site)
+    if not manifest or not selected_year:
+        return month_options()
+    return month_options(set(manifest["months"].get(str(int(selected_year)), [])))
 
-    # Step 2: Summarize TotalPatientInRoomHours by Specialty, Month, and Year
-    summary_df = df.groupby(["Specialty", "Month", "Year"], as_index=False).agg(
-        TotalPatientInRoomHours=("Total Patient In Room Minutes", lambda x: x.sum() / 60)  # Convert minutes to hours
-    )
 
-    # Step 3: Ensure records in `dm_df` are unique and rename for alignment
-    dm_df = pd.DataFrame(shared_data["dm"])
-
-    # Ensure records in `dm_df` are unique by aggregating duplicate entries
-    dm_df = dm_df.groupby(["Services", "Month", "Year"], as_index=False).agg(
-        Monday=("Monday", "sum"),
-        Tuesday=("Tuesday", "sum"),
-        Wednesday=("Wednesday", "sum"),
-        Thursday=("Thursday", "sum"),
-        Friday=("Friday", "sum"),
-        Sum=("Sum", "sum"),  # Aggregate the `Sum` column properly
-    )
+def dashboard_versions(shared_data, processed_data, selected_site):
+    # ((site, (dataset, Available Time summary, revision)), ...) to query in the database
+    return tuple(site_versions(shared_data, processed_data, selected_site)) or None
 
-    # Rename columns for alignment with the rest of the pipeline
-    dm_df = dm_df.rename(
-        columns={"Services": "Specialty", "Sum": "Total Available Hours"}
-    )
 
-    
-    # Step 4: Merge summarized data with `dm_df`
-    merged_df = pd.merge(
-        summary_df,
-        dm_df[["Specialty", "Month", "Year", "Total Available Hours"]],
-        how="left",
-        on=["Specialty", "Month", "Year"],
-    )
+def daily_capacity(capacity_version):
+    def compute():
+        return CapacityCalendar.from_available_time(warehouse.query_available_time(capacity_version)).to_frame()
 
-    # Step 5: Calculate Utilization Rate
-    merged_df["UtilizationRate"] = (
-        merged_df["TotalPatientInRoomHours"] / merged_df["Total Available Hours"]
-    ) * 100
+    return _cache.get_or_compute(("daily", capacity_version), compute)
 
-    # Step 6: Filter data based on selected year and months
-    if selected_year:
-        merged_df = merged_df[merged_df["Year"] == int(selected_year)]
-    if selected_months:
-        merged_df = merged_df[merged_df["Month"].isin(map(int, selected_months))]
 
-    # Check if data is empty after filtering
-    if merged_df.empty:
-        return (
-            px.line(title="No data available for the selected filters."),
-            px.bar(title="No data available for the selected filters."),
-            html.Div("No data available.", style={"color": "red"}),
-            dash_table.DataTable(data=[], columns=[]),
+def monthly_trends(versions):
+    # Built from the monthly aggregates the database keeps up to date as cases are
+    # written or patched, added up over the selected sites
+    def compute():
+        monthly = [warehouse.query_monthly(version, capacity_version) for _, (version, capacity_version, _) in versions]
+        return MonthlyTrends.from_monthly(
+            sum_frames(monthly, ["Specialty", "Date"], ["Cases", "PatientHours", "AvailableHours"])
         )
 
-    # Step 7: Summarize monthly utilization rates (discard specialty)
-    monthly_summary = merged_df.groupby(["Month", "Year"], as_index=False).agg(
-        TotalPatientInRoomHours=("TotalPatientInRoomHours", "sum"),
-        TotalAvailableHours=("Total Available Hours", "sum"),
-    )
-    monthly_summary["UtilizationRate"] = (
-        monthly_summary["TotalPatientInRoomHours"] / monthly_summary["TotalAvailableHours"]
-    ) * 100
+    return _cache.get_or_compute(("trends", versions), compute)
 
-    # Calculate the mean utilization rate
-    mean_utilization_rate = monthly_summary["UtilizationRate"].mean()
 
+def filter_year_months(frame, selected_year, selected_months):
+    if selected_year:
+        frame = frame[frame["Date"].dt.year == int(selected_year)]
+    if selected_months:
+        frame = frame[frame["Date"].dt.month.isin(list(map(int, selected_months)))]
+    return frame
+
+
+def specialty_month_table(versions, selected_year):
+    """Utilization by Specialty and month for one year (or all years).
+
+    Month selections are applied afterwards by filtering rows, since
+    capacity is matched per specialty and month anyway. Each site is
+    matched against its own capacity and the sites' hours are then added up.
+    """
+    def compute():
+        frames = []
+        for _, (version, capacity_version, _) in versions:
+            cases = warehouse.query_case_hours(version, year=selected_year, grain="month")
+            if not cases.empty:
+                capacity = warehouse.query_capacity(capacity_version, year=selected_year)
+                frames.append(aggregate_utilization(cases, capacity, grain="month", by_specialty=True))
+        if not frames:
+            return pd.DataFrame(columns=TABLE_COLUMNS)
+        merged_df = combine_utilization(frames, ["PeriodStart", "Period", "Specialty"])
+        merged_df["Month"] = merged_df["PeriodStart"].dt.month
+        merged_df["Year"] = merged_df["PeriodStart"].dt.year
+        return merged_df.rename(columns={"TotalAvailableHours": "Total Available Hours"})
+
+    return _cache.get_or_compute(("specialty_month", versions, selected_year), compute)
+
+
+def selected_rows(shared_data, processed_data, selected_site, selected_year, selected_months):
+    versions = dashboard_versions(shared_data, processed_data, selected_site)
+    if versions is None:
+        return None
+    merged_df = specialty_month_table(versions, selected_year)
+    if selected_months:
+        merged_df = merged_df[merged_df["Month"].isin(list(map(int, selected_months)))]
+    return merged_df
 
-    # Create Line Graph
-    line_fig = px.line(
-        monthly_summary,
-        x="Month",
-        y="UtilizationRate",
-        title="Utilization Rate by Month",
-        markers=True,
-        labels={"UtilizationRate": "Utilization Rate (%)", "Month": "Month"},
-    )
 
-    # Update x-axis and y-axis
-    line_fig.update_xaxes(
-        tickmode="linear", dtick=1, title="Month",
+def no_data_figure(kind, message):
+    return (px.line if kind == "line" else px.bar)(title=message)
+
+
+def gauge_figure(value, title="Total Utilization Rate"):
+    # Create the gauge chart
+    gauge_fig = go.Figure(
+        go.Indicator(
+            mode="gauge+number",
+            value=value,
+            title={"text": title, "font": {"size": 18}},
+            gauge={
+                "axis": {
+                "range": [0, 100],
+                "tickwidth": 0,  # Remove tick marks width to make it minimal
+                "tickcolor": "rgba(0,0,0,0)",  # Set tick color to transparent
+                },
+                "bar": {"color": "teal"},
+                "steps": [
+                    {"range": [0, 50], "color": "lightcoral"},
+                    {"range": [50, 75], "color": "khaki"},
+                    {"range": [75, 100], "color": "lightgreen"},
+                ],
+            "borderwidth": 0,  # Set border width to zero to remove any border lines
+            "bordercolor": "rgba(0,0,0,0)",  # Make border color transparent
+            },
+            number={"suffix": "%"},  # Display as a percentage
+        )
     )
 
-    # Add Mean Utilization Rate Line
-    line_fig.add_hline(
-        y=mean_utilization_rate,
-        line_dash="dash",
-        line_color="red",
-        annotation_text="Mean Utilization Rate",
+    # Add styling to the gauge chart
+    gauge_fig.update_layout(
+        height=300,  # Make the chart smaller
+        width=300,  # Set the width to keep it proportional
+        margin=dict(l=10, r=10, t=10, b=10),  # Minimal margin
+        paper_bgcolor="rgba(0,0,0,0)",  # Transparent background
+        plot_bgcolor="rgba(0,0,0,0)",  # Transparent plot area
     )
+    return gauge_fig
 
-    # Step 8: Create Grouped Bar Chart
-    merged_df["Month-Year"] = merged_df["Month"].astype(str) + "-" + merged_df["Year"].astype(str)  # Combine Month-Year
+
+def bar_figure(merged_df):
+    # Create Grouped Bar Chart
+    merged_df = merged_df.assign(**{"Month-Year": merged_df["Month"].astype(str) + "-" + merged_df["Year"].astype(str)})  # Combine Month-Year
 
     # Compute mean utilization rate per specialty
     specialty_means = merged_df.groupby('Specialty')['UtilizationRate'].mean().reset_index()
@@ -287,11 +351,6 @@ def update_dashboard(shared_data, processed_data, selected_year, selected_months
     # Reorder 'Specialty' in merged_df according to mean utilization rate
     merged_df['Specialty'] = pd.Categorical(merged_df['Specialty'], categories=ordered_specialties, ordered=True)
 
-    #print(specialty_means, ordered_specialties)
-    #print("Specialties in merged_df not in ordered_specialties:")
-    #print(set(merged_df['Specialty']) - set(ordered_specialties))
-    #print("Data type of Specialty column in merged_df:", merged_df['Specialty'].dtype)
-
     # Dynamically adjust the height of the bar chart based on the number of specialties
     num_specialties = merged_df["Specialty"].nunique()
     chart_height = max(400, num_specialties * 50)  # Base height is 400px, add 50px per specialty
@@ -315,60 +374,11 @@ def update_dashboard(shared_data, processed_data, selected_year, selected_months
         yaxis=dict(title="Specialty", automargin=True),  # Ensure y-axis labels fit
         xaxis=dict(title="Utilization Rate (%)", tickformat=".0f"),  # Format x-axis
     )
-
-    # Step 9: Create Total Utilization Rate Card
-    total_utilization_rate = (
-        merged_df["TotalPatientInRoomHours"].sum() / merged_df["Total Available Hours"].sum()
-    ) * 100
-
-    # Create the gauge chart
-    gauge_fig = go.Figure(
-        go.Indicator(
-            mode="gauge+number",
-            value=total_utilization_rate,
-            title={"text": "Total Utilization Rate", "font": {"size": 18}},
-            gauge={
-                "axis": {
-                "range": [0, 100],
-                "tickwidth": 0,  # Remove tick marks width to make it minimal
-                "tickcolor": "rgba(0,0,0,0)",  # Set tick color to transparent
-                },
-                "bar": {"color": "teal"},
-                "steps": [
-                    {"range": [0, 50], "color": "lightcoral"},
-                    {"range": [50, 75], "color": "khaki"},
-                    {"range": [75, 100], "color": "lightgreen"},
-                ],
-            "borderwidth": 0,  # Set border width to zero to remove any border lines
-            "bordercolor": "rgba(0,0,0,0)",  # Make border color transparent
-            },
-            number={"suffix": "%"},  # Display as a percentage
-        )
-    )
-
-    # Add styling to the gauge chart
-    gauge_fig.update_layout(
-        height=300,  # Make the chart smaller
-        width=300,  # Set the width to keep it proportional
-        margin=dict(l=10, r=10, t=10, b=10),  # Minimal margin
-        paper_bgcolor="rgba(0,0,0,0)",  # Transparent background
-        plot_bgcolor="rgba(0,0,0,0)",  # Transparent plot area
-    )
-
-    # Replace the total utilization card with the gauge chart
-    total_utilization_card = dcc.Graph(
-        figure=gauge_fig,
-        config={"displayModeBar": False},  # Hide the mode bar for a cleaner look
-        style={"height": "100%", "width": "100%"},  # Ensure responsiveness
-    )
+    return bar_fig, specialty_means
 
 
-    # Extract Top 5 and Bottom 5 specialties
-    top_5_specialties = specialty_means.nlargest(5, "UtilizationRate")
-    bottom_5_specialties = specialty_means.nsmallest(5, "UtilizationRate")
-
-    # Create lists for display
-    top_5_list = html.Ul(
+def specialty_list(specialties):
+    return html.Ul(
         [
             html.Li(
                 [
@@ -377,7 +387,7 @@ def update_dashboard(shared_data, processed_data, selected_year, selected_months
                 ],
                 style={"padding": "5px 0"}
             )
-            for _, row in top_5_specialties.iterrows()
+            for _, row in specialties.iterrows()
         ],
         style={
             "listStyleType": "none",  # Removes bullet points
@@ -386,49 +396,211 @@ def update_dashboard(shared_data, processed_data, selected_year, selected_months
         },
     )
 
-    bottom_5_list = html.Ul(
-        [
-            html.Li(
-                [
-                    html.Span(f"{row['Specialty']}", style={"minWidth": "120px", "textAlign": "left", "display": "inline-block"}),
-                    html.Span(f"{row['UtilizationRate']:.2f}%", style={"textAlign": "left", "display": "inline-block"}),
-                ],
-                style={"padding": "5px 0"}
-            )
-            for _, row in bottom_5_specialties.iterrows()
-        ],
-        style={
-            "listStyleType": "none",  # Removes bullet points
-            "padding": "0",           # Removes default padding
-            "margin": "0",            # Removes default margin
-        },
-    )
 
-    # Card for Top 5 Specialties
-    top_5_card = html.Div(
-        [
-            html.H3("Top 5"),
-            top_5_list,
-        ],
+# Callback for the line chart; it alone reacts to the grain selector
+@callback(
+    Output("utilization-rate-line", "figure"),
+    [
+        Input("shared-store-processed", "data"),
+        Input("year-filter", "value"),
+        Input("month-filter", "value"),
+        Input("grain-filter", "value"),
+        Input("site-filter", "value"),
+    ],
+    State("shared-store-files", "data"),
+)
+def update_line_chart(processed_data, selected_year, selected_months, selected_grain, selected_site, shared_data):
+    versions = dashboard_versions(shared_data, processed_data, selected_site)
+    if versions is None:
+        return no_data_figure("line", "No data available.")
+
+    # Overall utilization at the selected grain (discard specialty), using
+    # per-business-day capacity when the grain is finer than a month
+    grain = selected_grain or "month"
+    fine = grain in ("day", "week")
+    summaries = []
+    for _, (version, capacity_version, _) in versions:
+        cases = warehouse.query_case_hours(version, selected_year, selected_months, grain="day" if fine else "month")
+        if cases.empty:
+            continue
+        if fine:
+            capacity = filter_year_months(daily_capacity(capacity_version), selected_year, selected_months)
+        else:
+            capacity = warehouse.query_capacity(capacity_version, selected_year, selected_months)
+        summaries.append(aggregate_utilization(cases, capacity, grain=grain, by_specialty=False))
+    if not summaries:
+        return no_data_figure("line", "No data available for the selected filters.")
+
+    period_summary = combine_utilization(summaries, ["PeriodStart", "Period"])
+
+    # Calculate the mean utilization rate
+    mean_utilization_rate = period_summary["UtilizationRate"].mean()
+
+    # Create Line Graph
+    line_fig = px.line(
+        period_summary,
+        x="Period",
+        y="UtilizationRate",
+        title=f"Utilization Rate by {GRAIN_LABELS[grain]}",
+        markers=True,
+        labels={"UtilizationRate": "Utilization Rate (%)", "Period": GRAIN_LABELS[grain]},
     )
 
-    # Card for Bottom 5 Specialties
-    bottom_5_card = html.Div(
-        [
-            html.H3("Bottom 5"),
-            bottom_5_list,
-        ],
+    # Update x-axis and y-axis
+    line_fig.update_xaxes(
+        type="category", title=GRAIN_LABELS[grain],
     )
 
-    # Step 10: Create Merged Data Table
-    data_table = dash_table.DataTable(
-        data=merged_df.to_dict("records"),
-        columns=[
-            {"name": col, "id": col}
-            for col in ["Specialty", "Month", "Year", "TotalPatientInRoomHours", "Total Available Hours", "UtilizationRate"]
-        ],
-        page_size=10,
-        style_table={"overflowX": "auto"},
+    # Add Mean Utilization Rate Line
+    line_fig.add_hline(
+        y=mean_utilization_rate,
+        line_dash="dash",
+        line_color="red",
+        annotation_text="Mean Utilization Rate",
     )
+    return line_fig
+
 
-    return line_fig, bar_fig, total_utilization_card, top_5_card, bottom_5_card, data_table
+# Callback for the specialty views. A year or month change patches only the
+# bar data and the gauge value instead of resending whole figures.
+@callback(
+    [
+        Output("utilization-rate-bar", "figure"),
+        Output("total-utilization-gauge", "figure"),
+        Output("top-5-card", "children"),
+        Output("bottom-5-card", "children"),
+        Output("merged-data-table", "data"),
+        Output("utilization-rate-bar-filled", "data"),
+    ],
+    [
+        Input("shared-store-processed", "data"),
+        Input("year-filter", "value"),
+        Input("month-filter", "value"),
+        Input("site-filter", "value"),
+    ],
+    State("shared-store-files", "data"),
+    State("utilization-rate-bar-filled", "data"),
+)
+def update_specialty_views(processed_data, selected_year, selected_months, selected_site, shared_data, bar_filled):
+    merged_df = selected_rows(shared_data, processed_data, selected_site, selected_year, selected_months)
+    if merged_df is None or merged_df.empty:
+        message = "No data available." if merged_df is None else "No data available for the selected filters."
+        return (
+            no_data_figure("bar", message),
+            gauge_figure(0, title=message),
+            html.Div("No data available.", style={"color": "red"}),
+            html.Div("No data available.", style={"color": "red"}),
+            [],
+            False,
+        )
+
+    bar_fig, specialty_means = bar_figure(merged_df)
+
+    # Total Utilization Rate
+    total_utilization_rate = (
+        merged_df["TotalPatientInRoomHours"].sum() / merged_df["Total Available Hours"].sum()
+    ) * 100
+
+    # Only a full bar figure can be patched; the no-data figure lacks its layout
+    if ctx.triggered_id in ("year-filter", "month-filter") and bar_filled:
+        bar_patch = Patch()
+        bar_patch["data"] = bar_fig.to_plotly_json()["data"]
+        bar_patch["layout"]["height"] = bar_fig.layout.height
+        bar_patch["layout"]["yaxis"]["categoryarray"] = bar_fig.layout.yaxis.categoryarray
+        bar_patch["layout"]["yaxis"]["categoryorder"] = bar_fig.layout.yaxis.categoryorder
+        bar_patch["layout"]["title"]["text"] = bar_fig.layout.title.text
+        bar_figure_output = bar_patch
+
+        gauge_patch = Patch()
+        gauge_patch["data"][0]["value"] = total_utilization_rate
+        gauge_patch["data"][0]["title"]["text"] = "Total Utilization Rate"
+        gauge_output = gauge_patch
+    else:
+        bar_figure_output = bar_fig
+        gauge_output = gauge_figure(total_utilization_rate)
+
+    # Extract Top 5 and Bottom 5 specialties
+    top_5_card = html.Div([html.H3("Top 5"), specialty_list(specialty_means.nlargest(5, "UtilizationRate"))])
+    bottom_5_card = html.Div([html.H3("Bottom 5"), specialty_list(specialty_means.nsmallest(5, "UtilizationRate"))])
+
+    return bar_figure_output, gauge_output, top_5_card, bottom_5_card, merged_df[TABLE_COLUMNS].to_dict("records"), True
+
+
+# Callback to list the specialties offered for the trend chart
+@callback(
+    Output("trend-specialty", "options"),
+    Input("shared-store-processed", "data"),
+    Input("site-filter", "value"),
+)
+def update_trend_specialty_options(processed_data, selected_site):
+    manifest = site_manifest(processed_data, selected_site)
+    if not manifest:
+        return []
+    return [{"label": specialty, "value": specialty} for specialty in manifest["specialties"]]
+
+
+# Callback for the trend chart; it spans every year, so the year and month filters don't apply
+@callback(
+    Output("utilization-trend", "figure"),
+    [
+        Input("shared-store-processed", "data"),
+        Input("trend-view", "value"),
+        Input("trend-specialty", "value"),
+        Input("site-filter", "value"),
+    ],
+    State("shared-store-files", "data"),
+)
+def update_trend_chart(processed_data, trend_view, selected_specialty, selected_site, shared_data):
+    versions = dashboard_versions(shared_data, processed_data, selected_site)
+    if versions is None:
+        return no_data_figure("line", "No data available.")
+
+    trends = monthly_trends(versions)
+    trend_view = trend_view or "yoy"
+    name = selected_specialty or "All Specialties"
+    if trend_view == "yoy":
+        trend_df = trends.year_over_year(by_specialty=bool(selected_specialty))
+    else:
+        trend_df = trends.rolling(int(trend_view.split("_")[1]), by_specialty=bool(selected_specialty))
+    if selected_specialty:
+        trend_df = trend_df[trend_df["Specialty"] == selected_specialty]
+    trend_df = trend_df.dropna(subset=["UtilizationRate"])
+    if trend_df.empty:
+        return no_data_figure("line", f"No {TREND_VIEWS[trend_view].lower()} utilization available for {name}.")
+
+    if trend_view == "yoy":
+        # One line per year over the calendar months, so each month lines up with the year before
+        trend_df = trend_df.assign(Year=trend_df["Year"].astype(str), MonthName=[MONTH_NAMES[month - 1] for month in trend_df["Month"]])
+        trend_fig = px.line(
+            trend_df,
+            x="MonthName",
+            y="UtilizationRate",
+            color="Year",
+            markers=True,
+            hover_data={"PriorYearRate": ":.2f", "YearOverYearChange": ":+.2f", "UtilizationRate": ":.2f"},
+            title=f"Year-over-Year Utilization Rate for {name}",
+            labels={
+                "UtilizationRate": "Utilization Rate (%)",
+                "MonthName": "Month",
+                "PriorYearRate": "Prior Year Rate (%)",
+                "YearOverYearChange": "Change (points)",
+            },
+            category_orders={"MonthName": MONTH_NAMES},
+        )
+    else:
+        trend_fig = px.line(
+            trend_df,
+            x="Period",
+            y="UtilizationRate",
+            markers=True,
+            hover_data={"TotalPatientInRoomHours": ":.1f", "TotalAvailableHours": ":.1f", "UtilizationRate": ":.2f"},
+            title=f"{TREND_VIEWS[trend_view]} Utilization Rate for {name}",
+            labels={
+                "UtilizationRate": "Utilization Rate (%)",
+                "Period": "Window Ending",
+                "TotalPatientInRoomHours": "Patient In Room Hours",
+                "TotalAvailableHours": "Available Hours",
+            },
+        )
+        trend_fig.update_xaxes(type="category")
+    return trend_fig
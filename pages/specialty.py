@@ -1,8 +1,15 @@
 import dash
-from dash import dcc, html, Input, Output, callback, dash_table
+from dash import dcc, html, Input, Output, State, callback, dash_table
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
+
+from utils.case_index import specialty_cases
+from utils.occupancy import occupancy_matrix
+from utils.reports import describe_period, describe_report, render_report
+from utils.sites import combine_weekdays, selected_sites, site_manifest, site_parts, site_versions
+from utils.sketch import filter_sketches
+from utils.specialty_charts import box_plot_figure, surgeon_table, weekday_figures
+from utils.store_codec import decode_frame
 
 dash.register_page(__name__, path="/specialty")
 
@@ -57,6 +64,25 @@ layout = html.Div(
             ]
         ),
 
+        # Report packet with every specialty's page for the selected year and months
+        html.Div(
+            [
+                html.Button(
+                    "Download Report Packet",
+                    id="report-packet-btn",
+                    className="btn btn-secondary",
+                ),
+                dcc.Download(id="download-report-packet"),
+                dcc.Loading(
+                    html.P(
+                        id="report-packet-status",
+                        style={"fontSize": "12px", "color": "grey", "marginTop": "10px"},
+                    ),
+                ),
+            ],
+            style={"marginBottom": "20px"},
+        ),
+
         # First bar chart for Utilization Rate
         html.Div(
             [
@@ -84,6 +110,15 @@ layout = html.Div(
             style={"marginTop": "20px"},
         ),
 
+        # Heatmap of rooms in use by hour and weekday
+        html.Div(
+            [
+                html.H3("Rooms in Use by Hour and Weekday", style={"textAlign": "center"}),
+                dcc.Graph(id="occupancy-heatmap"),
+            ],
+            style={"marginTop": "20px"},
+        ),
+
         # Table for Primary Surgeon details
         html.Div(
             [
@@ -94,7 +129,17 @@ layout = html.Div(
                         {"name": "Primary Surgeon", "id": "Primary Surgeon"},
                         {"name": "Total Cases", "id": "Total Cases"},
                         {"name": "Mean Patient Time (Minutes)", "id": "Mean Patient Time"},
+                        {"name": "Median (Minutes)", "id": "Median Patient Time"},
+                        {"name": "P90 (Minutes)", "id": "P90 Patient Time"},
+                        {"name": "P95 (Minutes)", "id": "P95 Patient Time"},
                     ],
+                    # Sorting and paging run on the server from the stored sketches
+                    page_action="custom",
+                    page_current=0,
+                    page_size=10,
+                    sort_action="custom",
+                    sort_mode="single",
+                    sort_by=[],
                     style_table={"overflowX": "auto", "margin": "0 auto"},
                     style_cell={"textAlign": "center", "padding": "10px"},
                     style_header={
@@ -105,9 +150,6 @@ layout = html.Div(
             ],
             style={"width": "80%", "display": "inline-block", "verticalAlign": "top"},
         ),
-
-        # Persistent store for processed data
-        dcc.Store(id="shared-store-processed"),
     ],
     style={"padding": "20px"},
 )
@@ -118,14 +160,13 @@ layout = html.Div(
     Output("specialty-filter", "options"),
     
     Input("shared-store-processed", "data"),
+    Input("site-filter", "value"),
 )
-def update_specialty_options(processed_data):
-    if not processed_data or "total" not in processed_data:
+def update_specialty_options(processed_data, selected_site):
+    manifest = site_manifest(processed_data, selected_site)
+    if not manifest:
         return []
-    df = pd.DataFrame(processed_data["total"])
-    specialties = df["Specialty"].dropna().unique()
-    return [{"label": specialty, "value": specialty} for specialty in sorted(specialties)]
-    
+    return [{"label": specialty, "value": specialty} for specialty in manifest["specialties"]]
 
 
 @callback(
@@ -133,254 +174,149 @@ def update_specialty_options(processed_data):
         Output("specialty-utilization-bar", "figure"),
         Output("bidirectional-bar-chart", "figure"),
         Output("patient-hours-box-plot", "figure"),
-        Output("surgeon-table", "data"),
     ],
     [
         Input("shared-store-files", "data"),
         Input("shared-store-processed", "data"),
         Input("specialty-filter", "value"),
+        Input("year-filter", "value"),
+        Input("month-filter", "value"),
+        Input("site-filter", "value"),
     ],
 )
 
-def update_charts(shared_data, processed_data, selected_specialty):
-    if not processed_data or "total" not in processed_data:
+def update_charts(shared_data, processed_data, selected_specialty, selected_year, selected_months, selected_site):
+    # Versions of each selected site's dataset and Available Time summary to query in the database
+    versions = site_versions(shared_data, processed_data, selected_site)
+    if not versions:
         return (
             px.bar(title="No data available."),
             px.bar(title="No data available."),
+            px.box(title="No data available."),
         )
+    # The selected specialty's slice of each site's case index, for the selected year and
+    # months, with one row per weekday: summed patient hours over summed available hours
+    selections = [
+        specialty_cases(dataset, selected_specialty, selected_year, selected_months)
+        for _, dataset in versions
+    ]
+    df = pd.concat([cases for cases, _ in selections], ignore_index=True)
+    weekday_df = combine_weekdays([weekday for _, weekday in selections])
 
-    # Convert processed data to DataFrame
-    df = pd.DataFrame(processed_data["total"])
-    dm_df = pd.DataFrame(shared_data["dm"])
-
-    # Process `dm_df` to ensure records are unique and transform to long format
-    dm_df = dm_df.groupby(["Services", "Month", "Year"], as_index=False).agg(
-        Monday=("Monday", "sum"),
-        Tuesday=("Tuesday", "sum"),
-        Wednesday=("Wednesday", "sum"),
-        Thursday=("Thursday", "sum"),
-        Friday=("Friday", "sum"),
-        Sum=("Sum", "sum"),
-    )
-
-    dm_df_long = pd.melt(
-        dm_df,
-        id_vars=["Services", "Month", "Year"],
-        value_vars=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
-        var_name="Weekday",
-        value_name="Total Hours",
-    ).dropna(subset=["Total Hours"])
-
-    dm_df_long["Weekday"] = pd.Categorical(
-        dm_df_long["Weekday"],
-        categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
-        ordered=True,
-    )
-
-    dm_df_long = dm_df_long.sort_values(by=["Services", "Year", "Month", "Weekday"]).reset_index(drop=True)
-
-    # Calculate Utilization Rate for the total dataset
-    # Use 0 if no hours are available
-    df["Total Hours"] = df["Total Hours"].fillna(0)  
-    df["UtilizationRate"] = (df["Total Patient In Room Minutes"] / 60) / df["Total Hours"] * 100
-    df["Weekday"] = pd.Categorical(
-        df["Case Start Day"],
-        categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
-        ordered=True,
-    )
-    # Add metrics annotations for each box (mean/median values)
-    df["Month-Year"] = df["Month"].astype(str) + "-" + df["Year"].astype(str)  # Combine Month-Year
-
-    # Perform right join between `df` and `dm_df_long`
-    bar_df = pd.merge(
-        dm_df_long,
-        df,
-        how="left",
-        left_on=["Services", "Weekday", "Month", "Year"],
-        right_on=["Specialty", "Weekday", "Month", "Year"],
-    )
-
-    # Filter by Specialty if selected
-    if selected_specialty:
-        df = df[df["Specialty"] == selected_specialty]
-        dm_df_long = dm_df_long[dm_df_long["Services"] == selected_specialty]
-        bar_df = bar_df[bar_df["Services"] == selected_specialty]
-
-    # Group left data by Weekday and Specialty
-    left_df = df.groupby(["Specialty", "Month", "Year", "Case Start Day"], as_index=False).agg(
-        TotalPatientInRoomHours=("Total Patient In Room Minutes", lambda x: x.sum() / 60)
-    )
-
-    # Group Specialty data (dm_df_long) by Weekday and Services
-    right_df = dm_df_long.groupby(["Services", "Month", "Year", "Weekday"], as_index=False).agg(
-        TotalAvailableHours=("Total Hours", "sum")
-    )
-
-    # Ensure Weekday is sorted correctly
-    left_df["Weekday"] = pd.Categorical(
-        left_df["Case Start Day"], categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"], ordered=True
-    )
-    right_df["Weekday"] = pd.Categorical(
-        right_df["Weekday"], categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"], ordered=True
-    )
-
-    # Merge data for alignment
-    merged_data = pd.merge(
-        right_df,
-        left_df,
-        left_on=["Services", "Month", "Year", "Weekday"],
-        right_on=["Specialty", "Month", "Year", "Case Start Day"],
-        how="left"
-    ).fillna(0)
-
-    # Rename columns for clarity
-    merged_data = merged_data.rename(
-        columns={
-            "TotalPatientInRoomHours": "Left_TotalPatientInRoomHours",
-            "TotalAvailableHours": "Right_TotalAvailableHours",
-        }
-    )
+    utilization_bar_fig, bidirectional_fig = weekday_figures(weekday_df, selected_specialty)
+    box_plot = box_plot_figure(df, selected_specialty)
 
-    # Create the bidirectional bar chart
-    bidirectional_fig = go.Figure()
+    return utilization_bar_fig, bidirectional_fig, box_plot
 
-    # Add left bar
-    bidirectional_fig.add_trace(
-        go.Bar(
-            y=merged_data["Weekday_x"],
-            x=-merged_data["Left_TotalPatientInRoomHours"],
-            name="Total Patient In Room Hours",
-            orientation="h",
-            marker=dict(color="lightblue"),
-        )
-    )
 
-    # Add right bar
-    bidirectional_fig.add_trace(
-        go.Bar(
-            y=merged_data["Weekday_x"],
-            x=merged_data["Right_TotalAvailableHours"],  # Negative values for right-side alignment
-            name="Total Available Hours",
-            orientation="h",
-            marker=dict(color="lightgreen"),
-        )
+# Callback to slice the precomputed occupancy cube for the heatmap
+@callback(
+    Output("occupancy-heatmap", "figure"),
+    [
+        Input("shared-store-processed", "data"),
+        Input("specialty-filter", "value"),
+        Input("year-filter", "value"),
+        Input("month-filter", "value"),
+        Input("site-filter", "value"),
+    ],
+)
+def update_occupancy_heatmap(processed_data, selected_specialty, selected_year, selected_months, selected_site):
+    # Occupied minutes add up over sites, so the sites' cubes are stacked
+    parts = [site_parts(processed_data)[site] for site in selected_sites(processed_data, selected_site)]
+    if not parts or any("occupancy" not in part for part in parts):
+        return px.imshow([[0]], title="No occupancy data available. Please process the data again.")
+
+    cube = pd.concat([decode_frame(part["occupancy"]) for part in parts], ignore_index=True)
+    rooms = occupancy_matrix(
+        cube,
+        years=[int(selected_year)] if selected_year else None,
+        months=list(map(int, selected_months)) if selected_months else None,
+        specialty=selected_specialty,
     )
 
-    # Update layout for bidirectional bar chart
-    bidirectional_fig.update_layout(
-        title="Bidirectional Bar Chart: Total Patient In Room Hours vs. Total Available Hours",
-        yaxis=dict(
-            title="Weekday",
-            categoryorder="array",  # Order by a custom array
-            categoryarray=["Friday" , "Thursday", "Wednesday", "Tuesday", "Monday"],  # Explicit ordering
-        ),
-        xaxis=dict(
-            title="Hours",
-            tickmode="array",
-            tickvals=[
-                -max(merged_data["Left_TotalPatientInRoomHours"]),
-                0,
-                max(merged_data["Right_TotalAvailableHours"]),
-            ],
-            ticktext=[
-                f"{max(merged_data['Left_TotalPatientInRoomHours']):,.0f} (Patient)",
-                "0",
-                f"{max(merged_data['Right_TotalAvailableHours']):,.0f} (Available)",
-            ],
-        ),
-        barmode="relative",
-        bargap=0.1,
-        legend=dict(title="Metric"),
+    heatmap = px.imshow(
+        rooms,
+        aspect="auto",
+        color_continuous_scale="Blues",
+        labels={"x": "Hour of Day", "y": "Weekday", "color": "Rooms in Use"},
+        title=f"Average Rooms in Use for {selected_specialty if selected_specialty else 'All Specialties'}",
     )
+    heatmap.update_xaxes(tickmode="linear", dtick=1)
+    return heatmap
 
-    # Create the first bar chart for Utilization Rate
-    hover_data = {
-        "Weekday": True,
-        "TotalPtHours": ":.2f",
-        "Total Hours_x": ":.2f",
-        "UtilizationRate": ":.2f",
-    }
-    
-    bar_df = bar_df.sort_values("Weekday")
 
-    utilization_bar_fig = px.bar(
-        bar_df,
-        x="Weekday",
-        y="UtilizationRate",
-        color="Weekday",
-        hover_data=hover_data,
-        title=f"Utilization Rate by Weekday for {selected_specialty if selected_specialty else 'All Specialties'}",
-        labels={"UtilizationRate": "Utilization Rate (%)"},
-    )
-
-    utilization_bar_fig.update_layout(
-        xaxis=dict(
-        categoryorder="array",
-        categoryarray=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-        ),
-        xaxis_title="Weekday",
-        yaxis_title="Utilization Rate (%)",
-        legend_title="Day",
-        showlegend=False,
+# Callback to build one page of the surgeon table from the stored sketches
+@callback(
+    [
+        Output("surgeon-table", "data"),
+        Output("surgeon-table", "page_count"),
+    ],
+    [
+        Input("shared-store-processed", "data"),
+        Input("specialty-filter", "value"),
+        Input("year-filter", "value"),
+        Input("month-filter", "value"),
+        Input("surgeon-table", "page_current"),
+        Input("surgeon-table", "page_size"),
+        Input("surgeon-table", "sort_by"),
+        Input("site-filter", "value"),
+    ],
+)
+def update_surgeon_table(
+    processed_data, selected_specialty, selected_year, selected_months, page_current, page_size, sort_by, selected_site
+):
+    # Sketches merge, so a surgeon operating at several sites gets one row from every site's sketches
+    parts = [site_parts(processed_data)[site] for site in selected_sites(processed_data, selected_site)]
+    if not parts or any("surgeon_sketches" not in part for part in parts):
+        return [], 0
+
+    sketches = filter_sketches(
+        pd.concat([decode_frame(part["surgeon_sketches"]) for part in parts], ignore_index=True),
+        years=[int(selected_year)] if selected_year else None,
+        months=list(map(int, selected_months)) if selected_months else None,
+        specialty=selected_specialty,
     )
+    if sketches.empty:
+        return [], 0
 
-    # Create the box plot
-    box_plot = px.box(
-        df,
-        x="Specialty",
-        y="Total Patient In Room Minutes",
-        points="all",
-        color="Month-Year",
-        title=f"Distribution of Patient In Room Hours for {selected_specialty if selected_specialty else 'All Specialties'}",
-        labels={"Total Patient In Room Minutes": "Patient In Room Hours (Minutes)"},
-    )
-    
-    for specialty in df["Specialty"].unique():
-        specialty_data = df[df["Specialty"] == specialty]["Total Patient In Room Minutes"]
-        median = specialty_data.median()
-        mean = specialty_data.mean()
+    surgeon_stats = surgeon_table(sketches)
 
-        # Add annotation for median
-        box_plot.add_trace(
-            go.Scatter(
-                x=[specialty], 
-                y=[median],
-                mode="markers+text",
-                text=[f"Median: {median:.2f}"],
-                textposition="top center",
-                marker=dict(color="black", size=10, symbol="diamond"),
-                showlegend=False,
-            )
+    if sort_by:
+        surgeon_stats = surgeon_stats.sort_values(
+            sort_by[0]["column_id"], ascending=sort_by[0]["direction"] == "asc", kind="stable"
         )
 
-        # Add annotation for mean
-        box_plot.add_trace(
-            go.Scatter(
-                x=[specialty], 
-                y=[mean],
-                mode="markers+text",
-                text=[f"Mean: {mean:.2f}"],
-                textposition="bottom center",
-                marker=dict(color="blue", size=8, symbol="circle"),
-                showlegend=False,
-            )
-        )
+    page_size = page_size or 10
+    page = surgeon_stats.iloc[page_current * page_size:(page_current + 1) * page_size].round(1)
+    page_count = -(-len(surgeon_stats) // page_size)
+    return page.to_dict("records"), page_count
 
-    box_plot.update_layout(
-        yaxis_title="Patient In Room Minutes",
-        xaxis_title="Specialty",
-        yaxis=dict(tickformat=".0f"),
-    )
 
-    # Create the table for Primary Surgeons
-    surgeon_stats = (
-        df.groupby("Primary Surgeon", as_index=False)
-        .agg(
-            Total_Cases=("Case Start Day", "count"),
-            Mean_Patient_Time=("Total Patient In Room Minutes", "mean"),
-        )
-        .rename(columns={"Total_Cases": "Total Cases", "Mean_Patient_Time": "Mean Patient Time"})
+# Callback to render every specialty's page into one printable packet
+@callback(
+    [
+        Output("download-report-packet", "data"),
+        Output("report-packet-status", "children"),
+    ],
+    Input("report-packet-btn", "n_clicks"),
+    [
+        State("shared-store-files", "data"),
+        State("shared-store-processed", "data"),
+        State("year-filter", "value"),
+        State("month-filter", "value"),
+        State("site-filter", "value"),
+    ],
+    prevent_initial_call=True,
+)
+def download_report_packet(n_clicks, shared_data, processed_data, selected_year, selected_months, selected_site):
+    versions = site_versions(shared_data, processed_data, selected_site)
+    if not versions:
+        return None, "No processed data available. Please process the data first."
+    if len(versions) > 1:
+        return None, "Report packets cover one site. Please select a site first."
+    site, (version, capacity_version, _) = versions[0]
+    document, report = render_report(
+        version, capacity_version, site_parts(processed_data)[site], selected_year, selected_months
     )
-    surgeon_table_data = surgeon_stats.to_dict("records")
-
-    return utilization_bar_fig, bidirectional_fig, box_plot, surgeon_table_data
\ No newline at end of file
+    filename = f"specialty_report_{describe_period(selected_year, selected_months).replace(', ', '_').replace(' ', '_')}.html"
+    return dcc.send_bytes(document, filename), describe_report(report)
@@ -0,0 +1,290 @@
+import dash
+from dash import dcc, html, Input, Output, callback, dash_table
+import pandas as pd
+import plotly.express as px
+
+from utils import warehouse
+from utils.cache import LRUCache
+from utils.capacity import CapacityCalendar
+from utils.components import month_options
+from utils.processed import dataset_versions, load_total
+from utils.sites import selected_sites, site_parts
+from utils.turnover import room_column, turnover_analysis, summarize_turnover, format_clock
+from utils.utilization import WEEKDAYS
+
+dash.register_page(__name__, path="/turnover")
+
+# Case columns the turnover analysis and its filters read, besides the room column
+TURNOVER_COLUMNS = ["Patient In Room Date/Time", "Total Patient In Room Minutes", "Specialty", "Year", "Month"]
+
+# Per-dataset turnover inputs (cases and block calendars) shared across filter changes
+_cache = LRUCache(maxsize=16)
+
+card_style = {
+    "backgroundColor": "#f9f9f9",
+    "padding": "20px",
+    "borderRadius": "10px",
+    "width": "22%",
+    "textAlign": "center",
+}
+
+# Layout for the Room Turnover Page
+layout = html.Div(
+    [
+        html.H1("Room Turnover", style={"textAlign": "center"}),
+        html.P(id="turnover-room-note", style={"textAlign": "center", "color": "grey"}),
+
+        # Year, Month and Specialty filters (shared ids with the other dashboards)
+        html.Div(
+            [
+                html.Label("Select Year:"),
+                dcc.Dropdown(
+                    id="year-filter",
+                    options=[],  # Placeholder; will update dynamically
+                    placeholder="Select Year",
+                    style={"width": "50%", "marginBottom": "10px"},
+                ),
+                html.Label("Select Month(s):"),
+                dcc.Checklist(
+                    id="month-filter",
+                    options=month_options(),
+                    inline=True,
+                    style={"marginBottom": "20px"},
+                ),
+                html.Label("Select Specialty:"),
+                dcc.Dropdown(
+                    id="specialty-filter",
+                    options=[],  # Placeholder; options will be dynamically updated
+                    placeholder="Select Specialty",
+                    style={"width": "50%", "marginBottom": "20px"},
+                ),
+            ],
+        ),
+
+        # Cards: first-case start, turnover, idle time, overlaps
+        html.Div(
+            [
+                html.Div(id="turnover-first-case-card", style=card_style),
+                html.Div(id="turnover-mean-card", style=card_style),
+                html.Div(id="turnover-idle-card", style=card_style),
+                html.Div(id="turnover-overlap-card", style=card_style),
+            ],
+            style={"display": "flex", "justifyContent": "space-around", "marginTop": "20px"},
+        ),
+
+        # Turnover and idle time by room
+        html.Div(
+            [
+                html.H3("Turnover and Idle Time by Room", style={"textAlign": "center"}),
+                dcc.Graph(id="turnover-room-bar"),
+            ],
+            style={"marginTop": "20px"},
+        ),
+
+        # First-case start by weekday
+        html.Div(
+            [
+                html.H3("First-Case Start by Weekday", style={"textAlign": "center"}),
+                dcc.Graph(id="turnover-first-case-box"),
+            ],
+            style={"marginTop": "20px"},
+        ),
+
+        # Room summary table
+        html.Div(
+            [
+                html.H3("Room Summary", style={"textAlign": "center"}),
+                dash_table.DataTable(
+                    id="turnover-room-table",
+                    page_size=15,
+                    sort_action="native",
+                    style_table={"overflowX": "auto"},
+                    style_cell={"textAlign": "center", "padding": "10px"},
+                    style_header={"backgroundColor": "rgb(230, 230, 230)", "fontWeight": "bold"},
+                ),
+            ],
+            style={"marginTop": "20px"},
+        ),
+    ],
+    style={"padding": "20px"},
+)
+
+
+def card(title, value, detail=""):
+    return [html.H4(title), html.H2(value), html.P(detail, style={"color": "grey"})]
+
+
+def turnover_cases(shared_data, processed_data, versions):
+    # Only the columns the analysis reads, with start times parsed once; specialty
+    # overrides patch cases in place, so the revision is part of the key
+    version, _, revision = versions
+
+    def compute():
+        df = load_total(shared_data, processed_data)
+        if df is None:
+            return None
+        room = room_column(df)
+        df = df[TURNOVER_COLUMNS + ([room] if room not in TURNOVER_COLUMNS else [])]
+        return df.assign(**{"Patient In Room Date/Time": pd.to_datetime(df["Patient In Room Date/Time"], errors="coerce")})
+
+    return _cache.get_or_compute(("cases", version, revision), compute)
+
+
+def block_calendar(capacity_version):
+    # The Available Time summary saved with the dataset; the upload may be gone (or restored without it)
+    if not warehouse.has_capacity(capacity_version):
+        return None
+    return _cache.get_or_compute(
+        ("capacity", capacity_version),
+        lambda: CapacityCalendar.from_available_time(warehouse.query_available_time(capacity_version)),
+    )
+
+
+def site_room_days(shared_data, processed_data, selected_year, selected_months, selected_specialty):
+    """One site's room-day rows for the selected filters, the column rooms were taken from and
+    whether block capacity was available for them."""
+    versions = dataset_versions(shared_data, processed_data)
+    df = turnover_cases(shared_data, processed_data, versions) if versions else None
+    if df is None:
+        return None
+
+    # Filter cases by the selected year, months and specialty
+    if selected_year:
+        df = df[df["Year"] == int(selected_year)]
+    if selected_months:
+        df = df[df["Month"].isin(list(map(int, selected_months)))]
+    if selected_specialty:
+        df = df[df["Specialty"] == selected_specialty]
+
+    room = room_column(df)
+
+    # Block capacity lets specialty-level rooms report unused block time
+    capacity = block_calendar(versions[1]) if room == "Specialty" else None
+    return room, turnover_analysis(df, room=room, capacity=capacity), room != "Specialty" or capacity is not None
+
+
+@callback(
+    [
+        Output("turnover-room-note", "children"),
+        Output("turnover-first-case-card", "children"),
+        Output("turnover-mean-card", "children"),
+        Output("turnover-idle-card", "children"),
+        Output("turnover-overlap-card", "children"),
+        Output("turnover-room-bar", "figure"),
+        Output("turnover-first-case-box", "figure"),
+        Output("turnover-room-table", "data"),
+        Output("turnover-room-table", "columns"),
+    ],
+    [
+        Input("shared-store-files", "data"),
+        Input("shared-store-processed", "data"),
+        Input("year-filter", "value"),
+        Input("month-filter", "value"),
+        Input("specialty-filter", "value"),
+        Input("site-filter", "value"),
+    ],
+)
+def update_turnover(shared_data, processed_data, selected_year, selected_months, selected_specialty, selected_site):
+    # Room-days are analysed per site, since rooms and block capacity belong to one site
+    files, parts = site_parts(shared_data), site_parts(processed_data)
+    results = {
+        site: site_room_days(files.get(site), parts[site], selected_year, selected_months, selected_specialty)
+        for site in selected_sites(processed_data, selected_site)
+    }
+    results = {site: result for site, result in results.items() if result is not None}
+    if not results:
+        empty = card("No data available.", "-")
+        return (
+            "",
+            empty, empty, empty, empty,
+            px.bar(title="No data available."),
+            px.box(title="No data available."),
+            [],
+            [],
+        )
+
+    room_columns = sorted({room for room, _, _ in results.values() if room != "Specialty"})
+    if not room_columns:
+        note = "The case export has no room column, so each specialty's block is treated as one room."
+    else:
+        names = " and ".join(f"'{room}'" for room in room_columns)
+        note = f"Rooms are taken from the {names} column."
+        if len(room_columns) < len({room for room, _, _ in results.values()}):
+            note += " Sites without a room column treat each specialty's block as one room."
+    without_capacity = [site for site, (_, _, has_capacity) in results.items() if not has_capacity]
+    if without_capacity:
+        sites = f" for {', '.join(without_capacity)}" if len(results) > 1 else ""
+        note += f" No Available Time summary is saved{sites}, so unused block time isn't shown."
+
+    # Rooms of different sites are told apart by their site
+    if len(results) > 1:
+        room_days = pd.concat(
+            [days.assign(Room=site + " / " + days["Room"].astype(str)) for site, (_, days, _) in results.items()],
+            ignore_index=True,
+        )
+    else:
+        room_days = next(iter(results.values()))[1]
+    if room_days.empty:
+        empty = card("No data available.", "-")
+        return (
+            note,
+            empty, empty, empty, empty,
+            px.bar(title="No data available for the selected filters."),
+            px.box(title="No data available for the selected filters."),
+            [],
+            [],
+        )
+
+    turnovers = room_days["Turnovers"].sum()
+    mean_turnover = room_days["TurnoverMinutes"].sum() / turnovers if turnovers else float("nan")
+    idle_hours = room_days["IdleMinutes"].sum() / 60
+    idle_detail = f"{len(room_days):,} room-days"
+    if "UnusedBlockMinutes" in room_days:
+        idle_detail = f"{room_days['UnusedBlockMinutes'].sum() / 60:,.0f} h of block time unused"
+
+    first_case_card = card(
+        "Median First-Case Start", format_clock(room_days["FirstCaseStart"].median()), f"{len(room_days):,} room-days"
+    )
+    mean_card = card(
+        "Mean Turnover", "-" if turnovers == 0 else f"{mean_turnover:.0f} min", f"{turnovers:,} turnovers"
+    )
+    idle_card = card("Idle Time Between Cases", f"{idle_hours:,.0f} h", idle_detail)
+    overlap_card = card(
+        "Overlapping Cases", f"{room_days['OverlappingCases'].sum():,}", f"{room_days['OverlapMinutes'].sum():,} min overlap"
+    )
+
+    # Per-room summary chart and table
+    summary = summarize_turnover(room_days).sort_values("IdleHours", ascending=False)
+    room_bar = px.bar(
+        summary,
+        x="Room",
+        y=["MeanTurnoverMinutes", "IdleHours"],
+        barmode="group",
+        title="Mean Turnover (minutes) and Idle Time (hours) by Room",
+        labels={"value": "Minutes / Hours", "variable": "Metric"},
+    )
+
+    room_days["Weekday"] = room_days["Date"].dt.day_name()
+    room_days["FirstCaseHour"] = room_days["FirstCaseStart"] / 60
+    first_case_box = px.box(
+        room_days[room_days["Weekday"].isin(WEEKDAYS)],
+        x="Weekday",
+        y="FirstCaseHour",
+        category_orders={"Weekday": WEEKDAYS},
+        title="First-Case Start Time by Weekday",
+        labels={"FirstCaseHour": "Hour of Day"},
+    )
+
+    summary["MedianFirstCaseStart"] = summary["MedianFirstCaseStart"].map(format_clock)
+    columns = [{"name": col, "id": col} for col in summary.columns]
+    return (
+        note,
+        first_case_card,
+        mean_card,
+        idle_card,
+        overlap_card,
+        room_bar,
+        first_case_box,
+        summary.to_dict("records"),
+        columns,
+    )
@@ -1,8 +1,9 @@
 import dash
 from dash import dcc, html, Input, Output, State, callback
-import pandas as pd
-import io
-import base64
+
+from utils.ingest import EXTRA_SUFFIX, content_hash, parse_uploads
+from utils.settings import DEFAULT_SITE
+from utils.sites import site_parts, with_site
 
 dash.register_page(__name__, path="/upload_data")
 
@@ -14,6 +15,23 @@ layout = html.Div(
         # Upload sections
         html.Div(
             [
+                # Site the files belong to; every site keeps its own set of uploads
+                html.Div(
+                    [
+                        html.Label("Site:", style={"marginRight": "10px"}),
+                        dcc.Input(id="upload-site", type="text", value=DEFAULT_SITE, placeholder=DEFAULT_SITE, debounce=True),
+                    ],
+                    style={"marginBottom": "10px"},
+                ),
+
+                # Only the columns processing uses are read unless the others are asked for
+                dcc.Checklist(
+                    id="upload-keep-extra",
+                    options=[{"label": " Keep the other columns of uploaded files for View Data", "value": "keep"}],
+                    value=[],
+                    style={"marginBottom": "20px"},
+                ),
+
                 # Elective Cases Upload
                 html.Div(
                     [
@@ -21,6 +39,7 @@ layout = html.Div(
                         dcc.Upload(
                             id="upload-nu",
                             children=html.Button("Click to Upload Elective Cases", className="btn btn-primary"),
+                            multiple=True,  # Several files are combined into one dataset
                             style={"border": "1px dashed #ccc", "padding": "20px"},
                         ),
                         html.Div(id="upload-nu-status", style={"marginTop": "10px", "color": "green"}),  # Message area
@@ -41,6 +60,7 @@ layout = html.Div(
                         dcc.Upload(
                             id="upload-sg",
                             children=html.Button("Click to Upload Surgeon Roster", className="btn btn-primary"),
+                            multiple=True,  # Several files are combined into one dataset
                             style={"border": "1px dashed #ccc", "padding": "20px"},
                         ),
                         html.Div(id="upload-sg-status", style={"marginTop": "10px", "color": "green"}),  # Message area
@@ -61,6 +81,7 @@ layout = html.Div(
                         dcc.Upload(
                             id="upload-dm",
                             children=html.Button("Click to Upload Available Time", className="btn btn-primary"),
+                            multiple=True,  # Several files are combined into one dataset
                             style={"border": "1px dashed #ccc", "padding": "20px"},
                         ),
                         html.Div(id="upload-dm-status", style={"marginTop": "10px", "color": "green"}),  # Message area
@@ -98,41 +119,83 @@ layout = html.Div(
         State("upload-nu", "filename"),
         State("upload-sg", "filename"),
         State("upload-dm", "filename"),
+        State("upload-site", "value"),
+        State("upload-keep-extra", "value"),
         State("shared-store-files", "data"),
     ],
     prevent_initial_call=True,
 )
-def handle_file_upload(upload_nu, upload_sg, upload_dm, filename_nu, filename_sg, filename_dm, shared_data):
-    shared_data = shared_data or {}
-    nu_status = sg_status = dm_status = None
+def handle_file_upload(upload_nu, upload_sg, upload_dm, filename_nu, filename_sg, filename_dm, site, keep_extra, shared_files):
+    site = (site or "").strip() or DEFAULT_SITE
+    shared_data = dict(site_parts(shared_files).get(site, {}))
+    versions = dict(shared_data.get("versions", {}))
+    extra_kept = set(shared_data.get("extra_columns", []))
+    keep_extra = "keep" in (keep_extra or [])
+    uploads = {
+        "nu": (upload_nu, filename_nu),
+        "sg": (upload_sg, filename_sg),
+        "dm": (upload_dm, filename_dm),
+    }
+    statuses = {key: dash.no_update for key in uploads}
+
+    # Only look at the uploads that fired, and skip files whose content is unchanged
+    triggered = {prop_id.split(".")[0].replace("upload-", "") for prop_id in dash.callback_context.triggered_prop_ids}
+    jobs = {}
+    for key in triggered:
+        contents, filenames = uploads[key]
+        if not contents:
+            continue
+        if versions.get(key) == content_hash(contents) and (key in extra_kept) == keep_extra:
+            statuses[key] = f"{describe_files(filenames)} unchanged; keeping the data already uploaded."
+        else:
+            jobs[key] = contents
+
+    if not jobs:
+        return statuses["nu"], statuses["sg"], statuses["dm"], dash.no_update
+
+    updated = False
+    for key, result in parse_uploads(jobs, keep_extra).items():
+        statuses[key] = upload_report(uploads[key][1], result, site)
+        if result["datasets"] is None:
+            continue
+        # Side columns of the previous upload no longer line up with the new rows
+        for dataset_key in [dataset_key for dataset_key in shared_data if dataset_key.endswith(EXTRA_SUFFIX)]:
+            if dataset_key[: -len(EXTRA_SUFFIX)] in result["datasets"]:
+                del shared_data[dataset_key]
+        shared_data.update(result["datasets"])
+        versions[key] = content_hash(jobs[key])
+        if keep_extra:
+            extra_kept.add(key)
+        else:
+            extra_kept.discard(key)
+        updated = True
 
-    # Handle Elective Cases upload
-    if upload_nu:
-        shared_data["nu"] = process_upload(upload_nu)
-        nu_status = f"File '{filename_nu}' uploaded successfully!"
+    if not updated:
+        return statuses["nu"], statuses["sg"], statuses["dm"], dash.no_update
 
-    # Handle Surgeon Roster upload
-    if upload_sg:
-        shared_data["sg"] = process_upload(upload_sg)
-        sg_status = f"File '{filename_sg}' uploaded successfully!"
+    shared_data["versions"] = versions
+    shared_data["extra_columns"] = sorted(extra_kept)
+    return statuses["nu"], statuses["sg"], statuses["dm"], with_site(shared_files, site, shared_data)
 
-    # Handle Available Time upload
-    if upload_dm:
-        shared_data["dm"] = process_upload_xlsm(upload_dm, sheet_name="Summary by Each Month")
-        shared_data["dic"] = process_upload_xlsm(upload_dm, sheet_name="Dictionary")
-        dm_status = f"File '{filename_dm}' uploaded successfully!"
 
-    return nu_status, sg_status, dm_status, shared_data
+def describe_files(filenames):
+    if len(filenames) == 1:
+        return f"File '{filenames[0]}'"
+    return f"{len(filenames)} files"
 
 
-# Helper function to process uploads
-def process_upload(contents):
-    content_type, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
-    return pd.read_excel(io.BytesIO(decoded)).to_dict("records")
+# Per-file row counts and parse times for the status message
+def upload_report(filenames, result, site):
+    items = []
+    for filename, report in zip(filenames, result["files"]):
+        if "error" in report:
+            items.append(html.Li(f"{filename}: error reading file: {report['error']}", style={"color": "red"}))
+        else:
+            items.append(html.Li(f"{filename}: {report['rows']:,} rows in {report['seconds']:.2f}s"))
 
+    if result["datasets"] is None:
+        summary = f"{describe_files(filenames)} could not be uploaded; the previous data was kept."
+    else:
+        summary = f"{describe_files(filenames)} uploaded successfully for {site}! {result['rows']:,} rows after combining."
 
-def process_upload_xlsm(contents, sheet_name):
-    content_type, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
-    return pd.read_excel(io.BytesIO(decoded), sheet_name=sheet_name).to_dict("records")
+    return html.Div([html.Span(summary), html.Ul(items, style={"marginBottom": "0"})])
@@ -1,6 +1,11 @@
 import dash
 from dash import dcc, html, Input, Output, State, callback
 import dash_ag_grid as dag
+import pandas as pd
+
+from utils.ingest import EXTRA_SUFFIX
+from utils.sites import selected_sites, site_parts
+from utils.store_codec import decode_frame
 
 dash.register_page(__name__, path="/view_data")
 
@@ -36,23 +41,38 @@ layout = html.Div(
 
 @callback(
     Output("dataset-display", "children"),
-    [Input("dataset-dropdown", "value")],
+    [Input("dataset-dropdown", "value"), Input("site-filter", "value")],
     [State("shared-store-files", "data")],
 )
 
-def display_dataset(selected_dataset, shared_data):
-    if not shared_data or selected_dataset not in shared_data:
+def display_dataset(selected_dataset, selected_site, shared_files):
+    parts = site_parts(shared_files)
+    sites = [site for site in selected_sites(shared_files, selected_site) if selected_dataset in parts[site]]
+    if not sites:
         return html.Div("Data not uploaded.", style={"color": "red", "fontStyle": "italic", "textAlign": "center"})
 
-    dataset = shared_data[selected_dataset]
+    frames = []
+    for site in sites:
+        shared_data = parts[site]
+        frame = decode_frame(shared_data[selected_dataset])
+
+        # Columns processing doesn't use are only stored when the upload asked to keep them
+        if selected_dataset + EXTRA_SUFFIX in shared_data:
+            frame = pd.concat([frame, decode_frame(shared_data[selected_dataset + EXTRA_SUFFIX])], axis=1)
+        frames.append(frame)
+
+    # Every site's rows, marked with their site, when viewing all sites
+    if len(sites) > 1:
+        frames = [frame.assign(Site=site)[["Site"] + list(frame.columns)] for site, frame in zip(sites, frames)]
+    dataset = pd.concat(frames, ignore_index=True)
 
     # Calculate number of records and columns
     num_records = len(dataset)
-    num_columns = len(dataset[0].keys()) if dataset else 0
+    num_columns = len(dataset.columns)
 
     # Define the columns dynamically based on the dataset
     columnDefs = [
-        {"headerName": col, "field": col} for col in dataset[0].keys()
+        {"headerName": col, "field": col} for col in dataset.columns
     ]
 
     return html.Div(
@@ -64,7 +84,7 @@ def display_dataset(selected_dataset, shared_data):
             ),
             dag.AgGrid(
                 id="data-table",
-                rowData=dataset,  # Provide the dataset as rowData
+                rowData=dataset.to_dict("records"),  # Provide the dataset as rowData
                 columnDefs=columnDefs,  # Use column definitions
                 columnSize=None,  # Automatically adjust column sizes
                 defaultColDef={"sortable": True, "filter": True, "resizable": True},
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Settings are read on import, so the test database is set before any utils module loads
+os.environ.setdefault("BLOCKTIME_DATABASE", os.path.join(tempfile.mkdtemp(), "blocktime-test.sqlite3"))
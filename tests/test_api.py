@@ -0,0 +1,84 @@
+import pytest
+from flask import Flask
+
+from utils import api
+from utils.pipeline import prepare_lookups, run_processing
+from utils.sketch import sketch_stats
+from utils.store_codec import decode_frame
+from utils.synthetic import synthetic_datasets
+
+SITE = "API"
+SOURCE_VERSIONS = {"nu": "api-nu", "sg": "api-sg", "dm": "api-dm"}
+
+
+@pytest.fixture(scope="module")
+def processed():
+    datasets = synthetic_datasets(3000, years=(2024,), seed=5)
+    lookups = prepare_lookups(datasets["sg"].copy(), datasets["dm"], datasets["dic"])
+    processed_data, _, _ = run_processing(datasets["nu"], lookups, SOURCE_VERSIONS, SOURCE_VERSIONS["dm"], workers=1, site=SITE)
+    return processed_data
+
+
+@pytest.fixture(scope="module")
+def client(processed):
+    server = Flask(__name__)
+    api.init_app(server)
+    return server.test_client()
+
+
+def get(client, endpoint, **args):
+    return client.get(f"{api.API_PREFIX}/{endpoint}", query_string=dict(args, site=SITE))
+
+
+def test_pages_cover_every_record_once(client, processed):
+    expected = sketch_stats(decode_frame(processed["surgeon_sketches"]), ["Specialty", "Primary Surgeon"])
+    first = get(client, "surgeons", page_size=7).get_json()
+    assert first["total"] == len(expected)
+    assert first["pages"] == -(-len(expected) // 7)
+
+    records = []
+    for page in range(1, first["pages"] + 1):
+        body = get(client, "surgeons", page_size=7, page=page).get_json()
+        assert body["page"] == page
+        assert len(body["data"]) == (7 if page < first["pages"] else len(expected) - 7 * (first["pages"] - 1))
+        records += body["data"]
+
+    assert len({(record["Specialty"], record["Primary Surgeon"]) for record in records}) == len(expected)
+    assert [record["Cases"] for record in records] == sorted(expected["Cases"], reverse=True)
+    assert get(client, "surgeons", page_size=7, page=first["pages"] + 1).get_json()["data"] == []
+
+
+def test_repeated_queries_are_cached_across_pages(client):
+    assert get(client, "utilization", grain="quarter").headers["X-Response-Cache"] == "miss"
+    assert get(client, "utilization", grain="quarter", page=2, page_size=3).headers["X-Response-Cache"] == "hit"
+    assert get(client, "utilization", grain="quarter", months="1,2").headers["X-Response-Cache"] == "miss"
+    # The same months repeated or comma-separated are one query
+    assert get(client, "utilization", grain="quarter", months=["2", "1"]).headers["X-Response-Cache"] == "hit"
+
+
+def test_cached_and_computed_pages_agree(client):
+    computed = get(client, "weekday", by_specialty="true", year=2024, page_size=5, page=2)
+    cached = get(client, "weekday", by_specialty="true", year=2024, page_size=5, page=2)
+    assert (computed.headers["X-Response-Cache"], cached.headers["X-Response-Cache"]) == ("miss", "hit")
+    assert cached.get_json() == computed.get_json()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"page": 0},
+        {"page_size": api.API_MAX_PAGE_SIZE + 1},
+        {"page": "two"},
+        {"months": "13"},
+        {"grain": "week"},
+    ],
+)
+def test_invalid_paging_and_filters_are_rejected(client, args):
+    response = get(client, "utilization", **args)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_unknown_dataset_is_not_found(client):
+    assert client.get(f"{api.API_PREFIX}/surgeons", query_string={"version": "missing"}).status_code == 404
+    assert client.get(f"{api.API_PREFIX}/nothing").status_code == 404
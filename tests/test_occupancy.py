@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.occupancy import OCCUPANCY_COLUMNS, occupancy_cube, occupancy_matrix
+from utils.synthetic import synthetic_datasets
+
+
+@pytest.fixture(scope="module")
+def cases():
+    nu = synthetic_datasets(400, years=(2024,), seed=1)["nu"]
+    starts = pd.to_datetime(nu["Patient In Room Date/Time"], format="%m/%d/%y %H:%M")
+    return nu.rename(columns={"Surgical Specialty": "Specialty"}).assign(**{"Patient In Room Date/Time": starts})
+
+
+def expanded_cube(total_df):
+    # Reference: every occupied minute as its own row
+    rows = []
+    for specialty, start, length in zip(
+        total_df["Specialty"], total_df["Patient In Room Date/Time"], total_df["Total Patient In Room Minutes"]
+    ):
+        for minute in pd.date_range(start, periods=int(length), freq="min"):
+            rows.append((specialty, start.year, start.month, minute.weekday(), minute.hour))
+    minutes = pd.DataFrame(rows, columns=OCCUPANCY_COLUMNS[:-1])
+    return minutes.value_counts().rename("OccupiedMinutes").reset_index()
+
+
+def sorted_cube(cube):
+    keys = OCCUPANCY_COLUMNS[:-1]
+    cube = cube.astype({"Year": int, "Month": int, "Weekday": int, "Hour": int, "OccupiedMinutes": float})
+    return cube.sort_values(keys).reset_index(drop=True)[OCCUPANCY_COLUMNS]
+
+
+def test_cube_matches_minute_expansion(cases):
+    pd.testing.assert_frame_equal(sorted_cube(occupancy_cube(cases)), sorted_cube(expanded_cube(cases)))
+
+
+def test_cube_of_chunks_sums_to_cube_of_all(cases):
+    parts = pd.concat([occupancy_cube(cases.iloc[:150]), occupancy_cube(cases.iloc[150:])])
+    summed = parts.groupby(OCCUPANCY_COLUMNS[:-1], as_index=False)["OccupiedMinutes"].sum()
+    pd.testing.assert_frame_equal(sorted_cube(summed), sorted_cube(occupancy_cube(cases)))
+
+
+def test_case_past_sunday_midnight_wraps_to_monday():
+    cube = occupancy_cube(
+        pd.DataFrame(
+            {
+                "Specialty": ["URO"],
+                "Patient In Room Date/Time": ["2024-03-03 23:30"],  # a Sunday
+                "Total Patient In Room Minutes": [90],
+            }
+        )
+    )
+    assert cube[["Weekday", "Hour", "OccupiedMinutes"]].values.tolist() == [[0, 0, 60], [6, 23, 30]]
+    assert set(cube["Month"]) == {3}
+
+
+def test_cube_skips_invalid_cases():
+    cube = occupancy_cube(
+        pd.DataFrame(
+            {
+                "Specialty": ["URO", None, "URO", "URO"],
+                "Patient In Room Date/Time": ["2024-03-04 08:00", "2024-03-04 08:00", "not a date", "2024-03-04 08:00"],
+                "Total Patient In Room Minutes": [60, 60, 60, 0],
+            }
+        )
+    )
+    assert cube["OccupiedMinutes"].sum() == 60
+
+
+def test_matrix_averages_rooms_over_weekdays_in_the_month():
+    # March 2024 has four Mondays; two rooms busy 08:00-09:00 on one of them
+    cube = occupancy_cube(
+        pd.DataFrame(
+            {
+                "Specialty": ["URO", "CRS"],
+                "Patient In Room Date/Time": ["2024-03-04 08:00", "2024-03-04 08:00"],
+                "Total Patient In Room Minutes": [60, 60],
+            }
+        )
+    )
+    matrix = occupancy_matrix(cube)
+    assert matrix.loc["Monday", 8] == pytest.approx(2 / 4)
+    assert matrix.to_numpy().sum() == pytest.approx(2 / 4)
+    assert occupancy_matrix(cube, specialty="URO").loc["Monday", 8] == pytest.approx(1 / 4)
+    assert not np.any(occupancy_matrix(cube, months=[4]).to_numpy())
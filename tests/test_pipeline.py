@@ -0,0 +1,62 @@
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from utils.pipeline import prepare_lookups, run_processing
+from utils.store_codec import FrameReader, decode_frame, encode_frame
+from utils.synthetic import synthetic_datasets
+
+SOURCE_VERSIONS = {"nu": "test-nu", "sg": "test-sg", "dm": "test-dm"}
+
+# Small enough that a decoded block fits in the 1 MB budgets below
+BLOCK_ROWS = 500
+
+
+@pytest.fixture(scope="module")
+def datasets():
+    return synthetic_datasets(5000, years=(2024,), seed=0)
+
+
+def process(datasets, nu, memory_mb):
+    lookups = prepare_lookups(datasets["sg"].copy(), datasets["dm"], datasets["dic"])
+    return run_processing(nu, lookups, SOURCE_VERSIONS, SOURCE_VERSIONS["dm"], memory_mb=memory_mb, workers=1)
+
+
+def without_created(processed_data):
+    # The derived columns are compared decoded: their blocks follow the chunks they were processed in
+    lineage = {key: value for key, value in processed_data["lineage"].items() if key != "created"}
+    return {key: value for key, value in dict(processed_data, lineage=lineage).items() if key != "derived"}
+
+
+def test_memory_budget_bounds_every_chunk(datasets):
+    _, _, report = process(datasets, encode_frame(datasets["nu"], block_rows=BLOCK_ROWS), memory_mb=1)
+
+    assert report["mode"] == "streaming"
+    assert report["rows"] == len(datasets["nu"])
+    assert report["chunks"] > 1
+    assert report["over_budget_chunks"] == 0
+    assert report["peak_working_mb"] <= report["budget_mb"]
+
+
+def test_memory_budget_output_matches_in_memory(datasets):
+    in_memory, _, _ = process(datasets, datasets["nu"], memory_mb=0)
+    streamed, _, _ = process(datasets, encode_frame(datasets["nu"], block_rows=BLOCK_ROWS), memory_mb=1)
+
+    assert without_created(streamed) == without_created(in_memory)
+    pd.testing.assert_frame_equal(decode_frame(streamed["derived"]), decode_frame(in_memory["derived"]))
+
+
+def test_reading_uploaded_cases_in_chunks_does_not_scale_with_their_size(datasets):
+    def peak_mb(copies):
+        payload = encode_frame(pd.concat([datasets["nu"]] * copies, ignore_index=True), block_rows=BLOCK_ROWS)
+        tracemalloc.start()
+        try:
+            reader = FrameReader(payload)
+            for start in range(0, reader.rows, 400):
+                reader.read(start, start + 400)
+            return tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+
+    assert peak_mb(8) < 1.5 * peak_mb(1)
@@ -0,0 +1,79 @@
+import json
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.procedure_rules import DEFAULT_RULES, ProcedureRules, load_rules
+from utils.synthetic import BLOCK_SERVICES, synthetic_datasets
+
+
+def reference_apply(rules, procedures, specialties):
+    # Reference: every rule tested against every case, highest priority first
+    ordered = sorted(rules, key=lambda rule: -int(rule.get("priority", 0)))
+    results = []
+    for procedure, specialty in zip(procedures, specialties):
+        outcome = specialty
+        if isinstance(procedure, str) and isinstance(specialty, str):
+            for rule in ordered:
+                if rule.get("regex"):
+                    fires = re.search(rule["pattern"], procedure, re.IGNORECASE) is not None
+                else:
+                    fires = rule["pattern"].lower() in procedure.lower()
+                allowed = [item.upper() for item in rule.get("specialties") or []]
+                if fires and (not allowed or specialty in allowed):
+                    outcome = rule["result"].replace("{specialty}", specialty)
+                    break
+        results.append(outcome)
+    return results
+
+
+@pytest.fixture(scope="module")
+def cases():
+    nu = synthetic_datasets(3000, seed=3)["nu"]
+    specialties = np.random.default_rng(3).choice(BLOCK_SERVICES + ["ACS", "PLAS"], size=len(nu))
+    return nu["Primary Procedure"], pd.Series(specialties)
+
+
+RULES = DEFAULT_RULES + [
+    {"pattern": "scop", "regex": False, "specialties": [], "result": "ENDO", "priority": 5},
+    {"pattern": "arthroscopy", "regex": False, "specialties": ["ort-hand"], "result": "SCOPE-{specialty}", "priority": 15},
+    {"pattern": r"^(hernia|lob)", "regex": True, "specialties": ["THO", "crs"], "result": "CHEST", "priority": 30},
+]
+
+
+@pytest.mark.parametrize("rules", [DEFAULT_RULES, RULES], ids=["default", "overlapping"])
+def test_apply_matches_rule_by_rule_reference(cases, rules):
+    procedures, specialties = cases
+    result = ProcedureRules(rules).apply(procedures, specialties)
+    assert result.tolist() == reference_apply(rules, procedures, specialties)
+
+
+def test_highest_priority_of_overlapping_keywords_wins():
+    rules = ProcedureRules(
+        [
+            {"pattern": "rob", "specialties": [], "result": "LOW", "priority": 1},
+            {"pattern": "robot", "specialties": [], "result": "HIGH", "priority": 9},
+            {"pattern": "otic", "specialties": [], "result": "MIDDLE", "priority": 5},
+        ]
+    )
+    assert rules.apply(["Robotic colectomy", "Probe", "Otic drops"], ["URO"] * 3).tolist() == ["HIGH", "LOW", "MIDDLE"]
+
+
+def test_missing_procedure_or_specialty_is_left_alone():
+    result = ProcedureRules(DEFAULT_RULES).apply(["Robotic colectomy", None, "Robotic colectomy"], ["CRS", "CRS", None])
+    assert result.tolist() == ["ROT-CRS", "CRS", None]
+
+
+def test_specialties_are_normalized_in_every_rule_form(tmp_path):
+    rows = [{"pattern": "robot", "regex": False, "specialties": [" uro "], "result": "ROT-{specialty}", "priority": 1}]
+    json_path = tmp_path / "rules.json"
+    json_path.write_text(json.dumps(rows))
+    csv_path = tmp_path / "rules.csv"
+    csv_path.write_text("Pattern,Regex,Specialties,Result,Priority\nrobot,no,uro; gyn,ROT-{specialty},1\n")
+
+    for rules in (rows, load_rules(str(json_path)), load_rules(str(csv_path))):
+        result = ProcedureRules(rules).apply(["Robotic prostatectomy"], ["URO"])
+        assert result.tolist() == ["ROT-URO"]
+    assert load_rules(str(csv_path))[0]["specialties"] == ["URO", "GYN"]
@@ -0,0 +1,93 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify, request
+
+from utils import responses
+from utils.synthetic import synthetic_datasets
+
+
+@pytest.fixture(scope="module")
+def client():
+    server = Flask(__name__)
+    server.calls = []
+    cases = synthetic_datasets(500, seed=4)["nu"].to_json(orient="records")
+
+    @server.post(responses.CALLBACK_PATH)
+    def update_component():
+        body = request.get_json()
+        server.calls.append(body)
+        if body.get("fail"):
+            return jsonify(message="failed"), 500
+        return jsonify(response=body["inputs"])
+
+    @server.get("/cases")
+    def all_cases():
+        return server.response_class(cases, mimetype="application/json")
+
+    @server.get("/small")
+    def small():
+        return jsonify(ok=True)
+
+    responses.init_app(server)
+    return server.test_client()
+
+
+def callback_body(output, value, **extra):
+    return dict(output=f"{output}.children", outputs={"id": output, "property": "children"}, inputs=[{"value": value}], **extra)
+
+
+def test_identical_callback_requests_are_answered_from_cache(client):
+    calls = client.application.calls
+    calls.clear()
+    first = client.post(responses.CALLBACK_PATH, json=callback_body("year-filter", 2024))
+    second = client.post(responses.CALLBACK_PATH, json=callback_body("year-filter", 2024))
+    other = client.post(responses.CALLBACK_PATH, json=callback_body("year-filter", 2025))
+
+    assert [first.headers["X-Response-Cache"], second.headers["X-Response-Cache"], other.headers["X-Response-Cache"]] == ["miss", "hit", "miss"]
+    assert second.get_json() == first.get_json()
+    assert len(calls) == 2
+
+
+def test_uncacheable_outputs_and_errors_always_run(client):
+    calls = client.application.calls
+    calls.clear()
+    for _ in range(2):
+        response = client.post(responses.CALLBACK_PATH, json=callback_body("process-status", 1))
+        assert "X-Response-Cache" not in response.headers
+    for _ in range(2):
+        response = client.post(responses.CALLBACK_PATH, json=callback_body("year-filter", 2024, fail=True))
+        assert response.status_code == 500
+    assert len(calls) == 4
+
+
+def test_get_responses_revalidate_with_etag(client):
+    response = client.get("/small")
+    etag = response.headers["ETag"]
+    assert etag
+
+    revalidated = client.get("/small", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+    assert client.get("/small", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_large_responses_are_gzipped_with_a_weak_etag(client):
+    identity = client.get("/cases")
+    compressed = client.get("/cases", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in identity.headers
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert len(compressed.data) < len(identity.data)
+    assert json.loads(gzip.decompress(compressed.data)) == identity.get_json()
+    assert compressed.headers["ETag"] == "W/" + identity.headers["ETag"]
+
+    revalidated = client.get("/cases", headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+def test_small_responses_are_not_gzipped(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.sketch import RELATIVE_ACCURACY, bucket_index, bucket_value, build_surgeon_sketches, filter_sketches, sketch_stats
+from utils.synthetic import synthetic_datasets
+
+QUANTILES = (0.5, 0.9, 0.95)
+
+
+@pytest.fixture(scope="module")
+def cases():
+    nu = synthetic_datasets(5000, years=(2024, 2025), seed=2)["nu"]
+    starts = pd.to_datetime(nu["Patient In Room Date/Time"], format="%m/%d/%y %H:%M")
+    return nu.rename(columns={"Surgical Specialty": "Specialty"}).assign(Year=starts.dt.year, Month=starts.dt.month)
+
+
+def exact_stats(cases, by):
+    # Reference: the same lower order statistic sketch_stats reads, from the raw minutes
+    def summary(minutes):
+        values = np.sort(minutes.to_numpy(dtype=float))
+        row = {"Cases": len(values), "Mean": values.mean()}
+        for quantile in QUANTILES:
+            row[f"P{int(round(quantile * 100))}"] = values[int(np.floor(quantile * (len(values) - 1)))]
+        return pd.Series(row)
+
+    return cases.groupby(by)["Total Patient In Room Minutes"].apply(summary).unstack().reset_index()
+
+
+def test_bucket_value_is_within_relative_accuracy():
+    values = np.random.default_rng(0).uniform(0.5, 10_000, size=10_000)
+    assert np.all(np.abs(bucket_value(bucket_index(values)) - values) <= RELATIVE_ACCURACY * values * (1 + 1e-9))
+    assert bucket_value(bucket_index([0, -5])).tolist() == [0.0, 0.0]
+
+
+def test_quantiles_are_within_relative_accuracy_of_exact(cases):
+    by = ["Primary Surgeon", "Specialty"]
+    stats = sketch_stats(build_surgeon_sketches(cases), by).sort_values(by).reset_index(drop=True)
+    exact = exact_stats(cases, by).sort_values(by).reset_index(drop=True)
+
+    assert stats["Cases"].tolist() == exact["Cases"].astype(int).tolist()
+    np.testing.assert_allclose(stats["Mean"], exact["Mean"])
+    for column in ("P50", "P90", "P95"):
+        np.testing.assert_allclose(stats[column], exact[column], rtol=RELATIVE_ACCURACY)
+
+
+def test_sketches_of_chunks_merge_like_one_sketch(cases):
+    by = ["Specialty"]
+    whole = sketch_stats(build_surgeon_sketches(cases), by).sort_values(by).reset_index(drop=True)
+    chunks = pd.concat([build_surgeon_sketches(chunk) for chunk in np.array_split(cases, 7)], ignore_index=True)
+    merged = sketch_stats(chunks, by).sort_values(by).reset_index(drop=True)
+    pd.testing.assert_frame_equal(merged, whole)
+
+
+def test_filtered_sketches_match_filtered_cases(cases):
+    selected = cases[(cases["Year"] == 2025) & cases["Month"].isin([3, 4]) & (cases["Specialty"] == "Urology")]
+    sketches = filter_sketches(build_surgeon_sketches(cases), years=[2025], months=[3, 4], specialty="Urology")
+    stats = sketch_stats(sketches, "Specialty")
+
+    assert stats["Cases"].tolist() == [len(selected)]
+    np.testing.assert_allclose(stats["P50"], exact_stats(selected, "Specialty")["P50"], rtol=RELATIVE_ACCURACY)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+
+import pandas as pd
+from flask import Blueprint, Response, request
+from flask_caching import Cache
+
+from utils import warehouse
+from utils.manifest import get_manifest
+from utils.settings import API_CACHE_ENTRIES, API_MAX_PAGE_SIZE, API_PAGE_SIZE, DEFAULT_SITE
+from utils.sketch import filter_sketches, sketch_stats
+from utils.store_codec import decode_frame
+from utils.utilization import aggregate_utilization
+
+# Read-only JSON endpoints over the datasets saved in the database, for reporting
+# tools polling the server without going through the dashboards. Every query reads
+# the saved aggregates (monthly totals, the indexed fact table and surgeon sketches)
+# and its result is cached under the dataset version, capacity version and overrides
+# revision it was computed from, so a repeated query is answered from memory and a
+# dataset patched by overrides is queried afresh. Pages are cut from the cached result.
+
+API_PREFIX = "/api/v1"
+
+# Grains utilization is rolled up to from the monthly aggregates
+API_GRAINS = ["month", "quarter", "fiscal_year"]
+
+blueprint = Blueprint("api", __name__)
+cache = Cache()
+
+
+class ApiError(Exception):
+    """A request the API answers with an error message and status code."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _json(payload, status=200):
+    # Keys stay in column order, unlike jsonify
+    return Response(json.dumps(payload), status=status, mimetype="application/json")
+
+
+@blueprint.errorhandler(ApiError)
+def handle_api_error(error):
+    return _json({"error": str(error)}, error.status)
+
+
+def _int_arg(name, default=None, minimum=None, maximum=None):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(f"'{name}' must be an integer.")
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise ApiError(f"'{name}' must be between {minimum} and {maximum}." if maximum else f"'{name}' must be at least {minimum}.")
+    return number
+
+
+def _bool_arg(name, default):
+    value = request.args.get(name, "").strip().lower()
+    if not value:
+        return default
+    if value not in ("true", "false", "1", "0"):
+        raise ApiError(f"'{name}' must be true or false.")
+    return value in ("true", "1")
+
+
+def _filter_args():
+    # Months may be repeated (months=1&months=2) or comma-separated (months=1,2)
+    values = [part.strip() for value in request.args.getlist("months") for part in value.split(",") if part.strip()]
+    try:
+        months = sorted({int(value) for value in values})
+    except ValueError:
+        raise ApiError("'months' must be month numbers, such as months=1,2,3.")
+    if any(month < 1 or month > 12 for month in months):
+        raise ApiError("'months' must be between 1 and 12.")
+    return {
+        "year": _int_arg("year"),
+        "months": months or None,
+        "specialty": request.args.get("specialty", "").strip() or None,
+    }
+
+
+def _dataset():
+    # A version names one dataset; otherwise the site's current dataset is queried
+    version = request.args.get("version", "").strip() or None
+    site = request.args.get("site", "").strip() or DEFAULT_SITE
+    found = warehouse.dataset_revision(version, site)
+    if found is None:
+        if version:
+            raise ApiError(f"Dataset '{version}' is not in the database.", 404)
+        raise ApiError(f"No dataset has been processed for {site} yet.", 404)
+    return found
+
+
+def _records(frame):
+    # Dates as YYYY-MM-DD and missing values as null
+    frame = frame.copy()
+    for column in frame.select_dtypes(include="datetime").columns:
+        frame[column] = frame[column].dt.strftime("%Y-%m-%d")
+    return json.loads(frame.to_json(orient="records"))
+
+
+def _respond(query, compute, filters):
+    """Answer a query with one page of its (cached) records."""
+    version, capacity, revision = _dataset()
+    page = _int_arg("page", 1, minimum=1)
+    page_size = _int_arg("page_size", API_PAGE_SIZE, minimum=1, maximum=API_MAX_PAGE_SIZE)
+
+    key = "api:" + hashlib.sha1(json.dumps([query, version, capacity, revision, filters], sort_keys=True).encode()).hexdigest()
+    records = cache.get(key) if API_CACHE_ENTRIES > 0 else None
+    hit = records is not None
+    if not hit:
+        records = _records(compute(version, capacity, **filters))
+        if API_CACHE_ENTRIES > 0:
+            cache.set(key, records)
+
+    start = (page - 1) * page_size
+    response = _json(
+        {
+            "version": version,
+            "capacity_version": capacity,
+            "filters": filters,
+            "page": page,
+            "page_size": page_size,
+            "total": len(records),
+            "pages": -(-len(records) // page_size),
+            "data": records[start:start + page_size],
+        }
+    )
+    response.headers["X-Response-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+def utilization_frame(version, capacity, grain="month", by_specialty=True, year=None, months=None, specialty=None):
+    """Utilization per period (and specialty) from the monthly aggregates, as the dashboards compute it."""
+    monthly = warehouse.query_monthly(version, capacity)
+    if year:
+        monthly = monthly[monthly["Date"].dt.year == year]
+    if months:
+        monthly = monthly[monthly["Date"].dt.month.isin(months)]
+    if specialty:
+        monthly = monthly[monthly["Specialty"] == specialty]
+    available = monthly[["Specialty", "Date", "AvailableHours"]]
+    available.attrs["grain"] = "month"
+    return aggregate_utilization(monthly[["Specialty", "Date", "PatientHours"]], available, grain, by_specialty)
+
+
+def weekday_frame(version, capacity, by_specialty=False, year=None, months=None, specialty=None):
+    """Weekday utilization overall, or per specialty."""
+    if not by_specialty:
+        return warehouse.query_weekday_utilization(version, capacity, year, months, specialty)
+    columns = ["Specialty", "Weekday", "TotalPatientInRoomHours", "TotalAvailableHours", "UtilizationRate"]
+    manifest = get_manifest(warehouse.dataset_store(version)) or {}
+    specialties = [specialty] if specialty else list(manifest.get("specialties", []))
+    frames = warehouse.query_weekday_utilization_by_specialty(version, capacity, specialties, year, months)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([frame.assign(Specialty=name) for name, frame in frames.items()], ignore_index=True)[columns]
+
+
+def surgeon_frame(version, capacity, year=None, months=None, specialty=None):
+    """Case counts, mean and percentile minutes per specialty and surgeon from the surgeon sketches, busiest first."""
+    store = warehouse.dataset_store(version)
+    columns = ["Specialty", "Primary Surgeon", "Cases", "Mean", "P50", "P90", "P95"]
+    if not store or "surgeon_sketches" not in store:
+        return pd.DataFrame(columns=columns)
+    sketches = filter_sketches(
+        decode_frame(store["surgeon_sketches"]), years=[year] if year else None, months=months, specialty=specialty
+    )
+    if sketches.empty:
+        return pd.DataFrame(columns=columns)
+    stats = sketch_stats(sketches, ["Specialty", "Primary Surgeon"])
+    return stats.sort_values("Cases", ascending=False, kind="stable")[columns]
+
+
+@blueprint.get("/datasets")
+def datasets():
+    return _json({"data": warehouse.list_datasets()})
+
+
+@blueprint.get("/utilization")
+def utilization():
+    grain = request.args.get("grain", "month").strip()
+    if grain not in API_GRAINS:
+        raise ApiError(f"'grain' must be one of {', '.join(API_GRAINS)}.")
+    filters = dict(_filter_args(), grain=grain, by_specialty=_bool_arg("by_specialty", True))
+    return _respond("utilization", utilization_frame, filters)
+
+
+@blueprint.get("/weekday")
+def weekday():
+    filters = dict(_filter_args(), by_specialty=_bool_arg("by_specialty", False))
+    return _respond("weekday", weekday_frame, filters)
+
+
+@blueprint.get("/surgeons")
+def surgeons():
+    return _respond("surgeons", surgeon_frame, _filter_args())
+
+
+@blueprint.get("/<path:path>")
+def unknown(path):
+    # Otherwise the dashboard's page route would answer with the app's HTML
+    raise ApiError(f"Unknown endpoint '{path}'.", 404)
+
+
+def init_app(server):
+    """Serve the JSON API under API_PREFIX:
+
+    - /datasets: the saved datasets, newest first
+    - /utilization: utilization by period (grain) and specialty (by_specialty)
+    - /weekday: weekday utilization, overall or by_specialty
+    - /surgeons: case counts and patient-time statistics per specialty and surgeon
+
+    Queries take the dataset version or site (default: the current dataset
+    of the default site), year, months and specialty filters, and page and
+    page_size.
+    """
+    cache.init_app(
+        server,
+        config={"CACHE_TYPE": "SimpleCache", "CACHE_THRESHOLD": max(API_CACHE_ENTRIES, 1), "CACHE_DEFAULT_TIMEOUT": 0},
+    )
+    server.register_blueprint(blueprint, url_prefix=API_PREFIX)
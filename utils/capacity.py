@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+from utils.settings import HOLIDAY_CALENDAR, EXTRA_HOLIDAYS
+from utils.utilization import WEEKDAYS
+
+
+def holiday_dates(start, end, calendar=HOLIDAY_CALENDAR, extra=EXTRA_HOLIDAYS):
+    """Holidays between start and end as datetime64[D], from the configured calendar."""
+    holidays = pd.DatetimeIndex([])
+    if calendar == "us_federal":
+        holidays = USFederalHolidayCalendar().holidays(start=start, end=end)
+    elif calendar not in ("none", "", None):
+        raise ValueError(f"Unknown holiday calendar '{calendar}'. Expected 'us_federal' or 'none'.")
+    if extra:
+        holidays = holidays.union(pd.DatetimeIndex(pd.to_datetime(extra)))
+    return holidays.values.astype("datetime64[D]")
+
+
+class CapacityCalendar:
+    """Available hours per Specialty and calendar date.
+
+    Monthly weekday hours from the Available Time summary are spread evenly
+    over that weekday's business days in the month, skipping holidays.
+    Hours are held in a specialties x days array, so a lookup is O(1).
+    """
+
+    def __init__(self, specialties, start, hours):
+        self.specialties = pd.Index(specialties)
+        self.start = np.datetime64(start, "D")
+        self.hours = hours
+
+    @classmethod
+    def from_available_time(cls, dm_df, holidays=None):
+        dm_df = dm_df.dropna(subset=["Services", "Year", "Month"])
+        years = dm_df["Year"].astype(int).to_numpy()
+        months = dm_df["Month"].astype(int).to_numpy()
+        month_index = (years - 1970) * 12 + months - 1  # Months since the datetime64 epoch
+        if len(month_index) == 0:
+            return cls([], "1970-01-01", np.zeros((0, 0)))
+
+        first_month, last_month = month_index.min(), month_index.max()
+        month_starts = np.arange(first_month, last_month + 2).astype("datetime64[M]").astype("datetime64[D]")
+        start, end = month_starts[0], month_starts[-1]
+        if holidays is None:
+            holidays = holiday_dates(pd.Timestamp(start.astype("datetime64[ns]")), pd.Timestamp(end.astype("datetime64[ns]")))
+        holidays = np.asarray(holidays, dtype="datetime64[D]")
+
+        # Business days of each weekday in every month: n_months x 5
+        month_begin, month_end = month_starts[:-1], month_starts[1:]
+        weekday_counts = np.stack(
+            [
+                np.busday_count(month_begin, month_end, weekmask=[int(day == weekday) for day in range(7)], holidays=holidays)
+                for weekday in range(len(WEEKDAYS))
+            ],
+            axis=1,
+        )
+
+        # Monthly weekday hours per (specialty, month, weekday); duplicate rows add up
+        specialty_codes, specialties = pd.factorize(dm_df["Services"])
+        row_months = month_index - first_month
+        weekday_hours = dm_df[WEEKDAYS].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy()
+        monthly = np.zeros((len(specialties), len(month_begin), len(WEEKDAYS)))
+        np.add.at(monthly, (specialty_codes, row_months), weekday_hours)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_day = np.where(weekday_counts > 0, monthly / weekday_counts, 0.0)
+
+        # Expand to dates; weekends and holidays have no capacity
+        days = np.arange(start, end)
+        day_months = days.astype("datetime64[M]").astype(int) - first_month
+        day_weekdays = (days.astype(int) - 4) % 7  # 1970-01-05 was a Monday
+        open_days = np.is_busday(days, holidays=holidays)
+        hours = per_day[:, day_months, np.minimum(day_weekdays, len(WEEKDAYS) - 1)] * open_days
+        return cls(specialties, start, hours)
+
+    def lookup(self, specialty, date):
+        offset = (np.datetime64(date, "D") - self.start).astype(int)
+        if specialty not in self.specialties or not 0 <= offset < self.hours.shape[1]:
+            return 0.0
+        return float(self.hours[self.specialties.get_loc(specialty), offset])
+
+    def hours_on(self, specialties, dates):
+        """Vectorized lookup of many (specialty, date) pairs; unknown pairs give 0."""
+        codes = self.specialties.get_indexer(specialties)
+        offsets = (np.asarray(dates, dtype="datetime64[D]") - self.start).astype(int)
+        valid = (codes >= 0) & (offsets >= 0) & (offsets < self.hours.shape[1])
+        hours = np.zeros(len(codes))
+        hours[valid] = self.hours[codes[valid], offsets[valid]]
+        return hours
+
+    def dates(self):
+        return np.arange(self.start, self.start + self.hours.shape[1])
+
+    def to_frame(self):
+        """Long Specialty/Date/AvailableHours rows for days with capacity."""
+        specialty_index, day_index = np.nonzero(self.hours)
+        capacity = pd.DataFrame(
+            {
+                "Specialty": self.specialties[specialty_index],
+                "Date": self.dates()[day_index],
+                "AvailableHours": self.hours[specialty_index, day_index],
+            }
+        )
+        capacity.attrs["grain"] = "day"
+        return capacity
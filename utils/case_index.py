@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+from utils import warehouse
+from utils.cache import LRUCache
+from utils.settings import CASE_INDEX_ENTRIES
+from utils.utilization import weekday_utilization
+
+# Case columns the Specialty dashboard reads, by their fact-table name
+CASE_INDEX_COLUMNS = {
+    "specialty": "Specialty",
+    "year": "Year",
+    "month": "Month",
+    "weekday": "Case Start Day",
+    "minutes": "Total Patient In Room Minutes",
+}
+
+# Indexes of the saved datasets and Available Time summaries, built once per version
+_indexes = LRUCache(maxsize=max(CASE_INDEX_ENTRIES, 1))
+
+
+class SpecialtyIndex:
+    """Rows ordered by specialty, year and month, with each specialty's offsets.
+
+    Every specialty's rows form one contiguous slice [start, stop), so a
+    selection reads only that slice, narrowed to the selected year by binary
+    search over the slice's sorted years; its cost follows the size of the
+    specialty, not of the whole table. Columns are kept as numpy arrays,
+    text columns as integer codes into their distinct values, and a selection
+    is turned back into a frame.
+    """
+
+    def __init__(self, frame, key="Specialty"):
+        self.key = key
+        self.columns = list(frame.columns)
+        codes, names = pd.factorize(frame[key], sort=True)
+        years = pd.to_numeric(frame["Year"], errors="coerce").to_numpy(dtype=float)
+        months = pd.to_numeric(frame["Month"], errors="coerce").to_numpy(dtype=float)
+
+        # Rows without a specialty go last, outside every slice
+        codes = np.where(codes < 0, len(names), codes)
+        order = np.lexsort((months, years, codes))
+        codes = codes[order]
+        starts = np.searchsorted(codes, np.arange(len(names)), side="left")
+        stops = np.searchsorted(codes, np.arange(len(names)), side="right")
+        self.offsets = {name: (int(start), int(stop)) for name, start, stop in zip(names, starts, stops)}
+        self.rows = len(codes)
+        self.years = years[order]
+        self.months = months[order]
+
+        self._values = {}
+        for column in self.columns:
+            if column == key:
+                continue
+            values = frame[column]
+            if pd.api.types.is_numeric_dtype(values):
+                self._values[column] = (values.to_numpy(dtype=float)[order], None)
+            else:
+                column_codes, uniques = pd.factorize(values)
+                self._values[column] = (column_codes[order], np.append(uniques.astype(object), None))
+        self._names = np.append(np.asarray(names, dtype=object), None)
+        self._codes = codes
+
+    @classmethod
+    def from_cases(cls, version):
+        cases = warehouse.query_cases(version, list(CASE_INDEX_COLUMNS)).rename(columns=CASE_INDEX_COLUMNS)
+        return cls(cases)
+
+    @classmethod
+    def from_capacity(cls, capacity_version):
+        return cls(warehouse.query_available_time(capacity_version), key="Services")
+
+    def specialty_rows(self, specialty):
+        return self.offsets.get(specialty, (0, 0))
+
+    def select(self, specialty=None, year=None, months=None):
+        """The rows of one specialty (or every specialty) in the selected year and months."""
+        if specialty:
+            start, stop = self.specialty_rows(specialty)
+        else:
+            start, stop = 0, self.rows
+        keep = None
+        if year:
+            if specialty:
+                # Years are sorted within a specialty's slice
+                years = self.years[start:stop]
+                start, stop = (
+                    start + int(np.searchsorted(years, int(year), side="left")),
+                    start + int(np.searchsorted(years, int(year), side="right")),
+                )
+            else:
+                keep = self.years[start:stop] == int(year)
+        if months:
+            in_months = np.isin(self.months[start:stop], list(map(int, months)))
+            keep = in_months if keep is None else keep & in_months
+        positions = slice(start, stop) if keep is None else np.flatnonzero(keep) + start
+        return self._frame(positions, specialty)
+
+    def _frame(self, positions, specialty=None):
+        columns = {}
+        for column in self.columns:
+            if column == self.key:
+                codes = self._codes[positions]
+                columns[column] = np.full(len(codes), specialty, dtype=object) if specialty else self._names[codes]
+            elif column == "Year":
+                columns[column] = self.years[positions]
+            elif column == "Month":
+                columns[column] = self.months[positions]
+            else:
+                values, uniques = self._values[column]
+                columns[column] = values[positions] if uniques is None else uniques[values[positions]]
+        return pd.DataFrame(columns)
+
+
+def case_index(version, revision=None):
+    """The dataset's case index; specialty overrides patch cases in place, so the revision is part of the key."""
+    if CASE_INDEX_ENTRIES <= 0:
+        return SpecialtyIndex.from_cases(version)
+    return _indexes.get_or_compute(("cases", version, revision), lambda: SpecialtyIndex.from_cases(version))
+
+
+def capacity_index(capacity_version):
+    if CASE_INDEX_ENTRIES <= 0:
+        return SpecialtyIndex.from_capacity(capacity_version)
+    return _indexes.get_or_compute(("capacity", capacity_version), lambda: SpecialtyIndex.from_capacity(capacity_version))
+
+
+def specialty_cases(versions, specialty=None, year=None, months=None):
+    """One dataset's selected cases and weekday utilization, read from its indexes.
+
+    versions is (dataset, Available Time summary, overrides revision), as
+    dataset_versions returns it.
+    """
+    version, capacity_version, revision = versions
+    cases = case_index(version, revision).select(specialty, year, months)
+    capacity = capacity_index(capacity_version).select(specialty, year, months)
+    return cases, weekday_utilization(cases, capacity)
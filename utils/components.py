@@ -0,0 +1,34 @@
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from dash import html
+
+MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+
+
+def month_options(available=None):
+    # Months missing from the selected year stay visible but cannot be picked
+    return [
+        {
+            "label": html.Span(name, style={"padding": "5px"}),
+            "value": month,
+            "disabled": available is not None and month not in available,
+        }
+        for month, name in enumerate(MONTH_NAMES, start=1)
+    ]
+
+
+def warm_figure_templates():
+    """Build one figure of each kind the pages make, before callbacks run on threads.
+
+    plotly fills in the shared default template lazily on first use, and two
+    threads doing that at once fail with "Invalid value"; once filled in,
+    figures only read it.
+    """
+    data = {"x": ["a", "b"], "y": [1, 2]}
+    for figure in [px.bar(data, x="x", y="y"), px.line(data, x="x", y="y", markers=True), px.box(data, x="x", y="y"), px.imshow(np.eye(2))]:
+        figure.add_hline(y=1, annotation_text="")
+    go.Figure([go.Bar(), go.Scatter(), go.Indicator()])
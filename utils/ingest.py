@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.store_codec import encode_frame
+from utils.turnover import ROOM_COLUMNS
+from utils.utilization import WEEKDAYS
+
+# Sheets read from the Available Time workbook
+AVAILABLE_TIME_SHEETS = {"dm": "Summary by Each Month", "dic": "Dictionary"}
+
+# Columns identifying one case in the elective-cases export, in order of preference
+CASE_ID_COLUMNS = ["Case ID", "Case Number", "Log ID", "Case"]
+
+# Columns read from each dataset; processing and the dashboards use no others. Cases
+# keep their identifier (for overrides) and room (for turnover) when the export has them.
+DATASET_COLUMNS = {
+    "nu": [
+        "Primary Surgeon",
+        "Surgical Specialty",
+        "Primary Procedure",
+        "Patient In Room Date/Time",
+        "Case Start Day",
+        "Total Patient In Room Minutes",
+    ] + CASE_ID_COLUMNS + ROOM_COLUMNS,
+    "sg": ["Last Name", "First Name", "MI", "Department1", "Division1"],
+    "dm": ["Services", "Month", "Year"] + WEEKDAYS + ["Sum"],
+    "dic": ["Name from Raw Data", "Selection", "Abbreviation", "Service"],
+}
+
+# Suffix of the side dataset holding the columns left out of a dataset, kept for display
+EXTRA_SUFFIX = "_extra"
+
+# Columns identifying one record when several files of the same dataset overlap;
+# the last uploaded file wins. Datasets without keys drop exact duplicate rows.
+DEDUP_KEYS = {
+    "sg": ["Last Name", "First Name", "MI"],
+    "dm": ["Services", "Month", "Year"],
+}
+
+
+def content_hash(contents):
+    # Hash the base64 payload directly; decoding first would only add work
+    if isinstance(contents, (list, tuple)):
+        contents = "".join(contents)
+    return hashlib.sha1(contents.encode()).hexdigest()[:12]
+
+
+def decode_contents(contents):
+    content_type, content_string = contents.split(",")
+    return io.BytesIO(base64.b64decode(content_string))
+
+
+def column_filter(dataset_key):
+    """usecols callable keeping a dataset's DATASET_COLUMNS; headers match after stripping."""
+    wanted = set(DATASET_COLUMNS[dataset_key])
+    return lambda column: str(column).strip() in wanted
+
+
+def parse_table(contents, dataset_key=None):
+    # Without a dataset key every column is read
+    usecols = column_filter(dataset_key) if dataset_key else None
+    return pd.read_excel(decode_contents(contents), usecols=usecols)
+
+
+def parse_available_time(contents, project=True):
+    # Read both sheets in a single pass over the workbook
+    with pd.ExcelFile(decode_contents(contents)) as workbook:
+        return {
+            key: workbook.parse(sheet, usecols=column_filter(key) if project else None)
+            for key, sheet in AVAILABLE_TIME_SHEETS.items()
+        }
+
+
+# Upload id suffix -> parser returning {dataset key: DataFrame}, reading only
+# DATASET_COLUMNS unless told otherwise
+PARSERS = {
+    "nu": lambda contents, project=True: {"nu": parse_table(contents, "nu" if project else None)},
+    "sg": lambda contents, project=True: {"sg": parse_table(contents, "sg" if project else None)},
+    "dm": parse_available_time,
+}
+
+
+def _parse_file(upload_key, contents, project=True):
+    start = time.perf_counter()
+    frames = PARSERS[upload_key](contents, project)
+    return frames, time.perf_counter() - start
+
+
+def split_extra_columns(dataset_key, df):
+    """Split a dataset read with every column into its DATASET_COLUMNS and the rest."""
+    wanted = set(DATASET_COLUMNS[dataset_key])
+    extra = [column for column in df.columns if column not in wanted]
+    return df.drop(columns=extra), df[extra]
+
+
+def dedup_keys(dataset_key, df):
+    if dataset_key == "nu":
+        keys = [next((column for column in CASE_ID_COLUMNS if column in df), None)]
+    else:
+        keys = DEDUP_KEYS.get(dataset_key, [])
+    return keys if keys and all(key in df for key in keys) else None
+
+
+def combine_frames(dataset_key, frames):
+    """Concatenate frames of one dataset, aligning columns and dropping overlaps."""
+    for df in frames:
+        df.columns = df.columns.map(lambda column: str(column).strip())
+    combined = pd.concat(frames, ignore_index=True, sort=False)
+    if len(frames) == 1:
+        return combined
+    return combined.drop_duplicates(subset=dedup_keys(dataset_key, combined), keep="last", ignore_index=True)
+
+
+def parse_uploads(jobs, keep_extra=False):
+    """Parse {upload key: [contents, ...]} and combine each upload into one dataset.
+
+    Every file is parsed in its own worker process, reading only the
+    DATASET_COLUMNS of its datasets. With keep_extra, every column is read and
+    the others are returned as a side dataset under the dataset key plus
+    EXTRA_SUFFIX, row-aligned with the dataset, for display only.
+
+    The result maps each upload key to {"datasets": {dataset key: encoded frame}
+    or None, "files": [file report]} plus the combined "rows", where a file
+    report holds its row count and parse time, or the error raised.
+    """
+    files = [
+        (upload_key, contents, not keep_extra)
+        for upload_key, contents_list in jobs.items()
+        for contents in contents_list
+    ]
+
+    if len(files) == 1:
+        try:
+            outcomes = [_parse_file(*files[0])]
+        except Exception as e:
+            outcomes = [e]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as pool:
+            futures = [pool.submit(_parse_file, *job) for job in files]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
+
+    results = {upload_key: {"datasets": None, "files": []} for upload_key in jobs}
+    parsed = {upload_key: [] for upload_key in jobs}
+    for (upload_key, _, _), outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            results[upload_key]["files"].append({"error": outcome})
+            continue
+        frames, seconds = outcome
+        parsed[upload_key].append(frames)
+        results[upload_key]["files"].append({"rows": len(next(iter(frames.values()))), "seconds": seconds})
+
+    # A dataset is only replaced when every one of its files parsed
+    for upload_key, frames_list in parsed.items():
+        if not frames_list or len(frames_list) < len(jobs[upload_key]):
+            continue
+        combined = {
+            dataset_key: combine_frames(dataset_key, [frames[dataset_key] for frames in frames_list])
+            for dataset_key in frames_list[0]
+        }
+        results[upload_key]["rows"] = len(next(iter(combined.values())))
+        if keep_extra:
+            for dataset_key in list(combined):
+                combined[dataset_key], extra = split_extra_columns(dataset_key, combined[dataset_key])
+                if len(extra.columns):
+                    combined[dataset_key + EXTRA_SUFFIX] = extra
+        results[upload_key]["datasets"] = {dataset_key: encode_frame(df) for dataset_key, df in combined.items()}
+    return results
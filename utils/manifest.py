@@ -0,0 +1,147 @@
+import hashlib
+
+import pandas as pd
+
+from utils.store_codec import decode_frame
+
+
+# Build a small summary of a processed dataset so dropdowns and headers
+# never need to load the case-level records
+def dataset_version(df):
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:12]
+
+
+def summarize_manifest(total_df):
+    """What one chunk of cases contributes to its dataset's manifest.
+
+    Only distinct periods, specialties and specialty-surgeon pairs and the
+    date range are kept, so the summary doesn't grow with the cases.
+    """
+    summary = {"row_count": int(len(total_df)), "periods": None, "specialties": None, "surgeons": None, "dates": None}
+    if "Year" in total_df and "Month" in total_df:
+        summary["periods"] = total_df[["Year", "Month"]].dropna().drop_duplicates().astype(int)
+    if "Specialty" in total_df:
+        summary["specialties"] = set(total_df["Specialty"].dropna().unique().tolist())
+        if "Primary Surgeon" in total_df:
+            summary["surgeons"] = total_df[["Specialty", "Primary Surgeon"]].dropna().drop_duplicates()
+    if "Case Start Date" in total_df:
+        dates = pd.to_datetime(total_df["Case Start Date"], errors="coerce").dropna()
+        if not dates.empty:
+            summary["dates"] = (dates.min(), dates.max())
+    return summary
+
+
+def _distinct(frames):
+    frames = [frame for frame in frames if frame is not None]
+    return pd.concat(frames, ignore_index=True).drop_duplicates() if frames else None
+
+
+def merge_manifest_summaries(summaries):
+    """One summary of the cases several summarize_manifest summaries were taken from."""
+    specialties = [summary["specialties"] for summary in summaries if summary["specialties"] is not None]
+    dates = [summary["dates"] for summary in summaries if summary["dates"] is not None]
+    return {
+        "row_count": sum(summary["row_count"] for summary in summaries),
+        "periods": _distinct([summary["periods"] for summary in summaries]),
+        "specialties": set().union(*specialties) if specialties else None,
+        "surgeons": _distinct([summary["surgeons"] for summary in summaries]),
+        "dates": (min(start for start, _ in dates), max(end for _, end in dates)) if dates else None,
+    }
+
+
+def manifest_from_summary(summary, version):
+    """The manifest of the cases a summarize_manifest summary was taken from."""
+    manifest = {
+        "version": version,
+        "row_count": summary["row_count"],
+        "years": [],
+        "months": {},
+        "specialties": [],
+        "surgeon_counts": {},
+        "surgeon_count": 0,
+        "date_range": [None, None],
+    }
+
+    periods = summary["periods"]
+    if periods is not None:
+        manifest["years"] = sorted(periods["Year"].unique().tolist())
+        manifest["months"] = {
+            str(year): sorted(group["Month"].tolist())
+            for year, group in periods.groupby("Year")
+        }
+
+    if summary["specialties"] is not None:
+        manifest["specialties"] = sorted(summary["specialties"])
+
+    surgeons = summary["surgeons"]
+    if surgeons is not None:
+        manifest["surgeon_counts"] = {
+            specialty: int(count)
+            for specialty, count in surgeons.groupby("Specialty")["Primary Surgeon"].nunique().items()
+        }
+        manifest["surgeon_count"] = int(surgeons["Primary Surgeon"].nunique())
+
+    if summary["dates"] is not None:
+        start, end = summary["dates"]
+        manifest["date_range"] = [start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")]
+
+    return manifest
+
+
+def build_manifest(total_df, version=None):
+    return manifest_from_summary(summarize_manifest(total_df), version or dataset_version(total_df))
+
+
+def get_manifest(processed_data):
+    # Older stores were saved before the manifest existed
+    if not processed_data:
+        return None
+    if "manifest" in processed_data:
+        return processed_data["manifest"]
+    if "total" in processed_data:
+        return build_manifest(decode_frame(processed_data["total"]))
+    return None
+
+
+def merge_manifests(manifests):
+    """One manifest describing several sites' datasets together.
+
+    Surgeon counts are summed, so a surgeon operating at two sites counts at both.
+    """
+    manifests = [manifest for manifest in manifests if manifest]
+    if len(manifests) <= 1:
+        return manifests[0] if manifests else None
+    months, surgeon_counts = {}, {}
+    for manifest in manifests:
+        for year, year_months in manifest["months"].items():
+            months[year] = sorted(set(months.get(year, [])) | set(year_months))
+        for specialty, count in manifest["surgeon_counts"].items():
+            surgeon_counts[specialty] = surgeon_counts.get(specialty, 0) + count
+    starts = [manifest["date_range"][0] for manifest in manifests if manifest["date_range"][0]]
+    ends = [manifest["date_range"][1] for manifest in manifests if manifest["date_range"][1]]
+    return {
+        "version": ", ".join(manifest["version"] for manifest in manifests),
+        "row_count": sum(manifest["row_count"] for manifest in manifests),
+        "years": sorted(set().union(*(manifest["years"] for manifest in manifests))),
+        "months": dict(sorted(months.items())),
+        "specialties": sorted(set().union(*(manifest["specialties"] for manifest in manifests))),
+        "surgeon_counts": surgeon_counts,
+        "surgeon_count": sum(manifest["surgeon_count"] for manifest in manifests),
+        "date_range": [min(starts) if starts else None, max(ends) if ends else None],
+        "sites": sum(manifest.get("sites", 1) for manifest in manifests),
+    }
+
+
+def describe_manifest(manifest):
+    if not manifest:
+        return ""
+    start, end = manifest["date_range"]
+    date_text = f" from {start} to {end}" if start else ""
+    site_text = f" at {manifest['sites']} sites" if manifest.get("sites", 1) > 1 else ""
+    version_text = "dataset versions" if site_text else "dataset version"
+    return (
+        f"{manifest['row_count']:,} cases{date_text}{site_text} across "
+        f"{len(manifest['specialties'])} specialties and {manifest['surgeon_count']} surgeons "
+        f"({version_text} {manifest['version']})."
+    )
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+HOURS_PER_WEEK = 7 * 24
+EPOCH_WEEK_HOUR = 72  # 1970-01-01 00:00 was Thursday, hour 72 of a Monday-based week
+MAX_CASE_MINUTES = HOURS_PER_WEEK * 60 - 1  # Longer cases would wrap onto themselves
+
+OCCUPANCY_COLUMNS = ["Specialty", "Year", "Month", "Weekday", "Hour", "OccupiedMinutes"]
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def occupancy_cube(total_df):
+    """Occupied room-minutes per Specialty/Year/Month and hour of the week.
+
+    Each case adds its partial first and last hours as point values and its
+    full hours through a difference array, so no case is expanded into
+    minute rows. A case is counted in the month it starts. Only non-zero
+    cells are returned.
+    """
+    required = ["Specialty", "Patient In Room Date/Time", "Total Patient In Room Minutes"]
+    if not all(column in total_df for column in required):
+        return pd.DataFrame(columns=OCCUPANCY_COLUMNS)
+
+    starts = pd.to_datetime(total_df["Patient In Room Date/Time"], errors="coerce")
+    minutes = pd.to_numeric(total_df["Total Patient In Room Minutes"], errors="coerce")
+    valid = (starts.notna() & minutes.notna() & (minutes > 0) & total_df["Specialty"].notna()).to_numpy()
+    if not valid.any():
+        return pd.DataFrame(columns=OCCUPANCY_COLUMNS)
+
+    starts = starts[valid]
+    start = starts.to_numpy().astype("datetime64[m]").astype(np.int64)
+    end = start + np.minimum(minutes.to_numpy()[valid], MAX_CASE_MINUTES).astype(np.int64)
+
+    # One group per Specialty/Year/Month of the case start
+    group_codes, groups = pd.factorize(
+        pd.MultiIndex.from_arrays([total_df["Specialty"].to_numpy()[valid], starts.dt.year, starts.dt.month])
+    )
+    n_groups = len(groups)
+
+    # Positions on a two-week axis so a case running past Sunday night needs no split
+    start_hour, end_hour = start // 60, end // 60
+    first_slot = (start_hour + EPOCH_WEEK_HOUR) % HOURS_PER_WEEK
+    last_slot = first_slot + (end_hour - start_hour)
+    same_hour = start_hour == end_hour
+    first_minutes = np.where(same_hour, end - start, (start_hour + 1) * 60 - start)
+    last_minutes = np.where(same_hour, 0, end - end_hour * 60)
+
+    width = 2 * HOURS_PER_WEEK
+    base = group_codes * width
+    size = n_groups * width
+
+    # Full hours between the first and last slot: +60 at first_slot + 1, -60 at last_slot
+    spans = ~same_hour
+    diff = np.bincount(base[spans] + first_slot[spans] + 1, minlength=size) * 60.0
+    diff -= np.bincount(base[spans] + last_slot[spans], minlength=size) * 60.0
+    occupied = np.cumsum(diff.reshape(n_groups, width), axis=1)
+    occupied += np.bincount(base + first_slot, weights=first_minutes, minlength=size).reshape(n_groups, width)
+    occupied += np.bincount(base + last_slot, weights=last_minutes, minlength=size).reshape(n_groups, width)
+
+    # Fold the second week back onto the first
+    weekly = occupied[:, :HOURS_PER_WEEK] + occupied[:, HOURS_PER_WEEK:]
+
+    group_index, slot = np.nonzero(weekly)
+    specialties, years, months = (groups.get_level_values(level).to_numpy() for level in range(3))
+    return pd.DataFrame(
+        {
+            "Specialty": specialties[group_index],
+            "Year": years[group_index],
+            "Month": months[group_index],
+            "Weekday": slot // 24,
+            "Hour": slot % 24,
+            "OccupiedMinutes": weekly[group_index, slot],
+        }
+    )
+
+
+def occupancy_matrix(cube, years=None, months=None, specialty=None):
+    """Average rooms in use per weekday (rows) and hour (columns) for a selection.
+
+    Occupied minutes are divided by 60 and by the number of times each
+    weekday occurs in the selected months.
+    """
+    if years is not None:
+        cube = cube[cube["Year"].isin(years)]
+    if months is not None:
+        cube = cube[cube["Month"].isin(months)]
+    if specialty:
+        cube = cube[cube["Specialty"] == specialty]
+
+    minutes = np.bincount(
+        cube["Weekday"].to_numpy(dtype=np.int64) * 24 + cube["Hour"].to_numpy(dtype=np.int64),
+        weights=cube["OccupiedMinutes"].to_numpy(dtype=float),
+        minlength=HOURS_PER_WEEK,
+    ).reshape(7, 24)
+
+    # Days of each weekday in the months that appear in the selection
+    periods = cube[["Year", "Month"]].drop_duplicates()
+    month_starts = pd.to_datetime(periods.assign(Day=1).rename(columns=str.lower)).values.astype("datetime64[D]")
+    month_ends = (month_starts.astype("datetime64[M]") + 1).astype("datetime64[D]")
+    day_counts = np.array(
+        [
+            np.busday_count(month_starts, month_ends, weekmask=[int(day == weekday) for day in range(7)]).sum()
+            for weekday in range(7)
+        ]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rooms = np.where(day_counts[:, None] > 0, minutes / 60 / day_counts[:, None], 0.0)
+    return pd.DataFrame(rooms, index=WEEKDAY_NAMES, columns=range(24))
@@ -0,0 +1,143 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.ingest import CASE_ID_COLUMNS, parse_table
+from utils.occupancy import OCCUPANCY_COLUMNS, occupancy_cube
+from utils.sketch import SKETCH_COLUMNS, build_surgeon_sketches
+from utils.store_codec import encode_frame, decode_frame
+from utils.utilization import WEEKDAYS
+
+# Columns accepted for the corrected specialty in an override file, in order of preference
+OVERRIDE_SPECIALTY_COLUMNS = ["Corrected Specialty", "New Specialty", "Specialty"]
+
+OVERRIDE_COLUMNS = ["Case ID", "Specialty"]
+
+
+def case_id_column(df):
+    return next((column for column in CASE_ID_COLUMNS if column in df), None)
+
+
+def case_ids(series):
+    # Compare identifiers as text so 1001, 1001.0 and "1001" match
+    values = series.astype(object).where(series.notna(), None)
+    return values.map(lambda value: None if value is None else str(int(value)) if isinstance(value, float) and value.is_integer() else str(value).strip())
+
+
+def parse_overrides(contents):
+    """Read an override file into Case ID / Specialty rows; the last row per case wins."""
+    df = parse_table(contents)
+    df.columns = df.columns.map(lambda column: str(column).strip())
+    id_column = case_id_column(df)
+    specialty_column = next((column for column in OVERRIDE_SPECIALTY_COLUMNS if column in df), None)
+    if id_column is None or specialty_column is None:
+        raise ValueError(
+            f"Override files need a case identifier ({', '.join(CASE_ID_COLUMNS)}) "
+            f"and a specialty column ({', '.join(OVERRIDE_SPECIALTY_COLUMNS)})."
+        )
+    overrides = pd.DataFrame(
+        {"Case ID": case_ids(df[id_column]), "Specialty": df[specialty_column].astype("string").str.strip().str.upper()}
+    ).dropna()
+    overrides = overrides[overrides["Specialty"] != ""]
+    return overrides.drop_duplicates(subset="Case ID", keep="last", ignore_index=True)
+
+
+def overrides_digest(overrides):
+    if overrides is None or overrides.empty:
+        return None
+    ordered = overrides.sort_values("Case ID")
+    key = "\n".join(f"{case_id}\t{specialty}" for case_id, specialty in zip(ordered["Case ID"], ordered["Specialty"]))
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def override_specialties(df, overrides):
+    """Specialty per row after overrides, and a mask of the rows whose specialty changes."""
+    id_column = case_id_column(df)
+    if id_column is None or overrides is None or overrides.empty:
+        return df["Specialty"], pd.Series(False, index=df.index)
+    lookup = pd.Series(overrides["Specialty"].to_numpy(), index=overrides["Case ID"].to_numpy())
+    corrected = case_ids(df[id_column]).map(lookup)
+    changed = corrected.notna() & (corrected != df["Specialty"])
+    return df["Specialty"].where(~changed, corrected), changed
+
+
+def available_hours(rows, dm_df):
+    """Total Hours for cases from the Available Time summary, as processing looks them up."""
+    hours = (
+        dm_df.groupby(["Services", "Month", "Year"], as_index=False)[WEEKDAYS].sum()
+        .melt(id_vars=["Services", "Month", "Year"], value_vars=WEEKDAYS, var_name="Weekday", value_name="Total Hours")
+        .dropna(subset=["Total Hours"])
+    )
+    return rows[["Specialty", "Month", "Year", "Case Start Day"]].merge(
+        hours,
+        how="left",
+        left_on=["Specialty", "Month", "Year", "Case Start Day"],
+        right_on=["Services", "Month", "Year", "Weekday"],
+    )["Total Hours"].to_numpy()
+
+
+def merge_patches(patches, rows, specialties, total_hours):
+    """A store's patches ({"rows", "Specialty", "Total Hours"}) with more cases; a case's latest patch wins."""
+    merged = {}
+    if patches:
+        merged.update(zip(patches["rows"], zip(patches["Specialty"], patches["Total Hours"])))
+    for row, specialty, hours in zip(rows, specialties, total_hours):
+        merged[int(row)] = (specialty, None if pd.isna(hours) else float(hours))
+    rows = sorted(merged)
+    return {
+        "rows": rows,
+        "Specialty": [merged[row][0] for row in rows],
+        "Total Hours": [merged[row][1] for row in rows],
+    }
+
+
+def _shift(frame, removed, added, keys, values, columns):
+    # Additive summaries move with the cases: subtract the old rows, add the new ones
+    parts = [frame, removed.assign(**{value: -removed[value] for value in values}), added]
+    combined = pd.concat([part for part in parts if not part.empty], ignore_index=True)
+    if combined.empty:
+        return pd.DataFrame(columns=columns)
+    combined = combined.groupby(keys, as_index=False, sort=False)[values].sum()
+    keep = np.abs(combined[values].to_numpy(dtype=float)).max(axis=1) > 1e-6
+    return combined[keep][columns].reset_index(drop=True)
+
+
+def patch_processed(processed_data, changes, dm_df, digest):
+    """Apply changed specialties to a processed store without reprocessing.
+
+    changes are the cases whose specialty changes, as query_override_changes
+    returns them. Only those cases are touched: their Total Hours are looked
+    up again, their new values are added to the store's patches (applied over
+    the stored case columns when they are loaded, as the database applies its
+    own) and their contributions to the occupancy cube and surgeon sketches
+    are moved from the old specialty to the new one. Returns the patched
+    store and the changed cases' Total Hours.
+    """
+    before = changes
+    after = changes.assign(Specialty=changes["New Specialty"])
+    total_hours = available_hours(after, dm_df) if dm_df is not None else np.full(len(after), np.nan)
+
+    result = dict(processed_data)
+    if "derived" in processed_data or "total" in processed_data:
+        result["patches"] = merge_patches(processed_data.get("patches"), changes["Row"], after["Specialty"], total_hours)
+
+    if "occupancy" in processed_data:
+        result["occupancy"] = encode_frame(
+            _shift(
+                decode_frame(processed_data["occupancy"]), occupancy_cube(before), occupancy_cube(after),
+                OCCUPANCY_COLUMNS[:-1], ["OccupiedMinutes"], OCCUPANCY_COLUMNS,
+            )
+        )
+    if "surgeon_sketches" in processed_data:
+        result["surgeon_sketches"] = encode_frame(
+            _shift(
+                decode_frame(processed_data["surgeon_sketches"]), build_surgeon_sketches(before), build_surgeon_sketches(after),
+                SKETCH_COLUMNS[:-2], ["Count", "Minutes"], SKETCH_COLUMNS,
+            )
+        )
+
+    lineage = dict(processed_data.get("lineage") or {})
+    lineage["overrides"] = digest
+    result["lineage"] = lineage
+    return result, total_hours
@@ -0,0 +1,489 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.overrides import override_specialties, overrides_digest
+from utils.procedure_rules import ProcedureRules
+from utils.processed import SOURCE_ROW, ChunkSummary, assemble_processed
+from utils.settings import PROCESSING_MEMORY_MB, PROCESSING_WORKERS
+from utils.store_codec import FrameReader, decode_frame, encoded_bytes
+from utils import warehouse
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Cases processed first to measure the memory a case needs when a budget is set
+PROBE_ROWS = 1000
+
+# Working set assumed per byte of input when sizing the first chunk; processing
+# measured about 4x (the joined output is counted twice)
+PROBE_EXPANSION = 8
+
+# Share of the memory budget chunks are sized to, leaving room for cases larger than those seen
+BUDGET_MARGIN = 0.8
+
+# Rows of the processed table shown after processing in streaming mode
+PREVIEW_ROWS = 1000
+
+# Fewer cases than this are processed in the calling process; a pool costs more than it saves
+PARALLEL_MIN_ROWS = 20000
+
+# Year/Month partitions handed out per worker, so uneven months still keep every worker busy
+PARTITIONS_PER_WORKER = 4
+
+# Format of 'Patient In Room Date/Time', like "08/01/24 07:28"
+CASE_DATE_FORMAT = "%m/%d/%y %H:%M"
+
+# Lookup tables of the run, set once in each worker process by the pool initializer
+_worker_lookups = None
+
+
+def determine_specialty(row):
+    department = str(row['Department1']).upper()  # Convert Department1 to uppercase
+    division = str(row['Division1']).upper()     # Convert Division1 to uppercase
+
+    if department == "OBSTETRICS AND GYNECOLOGY":
+        if division == "GYNECOLOGY ONCOLOGY":
+            return "GYNONC"
+        elif division == "REPRODUCTIVE ENDOCRINE INFERTILITY":
+            return "GYNREI"
+        elif division == "FEMALE PELVIC MED. AND RECONST. SURG":
+            return "GYNURO"
+        else:
+            return "GYN"
+    elif department == "DENTISTRY":
+        if division == "PEDIATRIC DENTISTRY":
+            return "PD-DEN"
+        else:
+            return "DENT-OMFS"
+    elif department == "SURGERY":
+        if division == "BURNS":
+            return "BURNS"
+        elif division == "CARDIAC SURGERY":
+            return "CAR"
+        elif division == "COLORECTAL":
+            return "CRS"
+        elif division == "HEPATOBILIARY":
+            return "HBS"
+        elif division == "MINIMALLY INVASIVE SURGERY":
+            return "MIS"
+        elif division == "SURGICAL ONCOLOGY":
+            return "ONC"
+        elif division == "THORACIC":
+            return "THO"
+        elif division == "PLASTICS":
+            return "PLAS"
+        elif division == "ACUTE CARE SURGERY (ACS)":
+            return "ACS"
+        elif division == "VASCULAR":
+            return "VAS"
+        elif division == "PEDIATRICS":
+            return "GS-PED"
+        else:
+            return "UNDEFINED"
+    elif department == "PEDIATRICS":
+        return "GS-PED"
+    elif department == "UROLOGY":
+        return "URO"
+    elif department == "OPHTHALMOLOGY":
+        return "OPH"
+    elif department == "OTOLARYNGOLOGY":
+        return "OTO"
+    elif department == "NEUROSURGERY":
+        return "NEU"
+    elif department == "ORTHOPEDICS":
+        if division == "HAND SERVICES":
+            return "ORT-HAND"
+        elif division == "PODIATRY":
+            return "ORT-POD"
+        elif division == "SPORTS MEDICINE":
+            return "ORT-SPT"
+        else:
+            return "ORT"
+    else:
+        return "UNDEFINED"
+
+
+def prepare_lookups(sg_df, dm_df, dic_df, overrides=None):
+    """Build the roster, dictionary and calendar tables every chunk of cases is joined with."""
+    # Step 1: Filter and separate columns in `dic.df`
+    dic_filtered = (
+        dic_df.dropna(subset=['Name from Raw Data'])
+        .query("`Name from Raw Data` != 'NA' and Selection == 'V'")
+        .assign(
+            RawName1=lambda x: x['Name from Raw Data'].str.split('/').str[0],
+            RawName2=lambda x: x['Name from Raw Data'].str.split('/').str[1]
+        )
+        .loc[:, ['Abbreviation', 'Service', 'RawName1', 'RawName2']]
+    )
+
+    # Step 2: Remove rows where 'RawName1' appears more than once
+    dic_nondup = (
+        dic_filtered.groupby('RawName1')
+        .filter(lambda x: len(x) == 1)
+        .reset_index(drop=True)
+    )
+    dic_nondup = dic_nondup.rename(columns={'Abbreviation': 'DicAbb', 'Service': 'DicService'})
+
+    # Step 3: Load and create Specialty Abbreviation for Surgeon List
+    sg_df['Surgeon'] = sg_df.apply(
+        lambda row: f"{row['Last Name']}, {row['First Name']} {row['MI']}" if pd.notna(row['MI'])
+        else f"{row['Last Name']}, {row['First Name']}",
+        axis=1
+    )
+
+    sg_df2 = sg_df[['Surgeon', 'Department1', 'Division1']]
+
+    # Filter the DataFrame for the specified departments
+    departments_to_keep = [
+        "DENTISTRY", "MEDICINE", "NEUROSURGERY", "OBSTETRICS AND GYNECOLOGY",
+        "OPHTHALMOLOGY", "ORTHOPEDICS", "OTOLARYNGOLOGY", "PEDIATRICS",
+        "SURGERY", "UROLOGY"
+    ]
+
+    sg_df2 = sg_df2[sg_df2['Department1'].isin(departments_to_keep)]
+
+    # Apply the function to assign Specialty
+    sg_df2['DivAbb'] = sg_df2.apply(determine_specialty, axis=1)
+
+    # Ensure records in `dm_df` are unique
+    dm_df = dm_df.groupby(["Services", "Month", "Year"], as_index=False).agg(
+        Monday=("Monday", "sum"),
+        Tuesday=("Tuesday", "sum"),
+        Wednesday=("Wednesday", "sum"),
+        Thursday=("Thursday", "sum"),
+        Friday=("Friday", "sum"),
+        Sum=("Sum", "sum"),  # Ensure the `Sum` column is also aggregated properly
+    )
+
+    # Step 7: Transform `dm_df` to long format
+    dm_df_long = pd.melt(
+        dm_df,
+        id_vars=["Services", "Month", "Year"],
+        value_vars=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
+        var_name="Weekday",
+        value_name="Total Hours"
+    ).dropna(subset=['Total Hours'])
+
+    dm_df_long['Weekday'] = pd.Categorical(
+        dm_df_long['Weekday'],
+        categories=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        ordered=True
+    )
+    dm_df_long = dm_df_long.sort_values(by=['Services', 'Year', 'Month', 'Weekday']).reset_index(drop=True)
+
+    return {
+        "sg": sg_df2,
+        "dic": dic_nondup,
+        "dm": dm_df,
+        "dm_long": dm_df_long,
+        "rules": ProcedureRules.load(),
+        "overrides": overrides,
+    }
+
+
+def process_cases(nu_df, lookups):
+    """Map the specialty of elective cases and join their available hours."""
+    sg_df2, dic_nondup, dm_df_long = lookups["sg"], lookups["dic"], lookups["dm_long"]
+
+    # Step 4: Merge DataFrames
+    merge_df = (
+        nu_df
+        .merge(sg_df2, how='left', left_on='Primary Surgeon', right_on='Surgeon')
+        .merge(dic_nondup[["DicAbb", "DicService", "RawName1"]], how='left', left_on='Surgical Specialty', right_on='RawName1')  # Merge with dic2 on 'Name1'
+        .merge(dic_nondup[["DicAbb", "DicService", "RawName2"]], how='left', left_on='Surgical Specialty', right_on='RawName2')  # Merge with dic2 on 'Name2'
+    )
+
+    # Step 5: Create 'Specialty' column based on conditions
+    merge_df['Specialty'] = merge_df.apply(
+        lambda row: row['DivAbb'] if pd.notna(row['Division1']) else
+                    row['DicAbb_x'] if pd.notna(row['DicService_x']) else
+                    row['DicAbb_y'] if pd.notna(row['DicService_y']) else "",
+        axis=1
+    )
+
+    # Step 6/7: Update 'Specialty' from the procedure-keyword rules
+        # By default: if procedure contains "robot" then add "ROT-" before robotic specialties,
+        # and if Specialty belongs to plastics & procedures contains "burn" then classified as BURNS
+    merge_df['Specialty'] = lookups["rules"].apply(
+        merge_df['Primary Procedure'], merge_df['Specialty']
+    ).to_numpy()
+
+    # Replace empty string ("") in 'Specialty' with 'UNSPECIFIED' in uppercase
+    merge_df['Specialty'] = merge_df['Specialty'].apply(lambda x: x.upper() if x.strip() != "" else "UNDEFINED")
+
+    # Apply the specialty overrides uploaded so far; they take precedence over every rule
+    merge_df['Specialty'], _ = override_specialties(merge_df, lookups["overrides"])
+
+    merge_df = merge_df.drop(columns=['DicAbb_x', 'DicService_x', 'RawName1', 'DicAbb_y', 'DicService_y', 'RawName2'])
+
+    # Step 8: Finalize and merge data
+    # Convert 'Patient In Room Date/Time' to datetime using the specified format
+    merge_df['Patient In Room Date/Time'] = pd.to_datetime(
+        merge_df['Patient In Room Date/Time'],
+        format=CASE_DATE_FORMAT,
+        errors='coerce'  # Coerce invalid formats to NaT
+    )
+
+    # Extract the date part and assign it to 'Case Start Date'
+    merge_df['Case Start Date'] = merge_df['Patient In Room Date/Time'].dt.date
+
+    # (Optional) Convert 'Case Start Date' back to datetime if needed
+    merge_df['Case Start Date'] = pd.to_datetime(merge_df['Case Start Date'])
+
+
+    merge_df['Month'] = merge_df['Case Start Date'].dt.month
+    merge_df['Year'] = merge_df['Case Start Date'].dt.year
+
+    total_df = pd.merge(
+        merge_df,
+        dm_df_long,
+        how='left',
+        left_on=['Specialty', 'Month', 'Year', 'Case Start Day'],
+        right_on=['Services', 'Month', 'Year', 'Weekday']
+    ).drop(columns=['Services', 'Weekday'])
+
+    total_df['TotalPtHours'] = (total_df['Total Patient In Room Minutes'] / 60).round(6)
+
+    return total_df
+
+
+def _init_worker(lookups):
+    global _worker_lookups
+    _worker_lookups = lookups
+
+
+def _process_partition(nu_part):
+    return process_cases(nu_part, _worker_lookups)
+
+
+def processing_workers(workers=None):
+    workers = PROCESSING_WORKERS if workers is None else workers
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+def partition_cases(nu_df, parts):
+    """Split cases by Year/Month of their start, cutting months larger than len/parts rows.
+
+    Rows keep their order within each partition; cases without a valid
+    start form their own partition.
+    """
+    starts = pd.to_datetime(nu_df["Patient In Room Date/Time"], format=CASE_DATE_FORMAT, errors="coerce")
+    keys = (starts.dt.year * 12 + starts.dt.month).fillna(-1).astype(np.int64).to_numpy()
+    order = np.argsort(keys, kind="stable")
+    limit = max(1, -(-len(nu_df) // parts))
+    boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+    partitions = []
+    for month_rows in np.split(order, boundaries):
+        for start in range(0, len(month_rows), limit):
+            partitions.append(nu_df.iloc[month_rows[start:start + limit]])
+    return partitions
+
+
+def process_partitioned(nu_df, lookups, pool=None, workers=1):
+    """process_cases over Year/Month partitions in a process pool, merged back into case order.
+
+    Each case is processed on its own, so the merged result equals
+    process_cases on the whole frame. Returns it with the partition count.
+    """
+    if pool is None or workers <= 1 or len(nu_df) < PARALLEL_MIN_ROWS:
+        return process_cases(nu_df, lookups), 1
+    partitions = partition_cases(nu_df, workers * PARTITIONS_PER_WORKER)
+    parts = list(pool.map(_process_partition, partitions))
+    # Cases a lookup join expanded stay together and in join order
+    total_df = pd.concat(parts, ignore_index=True).sort_values(SOURCE_ROW, kind="stable", ignore_index=True)
+    return total_df, len(partitions)
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+
+
+def _tagged_rows(reader, start, stop):
+    return reader.read(start, stop).assign(**{SOURCE_ROW: np.arange(start, stop)})
+
+
+def run_processing(nu, lookups, source_versions, capacity_version=None, memory_mb=None, workers=None, site=None):
+    """Process a site's elective cases, save them to the database and build its processed store.
+
+    nu is the elective cases as a DataFrame or as their encoded store
+    payload, which is decoded one block (STORE_BLOCK_ROWS cases) at a time.
+    The payload itself stays in memory, still encoded, throughout. Without
+    a memory budget all cases are processed at once. With one, every chunk
+    is sized before it is processed so that its working set (the input
+    block being decoded, its input plus the joined output, counted twice
+    for the copies the joins make) stays within
+    BUDGET_MARGIN of the budget: the first PROBE_ROWS-or-fewer cases are
+    sized from their input and PROBE_EXPANSION, and later chunks from the
+    largest working set per case seen so far. A chunk that still goes over
+    is kept and counted in the report. Each chunk is written to the database
+    as soon as it is done and only folded into a ChunkSummary.
+
+    Chunks of PARALLEL_MIN_ROWS cases or more are split into Year/Month
+    partitions processed by a pool of worker processes (workers, or the
+    PROCESSING_WORKERS setting; zero means every core), each holding its own
+    copy of the lookup tables. The output is the same in every mode.
+
+    Returns the processed store, the processed table to display (the first
+    PREVIEW_ROWS rows when streaming) and a report of the run.
+    """
+    start_time = time.perf_counter()
+    memory_mb = PROCESSING_MEMORY_MB if memory_mb is None else memory_mb
+    budget = memory_mb * 2 ** 20 if memory_mb else None
+    reader = FrameReader(nu)
+    nu_columns = list(reader.names) + [SOURCE_ROW]
+    n_rows = reader.rows
+    workers = processing_workers(workers)
+    pool = None
+    if workers > 1 and n_rows >= PARALLEL_MIN_ROWS:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(lookups,))
+    partitions = 0
+
+    writer = warehouse.DatasetWriter()
+    summary, chunks, columns, display = ChunkSummary(nu_columns, site), 0, None, None
+    # Working set per case: estimated from the input for the first chunk, then the largest measured
+    peak_working, over_budget, bytes_per_row, measured = 0, 0, 0, False
+    position = 0
+    try:
+        while position < n_rows or not chunks:
+            if budget is None:
+                stop = n_rows
+                nu_chunk = _tagged_rows(reader, position, stop)
+            else:
+                if not measured:
+                    # Size the probe from its input before processing any of it
+                    sample = _tagged_rows(reader, position, min(n_rows, position + PROBE_ROWS))
+                    bytes_per_row = PROBE_EXPANSION * frame_bytes(sample) / max(len(sample), 1)
+                # The input block being decoded is held alongside the chunk
+                available = BUDGET_MARGIN * budget - reader.block_bytes
+                rows = int(available / bytes_per_row) if bytes_per_row else n_rows
+                if rows < 1 and n_rows:
+                    raise MemoryError(
+                        f"A single case needs about {bytes_per_row / 2 ** 20:.1f} MB besides the "
+                        f"{reader.block_bytes / 2 ** 20:.1f} MB block of uploaded cases being decoded, "
+                        f"more than the {memory_mb} MB processing budget."
+                    )
+                stop = min(n_rows, position + max(rows, 1))
+                nu_chunk = _tagged_rows(reader, position, stop)
+
+            total_chunk, chunk_partitions = process_partitioned(nu_chunk, lookups, pool, workers)
+            chunk_working = frame_bytes(nu_chunk) + 2 * frame_bytes(total_chunk)
+            working = reader.block_bytes + chunk_working
+            peak_working = max(peak_working, working)
+            if budget is not None and working > budget:
+                over_budget += 1
+            partitions += chunk_partitions
+
+            summary.add(total_chunk)
+            chunks += 1
+            total_chunk = total_chunk.drop(columns=SOURCE_ROW)
+            writer.write(total_chunk)
+            columns = columns or list(total_chunk.columns)
+            if display is None:
+                display = total_chunk if budget is None else total_chunk.head(PREVIEW_ROWS)
+            del nu_chunk, total_chunk
+
+            if budget is not None and stop > position:
+                bytes_per_row = max(bytes_per_row if measured else 0, chunk_working / (stop - position))
+                measured = True
+            position = stop
+
+        processed_data = assemble_processed(
+            summary, columns, source_versions, overrides_digest(lookups["overrides"])
+        )
+        writer.finish(processed_data, lookups["dm"], capacity_version)
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    report = {
+        "mode": "in-memory" if budget is None else "streaming",
+        "rows": summary.rows,
+        "chunks": chunks,
+        "over_budget_chunks": over_budget,
+        "workers": workers if pool is not None else 1,
+        "partitions": partitions,
+        "budget_mb": memory_mb or None,
+        "peak_working_mb": round(peak_working / 2 ** 20, 1),
+        "store_mb": round(encoded_bytes(processed_data["derived"]) / 2 ** 20, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "seconds": round(time.perf_counter() - start_time, 2),
+    }
+    return processed_data, display, report
+
+
+def process_site(site, files, workers=None):
+    """Process one site's uploads with run_processing; returns its (store, display table, report)."""
+    lookups = prepare_lookups(
+        decode_frame(files["sg"]),
+        decode_frame(files["dm"]),
+        decode_frame(files["dic"]),
+        overrides=warehouse.load_overrides(),
+    )
+    versions = files.get("versions", {})
+    # The elective cases are decoded a chunk at a time as they are processed
+    return run_processing(files["nu"], lookups, versions, versions.get("dm"), workers=workers, site=site)
+
+
+def process_sites(site_files, workers=None):
+    """process_site for every site in {site: uploads}, each site in its own worker process.
+
+    Sites are independent: each is saved to its own partition of the
+    database, and a site that fails doesn't stop the others. The cores
+    (workers, or the PROCESSING_WORKERS setting) are shared out among the
+    sites for their Year/Month partitions. Returns {site: (store, display
+    table, report) or the exception raised}.
+    """
+    workers = processing_workers(workers)
+    sites = list(site_files)
+    if len(sites) == 1 or workers == 1:
+        results = {}
+        for site in sites:
+            try:
+                results[site] = process_site(site, site_files[site], workers)
+            except Exception as e:
+                results[site] = e
+        return results
+
+    site_workers = max(1, workers // len(sites))
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(len(sites), workers)) as pool:
+        futures = {site: pool.submit(process_site, site, site_files[site], site_workers) for site in sites}
+        for site, future in futures.items():
+            try:
+                results[site] = future.result()
+            except Exception as e:
+                results[site] = e
+    return results
+
+
+def describe_report(report):
+    text = f"Processed {report['rows']:,} cases in {report['seconds']}s"
+    if report["mode"] == "streaming":
+        text += (
+            f" as {report['chunks']} chunks sized for a {report['budget_mb']} MB budget "
+            f"(largest chunk {report['peak_working_mb']} MB)"
+        )
+        if report["over_budget_chunks"]:
+            text += f"; {report['over_budget_chunks']} chunks went over the budget"
+    else:
+        text += f" in memory (working set {report['peak_working_mb']} MB)"
+    if report["workers"] > 1:
+        text += f", {report['partitions']} Year/Month partitions across {report['workers']} worker processes"
+    if report["peak_rss_mb"] is not None:
+        text += f"; process peak {report['peak_rss_mb']:.0f} MB"
+    return text + "."
@@ -0,0 +1,168 @@
+import csv
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils.settings import PROCEDURE_RULES_PATH
+
+# Reclassification rules applied to Primary Procedure text after the specialty
+# is mapped. A rule fires when its keyword (or regex) occurs in the procedure,
+# case-insensitively, and the current specialty is one of its specialties (any
+# specialty when none are listed). Of the rules that fire, the highest priority
+# wins. "{specialty}" in the result is replaced with the current specialty.
+DEFAULT_RULES = [
+    {
+        "pattern": "robot",
+        "regex": False,
+        "specialties": ["ACS", "CRS", "GYN", "GYNONC", "HBS", "MIS", "URO", "THO"],
+        "result": "ROT-{specialty}",
+        "priority": 20,
+    },
+    {
+        "pattern": "burn",
+        "regex": False,
+        "specialties": ["PLAS"],
+        "result": "BURNS",
+        "priority": 10,
+    },
+]
+
+
+def _specialty_list(value):
+    if value is None:
+        return []
+    items = value if isinstance(value, (list, tuple, set)) else re.split(r"[,;|]", str(value))
+    return [str(item).strip().upper() for item in items if str(item).strip()]
+
+
+def _flag(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def load_rules(path=None):
+    """Read rules from a CSV (Pattern, Regex, Specialties, Result, Priority) or JSON file."""
+    path = PROCEDURE_RULES_PATH if path is None else path
+    if not path:
+        return DEFAULT_RULES
+    if path.lower().endswith(".json"):
+        with open(path) as handle:
+            rows = json.load(handle)
+    else:
+        with open(path, newline="") as handle:
+            rows = [{key.strip().lower(): value for key, value in row.items()} for row in csv.DictReader(handle)]
+    return [
+        {
+            "pattern": row["pattern"],
+            "regex": row.get("regex") if isinstance(row.get("regex"), bool) else _flag(row.get("regex", "")),
+            "specialties": _specialty_list(row.get("specialties")),
+            "result": row["result"],
+            "priority": int(row.get("priority") or 0),
+        }
+        for row in rows
+    ]
+
+
+def _trie_pattern(words):
+    """A regex matching any of the words, shaped as a trie so a position is tested once, not once per word."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+
+class ProcedureRules:
+    """Rules compiled into one case-insensitive keyword matcher.
+
+    Keywords of all rules are merged into a single trie-shaped pattern, so
+    scanning a procedure costs about the same however many rules there are;
+    only regex rules are tested one by one. Procedure texts and (text,
+    specialty) pairs repeat heavily, so texts are scanned once each and
+    rules are resolved once per distinct pair.
+    """
+
+    def __init__(self, rules):
+        # Highest priority first
+        self.rules = sorted(rules, key=lambda rule: -int(rule.get("priority", 0)))
+        self.specialties = [set(_specialty_list(rule.get("specialties"))) for rule in self.rules]
+
+        self.keyword_rules = {}
+        self.regex_rules = []
+        for index, rule in enumerate(self.rules):
+            if rule.get("regex"):
+                self.regex_rules.append((index, re.compile(rule["pattern"], re.IGNORECASE)))
+            else:
+                self.keyword_rules.setdefault(rule["pattern"].lower(), []).append(index)
+        # Longest keyword at each position (a lookahead, so overlapping keywords are all seen);
+        # shorter keywords starting there are its prefixes
+        self.keyword_pattern = (
+            re.compile(f"(?=({_trie_pattern(self.keyword_rules)}))", re.IGNORECASE) if self.keyword_rules else None
+        )
+        self.keyword_lengths = sorted({len(keyword) for keyword in self.keyword_rules})
+
+    @classmethod
+    def load(cls, path=None):
+        return cls(load_rules(path))
+
+    def matches(self, text):
+        """Indexes of the rules whose keyword or regex occurs in the text, in priority order."""
+        found = set()
+        if self.keyword_pattern is not None:
+            for match in self.keyword_pattern.finditer(text):
+                longest = match.group(1).lower()
+                for length in self.keyword_lengths:
+                    if length > len(longest):
+                        break
+                    found.update(self.keyword_rules.get(longest[:length], ()))
+        for index, pattern in self.regex_rules:
+            if pattern.search(text):
+                found.add(index)
+        return sorted(found)
+
+    def apply(self, procedures, specialties):
+        """Return the specialties after applying the first firing rule to each case."""
+        specialties = pd.Series(specialties).reset_index(drop=True)
+        procedures = pd.Series(procedures).reset_index(drop=True)
+        if not self.rules or specialties.empty:
+            return specialties
+
+        text_codes, texts = pd.factorize(procedures)
+        specialty_codes, specialty_values = pd.factorize(specialties)
+        candidates = [self.matches(str(text)) for text in texts]
+
+        # Resolve each distinct (text, specialty) pair that has a candidate rule
+        valid = (text_codes >= 0) & (specialty_codes >= 0)
+        has_candidates = np.array([bool(found) for found in candidates] + [False])
+        rows = np.flatnonzero(valid & has_candidates[text_codes])
+        if rows.size == 0:
+            return specialties
+        pair_keys = text_codes[rows].astype(np.int64) * len(specialty_values) + specialty_codes[rows]
+        pair_codes, pairs = pd.factorize(pair_keys)
+
+        outcomes = []
+        for pair in pairs:
+            text_code, specialty_code = divmod(int(pair), len(specialty_values))
+            specialty = specialty_values[specialty_code]
+            outcome = specialty
+            for index in candidates[text_code]:
+                if not self.specialties[index] or specialty in self.specialties[index]:
+                    outcome = self.rules[index]["result"].replace("{specialty}", str(specialty))
+                    break
+            outcomes.append(outcome)
+
+        result = specialties.copy()
+        result.iloc[rows] = np.array(outcomes, dtype=object)[pair_codes]
+        return result
@@ -0,0 +1,187 @@
+import hashlib
+from datetime import datetime
+
+import pandas as pd
+
+from utils.manifest import get_manifest, manifest_from_summary, merge_manifest_summaries, summarize_manifest
+from utils.occupancy import OCCUPANCY_COLUMNS, occupancy_cube
+from utils.settings import DEFAULT_SITE
+from utils.sketch import SKETCH_COLUMNS, build_surgeon_sketches
+from utils.store_codec import concat_encoded, encode_frame, decode_frame
+from utils import warehouse
+
+# Position of each processed row in the uploaded elective-cases dataset
+SOURCE_ROW = "_source_row"
+
+# Source columns that processing rewrites in place (parsed to datetimes)
+REPLACED_COLUMNS = ["Patient In Room Date/Time"]
+
+SOURCE_KEYS = ["nu", "sg", "dm"]
+
+
+def _site_key(site):
+    # Sites other than the default are part of the version, so identical uploads at two sites stay apart
+    return f"|site:{site}" if site and site != DEFAULT_SITE else ""
+
+
+def processed_version(source_versions, site=None):
+    key = "|".join(f"{name}:{source_versions.get(name)}" for name in SOURCE_KEYS) + _site_key(site)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def derived_columns(total_columns, nu_columns):
+    return [
+        column for column in total_columns
+        if column != SOURCE_ROW and (column not in nu_columns or column in REPLACED_COLUMNS)
+    ]
+
+
+def _sum_parts(parts, keys, values, columns):
+    # Cube cells and sketch buckets add up across chunks
+    frames = [part for part in parts if not part.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    combined = pd.concat(frames, ignore_index=True).groupby(keys, as_index=False)[values].sum()
+    return combined[columns]
+
+
+class ChunkSummary:
+    """The parts of a site's processed store, combined as chunks of processed cases arrive.
+
+    Each chunk's store columns are kept encoded, its row hashes only in a
+    running digest and everything else merged into the aggregates after
+    every chunk, so the summary grows with the encoded store, not with the
+    cases processed.
+    """
+
+    def __init__(self, nu_columns, site=None):
+        self.nu_columns = nu_columns
+        self.site = site
+        self.rows = 0
+        self.derived = []
+        self.manifest = None
+        self.occupancy = pd.DataFrame(columns=OCCUPANCY_COLUMNS)
+        self.surgeon_sketches = pd.DataFrame(columns=SKETCH_COLUMNS)
+        self.digest = hashlib.sha1(_site_key(site).encode())
+
+    def add(self, total_chunk):
+        self.rows += len(total_chunk)
+        self.derived.append(
+            encode_frame(total_chunk[[SOURCE_ROW] + derived_columns(total_chunk.columns, self.nu_columns)])
+        )
+        manifest = summarize_manifest(total_chunk)
+        self.manifest = manifest if self.manifest is None else merge_manifest_summaries([self.manifest, manifest])
+        self.occupancy = _sum_parts(
+            [self.occupancy, occupancy_cube(total_chunk)], OCCUPANCY_COLUMNS[:-1], ["OccupiedMinutes"], OCCUPANCY_COLUMNS
+        )
+        self.surgeon_sketches = _sum_parts(
+            [self.surgeon_sketches, build_surgeon_sketches(total_chunk)], SKETCH_COLUMNS[:-2], ["Count", "Minutes"], SKETCH_COLUMNS
+        )
+        # Same as dataset_version() over the whole table, since row hashes are per row
+        self.digest.update(pd.util.hash_pandas_object(total_chunk.drop(columns=SOURCE_ROW), index=False).values.tobytes())
+
+
+def assemble_processed(summary, columns, source_versions, overrides=None):
+    """Build a site's processed store from the ChunkSummary of its processed cases.
+
+    Only the columns processing added or rewrote are stored, together with the
+    source row each processed row came from; everything else is read back from
+    the elective-cases upload named in the lineage.
+    """
+    derived = concat_encoded(summary.derived)
+    sources = {name: source_versions.get(name) for name in SOURCE_KEYS}
+    version = processed_version(sources, summary.site) if all(sources.values()) else summary.digest.hexdigest()[:12]
+    return {
+        "derived": derived,
+        "columns": columns,
+        "lineage": {
+            "version": version,
+            "site": summary.site or DEFAULT_SITE,
+            "method": "process",
+            "sources": sources,
+            "derived_columns": [column for column in derived["names"] if column != SOURCE_ROW],
+            "overrides": overrides,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+        "manifest": manifest_from_summary(summary.manifest, version),
+        "occupancy": encode_frame(summary.occupancy),
+        "surgeon_sketches": encode_frame(summary.surgeon_sketches),
+    }
+
+
+def build_processed(total_df, nu_df, source_versions, overrides=None, site=None):
+    """Describe a processed dataset by reference to the uploads it came from."""
+    columns = [column for column in total_df.columns if column != SOURCE_ROW]
+    summary = ChunkSummary(nu_df.columns, site)
+    summary.add(total_df)
+    return assemble_processed(summary, columns, source_versions, overrides)
+
+
+def store_version(processed_data):
+    # Stores saved before lineage existed only carry the manifest version
+    lineage = processed_data.get("lineage") or {}
+    return lineage.get("version") or (get_manifest(processed_data) or {}).get("version")
+
+
+def has_processed(processed_data):
+    return bool(processed_data) and any(key in processed_data for key in ("derived", "total", "warehouse"))
+
+
+def is_stale(shared_files, processed_data):
+    # The elective-cases upload changed since processing ran
+    if not has_processed(processed_data) or "derived" not in processed_data:
+        return False
+    expected = processed_data["lineage"]["sources"].get("nu")
+    current = (shared_files or {}).get("versions", {}).get("nu")
+    return not shared_files or "nu" not in shared_files or expected != current
+
+
+def _apply_patches(total_df, patches):
+    # Specialty overrides applied to the store since it was processed
+    if patches and patches["rows"]:
+        for column in ["Specialty", "Total Hours"]:
+            if column in total_df:
+                values = pd.Series(patches[column], dtype=total_df[column].dtype if column == "Total Hours" else object)
+                total_df.iloc[patches["rows"], total_df.columns.get_loc(column)] = values.to_numpy()
+    return total_df
+
+
+def load_total(shared_files, processed_data):
+    """Rebuild the processed case table, or return None when it cannot be rebuilt."""
+    if not has_processed(processed_data):
+        return None
+    if "total" in processed_data:
+        return _apply_patches(decode_frame(processed_data["total"]), processed_data.get("patches"))
+    if "warehouse" in processed_data or is_stale(shared_files, processed_data):
+        # Restored from, or only still available in, the database
+        version = store_version(processed_data)
+        return warehouse.load_frame(version) if warehouse.has_dataset(version) else None
+
+    nu_df = decode_frame(shared_files["nu"])
+    derived = decode_frame(processed_data["derived"])
+    total_df = nu_df.iloc[derived[SOURCE_ROW].to_numpy()].reset_index(drop=True)
+    for column in derived.columns.drop(SOURCE_ROW):
+        total_df[column] = derived[column]
+    return _apply_patches(total_df[processed_data["columns"]], processed_data.get("patches"))
+
+
+def dataset_versions(shared_files, processed_data):
+    """Return (dataset, capacity, revision) versions to query, saving the dataset if the database lacks it.
+
+    The revision identifies the specialty overrides applied to the dataset
+    since it was processed, which update it in place.
+    """
+    if not has_processed(processed_data):
+        return None
+    version = store_version(processed_data)
+    if not warehouse.has_dataset(version):
+        total_df = load_total(shared_files, processed_data)
+        if total_df is None:
+            return None
+        capacity = (shared_files or {}).get("versions", {}).get("dm")
+        dm_df = decode_frame(shared_files["dm"]) if capacity and "dm" in shared_files else None
+        warehouse.save_dataset(total_df, processed_data, dm_df, capacity)
+    capacity = warehouse.capacity_version(shared_files, version)
+    if capacity and "dm" in (shared_files or {}) and not warehouse.has_capacity(capacity):
+        warehouse.save_capacity(capacity, decode_frame(shared_files["dm"]))
+    return version, capacity, (processed_data.get("lineage") or {}).get("overrides")
@@ -0,0 +1,190 @@
+import argparse
+import base64
+import html
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.offline
+
+from utils import warehouse
+from utils.components import MONTH_NAMES
+from utils.manifest import describe_manifest, get_manifest
+from utils.settings import DEFAULT_SITE, REPORT_WORKERS
+from utils.sketch import filter_sketches
+from utils.specialty_charts import CASE_COLUMNS, box_plot_figure, surgeon_table, weekday_figures
+from utils.store_codec import decode_frame
+
+# Figures on each specialty page, in page order
+PAGE_FIGURES = ["utilization", "bidirectional", "box_plot"]
+
+IMAGE_SIZE = {"width": 1000, "height": 450}
+
+PAGE_STYLE = """
+body { font-family: Arial, sans-serif; margin: 0; }
+.page { padding: 24px 32px; page-break-after: always; break-after: page; }
+.page:last-child { page-break-after: auto; }
+.figure { margin-bottom: 12px; }
+.figure img { width: 100%; }
+table { border-collapse: collapse; font-size: 12px; width: 100%; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+"""
+
+
+def static_images_available():
+    # Static images need kaleido; without it pages embed interactive figures instead
+    return importlib.util.find_spec("kaleido") is not None
+
+
+def report_pages(version, capacity_version, processed_data, year=None, months=None):
+    """Inputs of every specialty's page, read from one aggregate set.
+
+    Weekday utilization, case minutes and surgeon statistics are each read
+    once for all specialties and split per specialty, instead of querying the
+    database once per specialty and chart.
+    """
+    manifest = get_manifest(processed_data)
+    specialties = list(manifest["specialties"]) if manifest else []
+    filters = dict(year=year, months=months)
+
+    weekday = warehouse.query_weekday_utilization_by_specialty(version, capacity_version, specialties, **filters)
+    cases = warehouse.query_cases(version, list(CASE_COLUMNS), **filters).rename(columns=CASE_COLUMNS)
+    cases_by_specialty = dict(tuple(cases.groupby("Specialty", sort=False)))
+
+    surgeons_by_specialty = {}
+    if processed_data and "surgeon_sketches" in processed_data:
+        sketches = filter_sketches(
+            decode_frame(processed_data["surgeon_sketches"]),
+            years=[int(year)] if year else None,
+            months=list(map(int, months)) if months else None,
+        )
+        if not sketches.empty:
+            surgeons = surgeon_table(sketches, ["Specialty", "Primary Surgeon"]).sort_values("Total Cases", ascending=False, kind="stable")
+            surgeons_by_specialty = {
+                specialty: group.drop(columns="Specialty").round(1)
+                for specialty, group in surgeons.groupby("Specialty", sort=False)
+            }
+
+    return [
+        {
+            "specialty": specialty,
+            "weekday": weekday[specialty],
+            "cases": cases_by_specialty.get(specialty, cases.iloc[:0]),
+            "surgeons": surgeons_by_specialty.get(specialty),
+        }
+        for specialty in specialties
+    ]
+
+
+def _figure_html(figure, image_format):
+    if image_format == "png":
+        image = base64.b64encode(figure.to_image(format="png", **IMAGE_SIZE)).decode()
+        return f'<img src="data:image/png;base64,{image}">'
+    return figure.to_html(full_html=False, include_plotlyjs=False, default_width="100%", default_height=f"{IMAGE_SIZE['height']}px")
+
+
+def render_page(page, image_format="html"):
+    """One specialty's report page as an HTML section; runs in a worker process."""
+    specialty = page["specialty"]
+    utilization_fig, bidirectional_fig = weekday_figures(page["weekday"], specialty)
+    figures = {
+        "utilization": utilization_fig,
+        "bidirectional": bidirectional_fig,
+        "box_plot": box_plot_figure(page["cases"], specialty),
+    }
+    parts = [f"<h2>{html.escape(str(specialty))}</h2>"]
+    parts += [f'<div class="figure">{_figure_html(figures[name], image_format)}</div>' for name in PAGE_FIGURES]
+    surgeons = page["surgeons"]
+    if surgeons is not None and not surgeons.empty:
+        parts.append("<h3>Primary Surgeon Stats</h3>")
+        parts.append(surgeons.to_html(index=False, border=0, na_rep=""))
+    return f'<section class="page">{"".join(parts)}</section>'
+
+
+def describe_period(year=None, months=None):
+    month_text = ", ".join(MONTH_NAMES[int(month) - 1] for month in sorted(months)) if months else "All months"
+    return f"{month_text} {year}" if year else month_text
+
+
+def render_report(version, capacity_version, processed_data, year=None, months=None, image_format=None, workers=None):
+    """Render every specialty's page into one printable HTML packet.
+
+    Pages are rendered in a process pool, one task per specialty, and joined
+    in specialty order; each page starts on a new sheet when printed, so
+    printing the packet to PDF gives one page per specialty. Figures are PNG
+    images when kaleido is installed and interactive plotly figures (with
+    plotly.js included once) otherwise.
+
+    Returns the packet as bytes and a report with the page count, image
+    format, worker count and seconds taken.
+    """
+    start_time = time.perf_counter()
+    image_format = image_format or ("png" if static_images_available() else "html")
+    pages = report_pages(version, capacity_version, processed_data, year, months)
+
+    workers = workers or REPORT_WORKERS or os.cpu_count() or 1
+    workers = max(1, min(workers, len(pages)))
+    if workers == 1:
+        sections = [render_page(page, image_format) for page in pages]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sections = list(pool.map(render_page, pages, [image_format] * len(pages)))
+
+    title = f"Specialty Utilization Report: {describe_period(year, months)}"
+    script = f"<script>{plotly.offline.get_plotlyjs()}</script>" if image_format == "html" else ""
+    document = (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>"
+        f"<style>{PAGE_STYLE}</style>{script}</head><body>"
+        f'<section class="page"><h1>{html.escape(title)}</h1><p>{html.escape(describe_manifest(get_manifest(processed_data)))}</p>'
+        f"<p>{len(pages)} specialties, one per page.</p></section>"
+        f"{''.join(sections)}</body></html>"
+    )
+    report = {
+        "pages": len(pages),
+        "format": image_format,
+        "workers": workers,
+        "seconds": time.perf_counter() - start_time,
+    }
+    return document.encode(), report
+
+
+def describe_report(report):
+    figures = "static images" if report["format"] == "png" else "interactive figures"
+    text = (
+        f"Rendered {report['pages']} specialty pages with {figures} in {report['seconds']:.1f}s "
+        f"using {report['workers']} worker{'s' if report['workers'] != 1 else ''}."
+    )
+    if report["format"] == "html":
+        if not static_images_available():
+            text += " kaleido isn't installed, so figures can't be saved as images."
+        text += " Print the packet to PDF from the browser for one page per specialty."
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the specialty report packet for the current dataset in the database.")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--months", type=int, nargs="+")
+    parser.add_argument("--format", choices=["png", "html"], help="figure format (default: png when kaleido is installed)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: BLOCKTIME_REPORT_WORKERS or every core)")
+    parser.add_argument("--site", default=DEFAULT_SITE, help=f"site to report on (default: {DEFAULT_SITE})")
+    parser.add_argument("--output", default="specialty_report.html")
+    args = parser.parse_args()
+
+    processed_data = warehouse.current_store(args.site)
+    if processed_data is None:
+        raise SystemExit(f"The database holds no processed dataset for {args.site}. Process the data in the dashboard first.")
+    version = processed_data["warehouse"]
+    document, report = render_report(
+        version, warehouse.capacity_version(None, version), processed_data,
+        args.year, args.months, args.format, args.workers,
+    )
+    with open(args.output, "wb") as handle:
+        handle.write(document)
+    print(f"{describe_report(report)} Saved to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+
+from flask import Response, request
+from flask_caching import Cache
+
+from utils.settings import RESPONSE_CACHE_ENTRIES, RESPONSE_COMPRESSION_LEVEL, RESPONSE_COMPRESSION_MIN_BYTES
+
+CALLBACK_PATH = "/_dash-update-component"
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+    "image/svg+xml",
+)
+
+# Dashboard outputs whose callbacks depend only on their request: the store lineage
+# names the dataset version and revision, and saved datasets never change under a
+# version, so an identical request always gets an identical response. Callbacks that
+# upload, process, write to the database or download are never cached.
+CACHEABLE_OUTPUTS = {
+    "site-filter",
+    "year-filter",
+    "month-filter",
+    "overview-dataset-summary",
+    "utilization-rate-line",
+    "utilization-rate-bar",
+    "trend-specialty",
+    "utilization-trend",
+    "specialty-filter",
+    "specialty-utilization-bar",
+    "occupancy-heatmap",
+    "surgeon-table",
+    "turnover-room-bar",
+}
+
+cache = Cache()
+
+
+def _output_ids(outputs):
+    outputs = outputs if isinstance(outputs, list) else [outputs]
+    for output in outputs:
+        if isinstance(output, list):
+            yield from _output_ids(output)
+        elif isinstance(output, dict):
+            yield output.get("id")
+
+
+def _callback_key():
+    """Cache key for a dashboard callback request, or None when it isn't cacheable."""
+    if request.method != "POST" or not request.path.endswith(CALLBACK_PATH):
+        return None
+    # Parsed once here; Dash reads the same cached body
+    body = request.get_json(silent=True, cache=True)
+    if not isinstance(body, dict) or not any(
+        output in CACHEABLE_OUTPUTS for output in _output_ids(body.get("outputs"))
+    ):
+        return None
+    return "callback:" + hashlib.sha1(request.get_data(cache=True)).hexdigest()
+
+
+def _accepts_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "").lower()
+
+
+def _compress(response):
+    if (
+        response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+        or not _accepts_gzip()
+    ):
+        return response
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    etag, weak = response.get_etag()
+    # Tagged bodies (assets, component bundles, layout) repeat, so compress each once
+    key = f"gzip:{etag}" if etag and not weak else None
+    compressed = cache.get(key) if key else None
+    if compressed is None:
+        compressed = gzip.compress(data, compresslevel=RESPONSE_COMPRESSION_LEVEL, mtime=0)
+        if key:
+            cache.set(key, compressed)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    # The compressed bytes differ from the identity ones the tag was computed over
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(server):
+    """Compress responses, tag GET responses for revalidation and cache dashboard callbacks.
+
+    Browsers don't revalidate the POST requests Dash sends for callbacks, so
+    those are short-circuited on the server: an identical dashboard request
+    is answered from the response cache without running the callback. GET
+    responses (layout, dependencies, assets and component bundles) carry an
+    ETag and are answered with 304 Not Modified when the client has them.
+    """
+    cache.init_app(
+        server,
+        config={"CACHE_TYPE": "SimpleCache", "CACHE_THRESHOLD": RESPONSE_CACHE_ENTRIES, "CACHE_DEFAULT_TIMEOUT": 0},
+    )
+
+    @server.before_request
+    def cached_callback():
+        key = _callback_key() if RESPONSE_CACHE_ENTRIES > 0 else None
+        if key is None:
+            return None
+        body = cache.get(key)
+        if body is None:
+            request.environ["blocktime.cache_key"] = key
+            return None
+        response = Response(body, mimetype="application/json")
+        response.headers["X-Response-Cache"] = "hit"
+        return response
+
+    @server.after_request
+    def finish_response(response):
+        key = request.environ.pop("blocktime.cache_key", None)
+        if key is not None and response.status_code == 200 and response.mimetype == "application/json":
+            cache.set(key, response.get_data())
+            response.headers["X-Response-Cache"] = "miss"
+
+        if request.method == "GET" and response.status_code == 200:
+            if not response.get_etag()[0]:
+                response.direct_passthrough = False
+                response.add_etag()
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        return _compress(response)
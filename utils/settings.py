@@ -0,0 +1,61 @@
+import os
+
+# Runtime settings, overridable through environment variables
+
+# Compression applied to dcc.Store payloads: "zlib" or "none"
+STORE_COMPRESSION = os.environ.get("BLOCKTIME_STORE_COMPRESSION", "zlib")
+
+# Rows per separately encoded block of a dcc.Store payload, so large uploads can be
+# decoded a block at a time; zero keeps every payload in one block
+STORE_BLOCK_ROWS = int(os.environ.get("BLOCKTIME_STORE_BLOCK_ROWS", "5000"))
+
+# First calendar month of the fiscal year (7 = July); fiscal years are named by their end year
+FISCAL_YEAR_START_MONTH = int(os.environ.get("BLOCKTIME_FISCAL_YEAR_START_MONTH", "7"))
+
+# Holidays removed from available capacity: a named calendar ("us_federal" or "none")
+# plus extra comma-separated YYYY-MM-DD dates
+HOLIDAY_CALENDAR = os.environ.get("BLOCKTIME_HOLIDAY_CALENDAR", "us_federal")
+EXTRA_HOLIDAYS = [day.strip() for day in os.environ.get("BLOCKTIME_HOLIDAYS", "").split(",") if day.strip()]
+
+# Gaps between consecutive cases in a room up to this many minutes count as turnover;
+# longer gaps count as idle time
+TURNOVER_MAX_MINUTES = int(os.environ.get("BLOCKTIME_TURNOVER_MAX_MINUTES", "90"))
+
+# Site of uploads that don't name one, and of datasets saved before sites existed
+DEFAULT_SITE = os.environ.get("BLOCKTIME_DEFAULT_SITE", "Main")
+
+# SQLite file holding processed datasets for the dashboards, and how many datasets it keeps
+DATABASE_PATH = os.environ.get("BLOCKTIME_DATABASE", "blocktime.sqlite3")
+DATABASE_KEEP_VERSIONS = int(os.environ.get("BLOCKTIME_DATABASE_KEEP_VERSIONS", "3"))
+
+# Optional CSV or JSON file of procedure-keyword reclassification rules; the built-in
+# robotic and burns rules apply when unset
+PROCEDURE_RULES_PATH = os.environ.get("BLOCKTIME_PROCEDURE_RULES", "")
+
+# Memory budget in MB for processing elective cases; above zero, cases are processed
+# in chunks that stay within it instead of all at once
+PROCESSING_MEMORY_MB = int(os.environ.get("BLOCKTIME_PROCESSING_MEMORY_MB", "0"))
+
+# gzip level for compressed responses, and the smallest response worth compressing in bytes
+RESPONSE_COMPRESSION_LEVEL = int(os.environ.get("BLOCKTIME_RESPONSE_COMPRESSION_LEVEL", "6"))
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("BLOCKTIME_RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+
+# Dashboard callback responses kept for identical requests; zero turns the cache off
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("BLOCKTIME_RESPONSE_CACHE_ENTRIES", "128"))
+
+# Specialty-ordered case indexes kept in memory per process, one per dataset version;
+# zero builds the index on every request
+CASE_INDEX_ENTRIES = int(os.environ.get("BLOCKTIME_CASE_INDEX_ENTRIES", "8"))
+
+# Worker processes rendering specialty report pages; zero uses every core
+REPORT_WORKERS = int(os.environ.get("BLOCKTIME_REPORT_WORKERS", "0"))
+
+# Worker processes for processing large case sets in Year/Month partitions; zero uses
+# every core and one processes everything in the calling process
+PROCESSING_WORKERS = int(os.environ.get("BLOCKTIME_PROCESSING_WORKERS", "0"))
+
+# JSON API: query results kept for identical queries (zero turns the cache off), and the
+# default and largest page sizes
+API_CACHE_ENTRIES = int(os.environ.get("BLOCKTIME_API_CACHE_ENTRIES", "256"))
+API_PAGE_SIZE = int(os.environ.get("BLOCKTIME_API_PAGE_SIZE", "100"))
+API_MAX_PAGE_SIZE = int(os.environ.get("BLOCKTIME_API_MAX_PAGE_SIZE", "1000"))
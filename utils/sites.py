@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from utils.manifest import get_manifest, merge_manifests
+from utils.processed import dataset_versions, is_stale
+from utils.settings import DEFAULT_SITE
+from utils.utilization import WEEKDAYS
+
+# The upload and processed stores hold one part per site, {"sites": {site: part}},
+# where each part has the shape a store had before sites existed. Such older
+# stores are read as the DEFAULT_SITE's part. Dashboards show one site, or roll
+# every site up by adding the sites' aggregates; raw cases are never combined.
+
+# site-filter value of the rollup across every site
+ALL_SITES = "__all__"
+
+HOUR_COLUMNS = ["TotalPatientInRoomHours", "TotalAvailableHours"]
+
+
+def site_parts(store):
+    if not store:
+        return {}
+    if "sites" in store:
+        return store["sites"]
+    return {DEFAULT_SITE: store}
+
+
+def with_site(store, site, part):
+    """A copy of the store with one site's part replaced."""
+    sites = dict(site_parts(store))
+    sites[site] = part
+    return {"sites": sites}
+
+
+def site_names(*stores):
+    return sorted(set().union(*(site_parts(store) for store in stores)))
+
+
+def selected_sites(store, site=None):
+    """The sites of a store a site-filter value selects: that site, or every site for the rollup."""
+    parts = site_parts(store)
+    if site and site != ALL_SITES:
+        return [site] if site in parts else []
+    return sorted(parts)
+
+
+def is_rollup(store, site=None):
+    return len(selected_sites(store, site)) > 1
+
+
+def site_manifest(processed_data, site=None):
+    parts = site_parts(processed_data)
+    return merge_manifests([get_manifest(parts[name]) for name in selected_sites(processed_data, site)])
+
+
+def stale_sites(shared_files, processed_data, site=None):
+    # Selected sites whose elective cases were uploaded again after processing
+    files, parts = site_parts(shared_files), site_parts(processed_data)
+    return [name for name in selected_sites(processed_data, site) if is_stale(files.get(name), parts[name])]
+
+
+def site_versions(shared_files, processed_data, site=None):
+    """[(site, (dataset, capacity, revision))] for the selected sites, saving any dataset the database lacks."""
+    files, parts = site_parts(shared_files), site_parts(processed_data)
+    selected = []
+    for name in selected_sites(processed_data, site):
+        versions = dataset_versions(files.get(name), parts[name])
+        if versions is not None:
+            selected.append((name, versions))
+    return selected
+
+
+def sum_frames(frames, keys, values):
+    """Add up the values of several sites' aggregates over keys; a single frame is returned as it is."""
+    nonempty = [frame for frame in frames if not frame.empty]
+    if len(nonempty) == 1:
+        return nonempty[0]
+    if not nonempty:
+        return frames[0] if frames else pd.DataFrame(columns=keys + values)
+    return pd.concat(nonempty, ignore_index=True).groupby(keys, as_index=False, sort=True, observed=True)[values].sum()
+
+
+def combine_utilization(frames, keys):
+    """Sites' patient and available hours added up over keys, with the utilization rate recomputed.
+
+    Each site's available hours were already matched to its own cases, so
+    the sums are the rollup's hours.
+    """
+    combined = sum_frames(frames, keys, HOUR_COLUMNS)
+    if len([frame for frame in frames if not frame.empty]) <= 1:
+        return combined
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = combined["TotalPatientInRoomHours"] / combined["TotalAvailableHours"] * 100
+    combined["UtilizationRate"] = rates.where(combined["TotalAvailableHours"] > 0)
+    return combined
+
+
+def combine_weekdays(frames):
+    """Sites' weekday utilization added up, in weekday order."""
+    combined = combine_utilization(frames, ["Weekday"])
+    order = {day: index for index, day in enumerate(WEEKDAYS)}
+    return combined.sort_values("Weekday", key=lambda days: days.map(order), ignore_index=True)
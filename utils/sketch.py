@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Log-bucketed quantile sketch: every value in a bucket is within RELATIVE_ACCURACY
+# of the bucket's representative value, and sketches merge by adding bucket counts.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = np.log(GAMMA)
+ZERO_BUCKET = -(2 ** 31)  # Holds zero and negative values
+
+SKETCH_COLUMNS = ["Primary Surgeon", "Specialty", "Year", "Month", "Bucket", "Count", "Minutes"]
+
+
+def bucket_index(values):
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        buckets = np.ceil(np.log(values) / LOG_GAMMA)
+    return np.where(values > 0, buckets, ZERO_BUCKET).astype(np.int64)
+
+
+def bucket_value(buckets):
+    buckets = np.asarray(buckets, dtype=np.int64)
+    values = 2 * np.power(GAMMA, buckets.astype(float)) / (GAMMA + 1)
+    return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+
+def build_surgeon_sketches(total_df):
+    """Bucket counts of in-room minutes per surgeon, specialty and month.
+
+    Each row also carries the exact minutes summed in its bucket, so case
+    counts and means stay exact while quantiles are approximate.
+    """
+    required = ["Primary Surgeon", "Specialty", "Year", "Month", "Total Patient In Room Minutes"]
+    if not all(column in total_df for column in required):
+        return pd.DataFrame(columns=SKETCH_COLUMNS)
+
+    cases = total_df[required].dropna()
+    minutes = pd.to_numeric(cases["Total Patient In Room Minutes"], errors="coerce")
+    cases = cases.assign(Bucket=bucket_index(minutes), Minutes=minutes).dropna(subset=["Minutes"])
+    return (
+        cases.groupby(["Primary Surgeon", "Specialty", "Year", "Month", "Bucket"], as_index=False, sort=False)
+        .agg(Count=("Minutes", "size"), Minutes=("Minutes", "sum"))
+        .astype({"Year": int, "Month": int})
+    )
+
+
+def filter_sketches(sketches, years=None, months=None, specialty=None):
+    if years is not None:
+        sketches = sketches[sketches["Year"].isin(years)]
+    if months is not None:
+        sketches = sketches[sketches["Month"].isin(months)]
+    if specialty:
+        sketches = sketches[sketches["Specialty"] == specialty]
+    return sketches
+
+
+def sketch_stats(sketches, by, quantiles=(0.5, 0.9, 0.95)):
+    """Merge sketches per group and return case count, mean and quantiles.
+
+    Quantiles are read from the merged bucket counts of each group with one
+    searchsorted over the cumulative counts of all groups.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    merged = (
+        sketches.groupby(by + ["Bucket"], as_index=False, sort=True)[["Count", "Minutes"]].sum()
+    )
+    stats = merged.groupby(by, as_index=False, sort=False).agg(Cases=("Count", "sum"), Minutes=("Minutes", "sum"))
+    stats["Mean"] = stats["Minutes"] / stats["Cases"]
+
+    # Group boundaries in the sorted bucket rows
+    group_sizes = merged.groupby(by, sort=False).size().to_numpy()
+    group_ends = np.cumsum(group_sizes)
+    cumulative = np.cumsum(merged["Count"].to_numpy())
+    before_group = np.concatenate([[0], cumulative[group_ends[:-1] - 1]]) if len(group_ends) else np.array([])
+    buckets = merged["Bucket"].to_numpy()
+
+    for quantile in quantiles:
+        rank = np.floor(quantile * (stats["Cases"].to_numpy() - 1))
+        positions = np.searchsorted(cumulative, before_group + rank, side="right")
+        stats[f"P{int(round(quantile * 100))}"] = bucket_value(buckets[positions])
+    return stats.drop(columns="Minutes")
@@ -0,0 +1,168 @@
+import plotly.express as px
+import plotly.graph_objects as go
+
+from utils.sketch import sketch_stats
+
+# Case columns read for the box plot, by their database name
+CASE_COLUMNS = {
+    "specialty": "Specialty",
+    "year": "Year",
+    "month": "Month",
+    "minutes": "Total Patient In Room Minutes",
+}
+
+# Surgeon table columns, by their sketch_stats name
+SURGEON_COLUMNS = {
+    "Cases": "Total Cases",
+    "Mean": "Mean Patient Time",
+    "P50": "Median Patient Time",
+    "P90": "P90 Patient Time",
+    "P95": "P95 Patient Time",
+}
+
+
+def weekday_figures(weekday_df, selected_specialty=None):
+    """Utilization bar and patient-vs-available bidirectional bar from weekday utilization."""
+    # Create the bidirectional bar chart
+    bidirectional_fig = go.Figure()
+
+    # Add left bar
+    bidirectional_fig.add_trace(
+        go.Bar(
+            y=weekday_df["Weekday"],
+            x=-weekday_df["TotalPatientInRoomHours"],
+            name="Total Patient In Room Hours",
+            orientation="h",
+            marker=dict(color="lightblue"),
+        )
+    )
+
+    # Add right bar
+    bidirectional_fig.add_trace(
+        go.Bar(
+            y=weekday_df["Weekday"],
+            x=weekday_df["TotalAvailableHours"],
+            name="Total Available Hours",
+            orientation="h",
+            marker=dict(color="lightgreen"),
+        )
+    )
+
+    # Update layout for bidirectional bar chart
+    max_patient = weekday_df["TotalPatientInRoomHours"].max()
+    max_available = weekday_df["TotalAvailableHours"].max()
+    bidirectional_fig.update_layout(
+        title="Bidirectional Bar Chart: Total Patient In Room Hours vs. Total Available Hours",
+        yaxis=dict(
+            title="Weekday",
+            categoryorder="array",  # Order by a custom array
+            categoryarray=["Friday" , "Thursday", "Wednesday", "Tuesday", "Monday"],  # Explicit ordering
+        ),
+        xaxis=dict(
+            title="Hours",
+            tickmode="array",
+            tickvals=[-max_patient, 0, max_available],
+            ticktext=[
+                f"{max_patient:,.0f} (Patient)",
+                "0",
+                f"{max_available:,.0f} (Available)",
+            ],
+        ),
+        barmode="relative",
+        bargap=0.1,
+        legend=dict(title="Metric"),
+    )
+
+    # Create the first bar chart for Utilization Rate
+    hover_data = {
+        "Weekday": True,
+        "TotalPatientInRoomHours": ":.2f",
+        "TotalAvailableHours": ":.2f",
+        "UtilizationRate": ":.2f",
+    }
+
+    utilization_bar_fig = px.bar(
+        weekday_df,
+        x="Weekday",
+        y="UtilizationRate",
+        color="Weekday",
+        hover_data=hover_data,
+        title=f"Utilization Rate by Weekday for {selected_specialty if selected_specialty else 'All Specialties'}",
+        labels={
+            "UtilizationRate": "Utilization Rate (%)",
+            "TotalPatientInRoomHours": "Patient In Room Hours",
+            "TotalAvailableHours": "Available Hours",
+        },
+    )
+
+    utilization_bar_fig.update_layout(
+        xaxis=dict(
+        categoryorder="array",
+        categoryarray=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+        ),
+        xaxis_title="Weekday",
+        yaxis_title="Utilization Rate (%)",
+        legend_title="Day",
+        showlegend=False,
+    )
+    return utilization_bar_fig, bidirectional_fig
+
+
+def box_plot_figure(df, selected_specialty=None):
+    """Box plot of patient in room minutes per Month-Year from CASE_COLUMNS cases."""
+    # Add metrics annotations for each box (mean/median values)
+    df = df.assign(**{"Month-Year": df["Month"].astype("Int64").astype(str) + "-" + df["Year"].astype("Int64").astype(str)})  # Combine Month-Year
+
+    # Create the box plot
+    box_plot = px.box(
+        df,
+        x="Specialty",
+        y="Total Patient In Room Minutes",
+        points="all",
+        color="Month-Year",
+        title=f"Distribution of Patient In Room Hours for {selected_specialty if selected_specialty else 'All Specialties'}",
+        labels={"Total Patient In Room Minutes": "Patient In Room Hours (Minutes)"},
+    )
+
+    for specialty in df["Specialty"].unique():
+        specialty_data = df[df["Specialty"] == specialty]["Total Patient In Room Minutes"]
+        median = specialty_data.median()
+        mean = specialty_data.mean()
+
+        # Add annotation for median
+        box_plot.add_trace(
+            go.Scatter(
+                x=[specialty],
+                y=[median],
+                mode="markers+text",
+                text=[f"Median: {median:.2f}"],
+                textposition="top center",
+                marker=dict(color="black", size=10, symbol="diamond"),
+                showlegend=False,
+            )
+        )
+
+        # Add annotation for mean
+        box_plot.add_trace(
+            go.Scatter(
+                x=[specialty],
+                y=[mean],
+                mode="markers+text",
+                text=[f"Mean: {mean:.2f}"],
+                textposition="bottom center",
+                marker=dict(color="blue", size=8, symbol="circle"),
+                showlegend=False,
+            )
+        )
+
+    box_plot.update_layout(
+        yaxis_title="Patient In Room Minutes",
+        xaxis_title="Specialty",
+        yaxis=dict(tickformat=".0f"),
+    )
+    return box_plot
+
+
+def surgeon_table(sketches, by="Primary Surgeon"):
+    """Surgeon case counts, mean and percentile times from surgeon sketches, with display column names."""
+    return sketch_stats(sketches, by).rename(columns=SURGEON_COLUMNS)
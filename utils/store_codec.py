@@ -0,0 +1,208 @@
+import base64
+import json
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from utils.settings import STORE_BLOCK_ROWS, STORE_COMPRESSION
+
+FORMAT = "columnar-v2"
+
+# Payload formats still read: columnar-v1 kept all rows in a single block
+FORMATS = ("columnar-v1", FORMAT)
+
+# Text columns with at most this share of distinct values are dictionary-encoded
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def _nullable_list(series):
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _json_scalar(value):
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def encode_column(series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return {"kind": "number", "dtype": str(series.dtype), "values": _nullable_list(series)}
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if series.dt.tz is not None:
+            series = series.dt.tz_localize(None)
+        nanos = series.values.astype("datetime64[ns]").astype("int64")
+        valid = series.notna().values
+        unit = "s" if (nanos[valid] % 10**9 == 0).all() else "ms"
+        scaled = nanos // (10**9 if unit == "s" else 10**6)
+        values = np.where(valid, scaled, 0).tolist()
+        return {"kind": "datetime", "unit": unit, "values": [v if ok else None for v, ok in zip(values, valid)]}
+
+    codes, categories = pd.factorize(series, use_na_sentinel=True)
+    categories = [_json_scalar(value) for value in categories]
+    if len(categories) <= DICTIONARY_MAX_RATIO * len(series):
+        return {"kind": "dictionary", "categories": categories, "codes": codes.tolist()}
+    return {"kind": "text", "values": [None if code < 0 else categories[code] for code in codes]}
+
+
+def decode_column(column):
+    kind = column["kind"]
+    if kind == "number":
+        dtype = column["dtype"]
+        if None in column["values"] and dtype not in ("float32", "float64"):
+            dtype = "float64" if dtype.startswith(("int", "uint")) else "object"
+        return pd.Series(column["values"], dtype=dtype)
+
+    if kind == "datetime":
+        return pd.to_datetime(pd.Series(column["values"], dtype="float64"), unit=column["unit"])
+
+    if kind == "dictionary":
+        codes = np.asarray(column["codes"], dtype=np.int64)
+        categories = np.asarray(column["categories"] + [None], dtype=object)
+        return pd.Series(categories[codes], dtype=object)
+
+    return pd.Series(column["values"], dtype=object)
+
+
+def _encode_columns(df):
+    return {
+        "names": [str(name) for name in df.columns],
+        "columns": [encode_column(df[name]) for name in df.columns],
+        "rows": len(df),
+    }
+
+
+def _pack(columns, compression):
+    if compression == "zlib":
+        return base64.b64encode(zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 6)).decode()
+    return columns
+
+
+def _unpack(block, compression):
+    if compression == "zlib":
+        return json.loads(zlib.decompress(base64.b64decode(block)))
+    return block
+
+
+def encode_frame(df, compression=STORE_COMPRESSION, block_rows=STORE_BLOCK_ROWS):
+    """Encode a DataFrame as column arrays for a dcc.Store.
+
+    Numbers keep their dtype, timestamps become epoch integers and repeated
+    text is dictionary-encoded. Rows are split into blocks of block_rows
+    (zero keeps them in one), each encoded on its own, so a large payload can
+    be decoded a block at a time. With compression every block is
+    zlib-compressed and base64-wrapped.
+    """
+    compression = "zlib" if compression == "zlib" else None
+    size = block_rows if block_rows and block_rows > 0 else max(len(df), 1)
+    parts = [df.iloc[start:start + size] for start in range(0, len(df), size)] or [df]
+    return {
+        "format": FORMAT,
+        "compression": compression,
+        "names": [str(name) for name in df.columns],
+        "rows": len(df),
+        "block_rows": [len(part) for part in parts],
+        "blocks": [_pack(_encode_columns(part), compression) for part in parts],
+    }
+
+
+def concat_encoded(payloads):
+    """Join encoded frames with the same columns into one payload, without decoding them."""
+    first = payloads[0]
+    for payload in payloads[1:]:
+        if payload["names"] != first["names"] or payload["compression"] != first["compression"]:
+            raise ValueError("Only payloads with the same columns and compression can be joined.")
+    return dict(
+        first,
+        rows=sum(payload["rows"] for payload in payloads),
+        block_rows=[rows for payload in payloads for rows in payload["block_rows"]],
+        blocks=[block for payload in payloads for block in payload["blocks"]],
+    )
+
+
+def encoded_bytes(payload):
+    return len(json.dumps(payload, separators=(",", ":")))
+
+
+def is_encoded(payload):
+    return isinstance(payload, dict) and payload.get("format") in FORMATS
+
+
+def _blocks(payload):
+    # Payloads written before blocks existed hold all rows in one
+    return payload["blocks"] if "blocks" in payload else [payload["data"]]
+
+
+def _decode_block(columns):
+    if not columns["names"]:
+        return pd.DataFrame(index=range(columns["rows"]))
+    return pd.DataFrame({name: decode_column(column) for name, column in zip(columns["names"], columns["columns"])})
+
+
+def decode_frame(payload):
+    """Decode a store payload into a DataFrame; plain record lists are also accepted."""
+    if payload is None:
+        return pd.DataFrame()
+    if not is_encoded(payload):
+        return pd.DataFrame(payload)
+
+    frames = [_decode_block(_unpack(block, payload["compression"])) for block in _blocks(payload)]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+class FrameReader:
+    """Decode a store payload a range of rows at a time.
+
+    read() decodes only the blocks the requested rows fall in, so a large
+    payload can be processed in chunks without ever holding all of it as a
+    DataFrame. Chunks are read in order, so the block last decoded is kept
+    (block_bytes) until a read moves past it; besides that only the
+    payload itself, still encoded, stays in memory. A payload written before
+    blocks existed is a single block. A DataFrame (or record list) is read
+    in slices of itself.
+    """
+
+    def __init__(self, payload):
+        self._cached = None
+        if payload is None or not is_encoded(payload):
+            frame = decode_frame(payload)
+            self.names, self.rows = list(frame.columns), len(frame)
+            self._frame, self._blocks = frame, None
+            return
+        self._frame, self._blocks, self._compression = None, _blocks(payload), payload["compression"]
+        if "block_rows" in payload:
+            self.names, self.rows, sizes = payload["names"], payload["rows"], payload["block_rows"]
+        else:
+            frame = self._block(0)
+            self.names, self.rows, sizes = list(frame.columns), len(frame), [len(frame)]
+        self._offsets = np.cumsum([0] + list(sizes))
+
+    @property
+    def block_bytes(self):
+        if self._cached is None:
+            return 0
+        return int(self._cached[1].memory_usage(index=True, deep=True).sum())
+
+    def _block(self, index):
+        if self._cached is None or self._cached[0] != index:
+            self._cached = None
+            self._cached = (index, _decode_block(_unpack(self._blocks[index], self._compression)))
+        return self._cached[1]
+
+    def read(self, start, stop):
+        if self._frame is not None:
+            return self._frame.iloc[start:stop]
+        stop = min(stop, self.rows)
+        first = min(max(int(np.searchsorted(self._offsets, start, side="right")) - 1, 0), len(self._blocks) - 1)
+        parts = []
+        for index in range(first, len(self._blocks)):
+            offset = self._offsets[index]
+            if parts and offset >= stop:
+                break
+            parts.append(self._block(index).iloc[max(start - offset, 0):max(stop - offset, 0)])
+        frame = parts[0] if len(parts) == 1 else pd.concat(parts)
+        return frame.set_axis(pd.RangeIndex(start, start + len(frame)))
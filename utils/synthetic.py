@@ -0,0 +1,112 @@
+import base64
+import io
+
+import numpy as np
+import pandas as pd
+
+from utils.ingest import AVAILABLE_TIME_SHEETS
+from utils.utilization import WEEKDAYS
+
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# (Department1, Division1, block service) of the synthetic surgeons
+SURGEON_SERVICES = [
+    ("SURGERY", "COLORECTAL", "CRS"),
+    ("SURGERY", "PLASTICS", "PLAS"),
+    ("SURGERY", "THORACIC", "THO"),
+    ("UROLOGY", None, "URO"),
+    ("OBSTETRICS AND GYNECOLOGY", "GYNECOLOGY ONCOLOGY", "GYNONC"),
+    ("ORTHOPEDICS", "HAND SERVICES", "ORT-HAND"),
+    ("OTOLARYNGOLOGY", None, "OTO"),
+]
+
+# Services with block time: the surgeons' plus those the procedure rules produce
+BLOCK_SERVICES = sorted({service for _, _, service in SURGEON_SERVICES} | {"BURNS", "ROT-CRS", "ROT-THO", "ROT-URO", "ROT-GYNONC"})
+
+PROCEDURES = [
+    "Robotic colectomy",
+    "Burn debridement",
+    "Knee arthroscopy",
+    "Hernia repair",
+    "Cystoscopy",
+    "Lobectomy",
+    "Carpal tunnel release",
+    "Septoplasty",
+]
+
+ROOMS = [f"OR {number:02d}" for number in range(1, 13)]
+
+
+def synthetic_datasets(cases=5000, surgeons=60, years=(2024,), seed=0):
+    """Random elective cases, surgeon directory and Available Time tables shaped like the real exports."""
+    rng = np.random.default_rng(seed)
+    services = [SURGEON_SERVICES[index % len(SURGEON_SERVICES)] for index in range(surgeons)]
+    sg_df = pd.DataFrame(
+        {
+            "Last Name": [f"Surgeon{index}" for index in range(surgeons)],
+            "First Name": [f"Test{index}" for index in range(surgeons)],
+            "MI": ["A" if index % 2 else None for index in range(surgeons)],
+            "Department1": [department for department, _, _ in services],
+            "Division1": [division for _, division, _ in services],
+        }
+    )
+    # One unknown surgeon, so some cases fall back to the dictionary
+    names = [f"Surgeon{index}, Test{index} A" if index % 2 else f"Surgeon{index}, Test{index}" for index in range(surgeons)]
+    names.append("Unlisted, Surgeon")
+
+    # Weekday case starts between 07:00 and 17:00
+    days = pd.bdate_range(f"{min(years)}-01-01", f"{max(years)}-12-31")
+    starts = days[rng.integers(len(days), size=cases)] + pd.to_timedelta(rng.integers(7 * 60, 17 * 60, size=cases), unit="min")
+    nu_df = pd.DataFrame(
+        {
+            "Case ID": np.arange(cases) + 100000,
+            "Primary Surgeon": np.array(names, dtype=object)[rng.integers(len(names), size=cases)],
+            "Surgical Specialty": rng.choice(["Urology", "General Surgery", "Orthopedics"], size=cases),
+            "Primary Procedure": rng.choice(PROCEDURES, size=cases),
+            "Patient In Room Date/Time": starts.strftime("%m/%d/%y %H:%M"),
+            "Case Start Day": starts.day_name(),
+            "Total Patient In Room Minutes": rng.integers(30, 400, size=cases),
+            "Room": rng.choice(ROOMS, size=cases),
+            "Anesthesia Type": rng.choice(["General", "MAC", "Regional"], size=cases),
+        }
+    )
+
+    months = [(year, month) for year in years for month in range(1, 13)]
+    hours = rng.integers(8, 60, size=(len(BLOCK_SERVICES) * len(months), len(WEEKDAYS))).astype(float)
+    dm_df = pd.DataFrame(
+        [(service, month, year) for service in BLOCK_SERVICES for year, month in months],
+        columns=["Services", "Month", "Year"],
+    )
+    dm_df[WEEKDAYS] = hours
+    dm_df["Sum"] = hours.sum(axis=1)
+
+    dic_df = pd.DataFrame(
+        {
+            "Name from Raw Data": ["Urology/Urology Surgery", "General Surgery", "Orthopedics"],
+            "Selection": ["V", "V", "V"],
+            "Abbreviation": ["URO", "ACS", "ORT"],
+            "Service": ["Urology", "General Surgery", "Orthopedics"],
+        }
+    )
+    return {"nu": nu_df, "sg": sg_df, "dm": dm_df, "dic": dic_df}
+
+
+def _data_url(write):
+    buffer = io.BytesIO()
+    write(buffer)
+    return f"data:{XLSX_TYPE};base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def upload_contents(datasets):
+    """The datasets as the upload components send them: base64 data URLs of Excel workbooks."""
+
+    def available_time(buffer):
+        with pd.ExcelWriter(buffer) as writer:
+            datasets["dm"].to_excel(writer, sheet_name=AVAILABLE_TIME_SHEETS["dm"], index=False)
+            datasets["dic"].to_excel(writer, sheet_name=AVAILABLE_TIME_SHEETS["dic"], index=False)
+
+    return {
+        "nu": _data_url(lambda buffer: datasets["nu"].to_excel(buffer, index=False)),
+        "sg": _data_url(lambda buffer: datasets["sg"].to_excel(buffer, index=False)),
+        "dm": _data_url(available_time),
+    }
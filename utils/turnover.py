@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from utils.settings import TURNOVER_MAX_MINUTES
+
+# Columns naming the operating room in the elective-cases export, in order of preference
+ROOM_COLUMNS = ["Room", "OR Room", "Operating Room", "Location"]
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def room_column(total_df):
+    # Without a room column each specialty's block is treated as one room
+    return next((column for column in ROOM_COLUMNS if column in total_df), "Specialty")
+
+
+def room_day_intervals(total_df, room=None):
+    """Case intervals in minutes sorted by room, day and start time."""
+    room = room or room_column(total_df)
+    starts = pd.to_datetime(total_df["Patient In Room Date/Time"], errors="coerce")
+    minutes = pd.to_numeric(total_df["Total Patient In Room Minutes"], errors="coerce")
+    valid = (starts.notna() & minutes.notna() & total_df[room].notna()).to_numpy()
+
+    start = starts.to_numpy()[valid].astype("datetime64[m]").astype(np.int64)
+    end = start + minutes.to_numpy()[valid].astype(np.int64)
+    room_codes, rooms = pd.factorize(total_df[room].to_numpy()[valid])
+    day = start // MINUTES_PER_DAY
+
+    order = np.lexsort((start, day, room_codes))
+    return rooms, room_codes[order], day[order], start[order], end[order]
+
+
+def turnover_analysis(total_df, room=None, capacity=None, turnover_max=TURNOVER_MAX_MINUTES):
+    """Per room and day: first-case start, turnovers, idle gaps and overlaps.
+
+    One vectorized pass over the sorted intervals. A case's gap is measured
+    from the latest end among earlier cases in the same room-day, so a
+    negative gap means the case overlaps one already in the room. Gaps up to
+    turnover_max minutes are turnovers and longer ones idle time. When a
+    CapacityCalendar is passed and rooms are specialties, UnusedBlockMinutes
+    is the block time on that day left unoccupied.
+    """
+    room = room or room_column(total_df)
+    rooms, room_codes, day, start, end = room_day_intervals(total_df, room)
+    n = len(start)
+    columns = [
+        "Room", "Date", "Cases", "FirstCaseStart", "LastCaseEnd", "InRoomMinutes", "OccupiedMinutes",
+        "Turnovers", "TurnoverMinutes", "IdleMinutes", "OverlappingCases", "OverlapMinutes",
+    ]
+    if n == 0:
+        return pd.DataFrame(columns=columns)
+
+    # Group boundaries for each room-day
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = (room_codes[1:] != room_codes[:-1]) | (day[1:] != day[:-1])
+    group_ids = np.cumsum(new_group) - 1
+    group_starts = np.flatnonzero(new_group)
+
+    # Running latest end within each group: offset groups so the maximum resets
+    span = int(end.max() - start.min()) + 1
+    offset = group_ids.astype(np.int64) * span
+    running_end = np.maximum.accumulate(end - start.min() + offset) - offset + start.min()
+    previous_end = np.empty(n, dtype=np.int64)
+    previous_end[1:] = running_end[:-1]
+    gap = np.where(new_group, 0, start - previous_end)
+
+    turnover = (gap > 0) & (gap <= turnover_max)
+    idle = gap > turnover_max
+    overlap = gap < 0
+    duration = end - start
+
+    sums = lambda values: np.add.reduceat(values, group_starts)
+    cases = np.diff(np.append(group_starts, n))
+    last_end = np.maximum.reduceat(end, group_starts)
+    first_start = start[group_starts]
+    gaps_total = sums(np.where(gap > 0, gap, 0))
+
+    result = pd.DataFrame(
+        {
+            "Room": rooms[room_codes[group_starts]],
+            "Date": (day[group_starts] * MINUTES_PER_DAY).astype("datetime64[m]").astype("datetime64[ns]"),
+            "Cases": cases,
+            "FirstCaseStart": first_start % MINUTES_PER_DAY,
+            "LastCaseEnd": last_end - day[group_starts] * MINUTES_PER_DAY,
+            "InRoomMinutes": sums(duration),
+            "OccupiedMinutes": last_end - first_start - gaps_total,
+            "Turnovers": sums(turnover.astype(np.int64)),
+            "TurnoverMinutes": sums(np.where(turnover, gap, 0)),
+            "IdleMinutes": sums(np.where(idle, gap, 0)),
+            "OverlappingCases": sums(overlap.astype(np.int64)),
+            "OverlapMinutes": sums(np.where(overlap, np.minimum(-gap, duration), 0)),
+        }
+    )
+
+    if capacity is not None and room == "Specialty":
+        block = capacity.hours_on(result["Room"].to_numpy(), result["Date"].to_numpy()) * 60
+        result["BlockMinutes"] = block
+        result["UnusedBlockMinutes"] = np.maximum(block - result["OccupiedMinutes"], 0)
+    return result
+
+
+def summarize_turnover(room_days, by="Room"):
+    """Roll room-day rows up to one row per room (or other column)."""
+    grouped = room_days.groupby(by, as_index=False)
+    summary = grouped.agg(
+        Days=("Date", "count"),
+        Cases=("Cases", "sum"),
+        MedianFirstCaseStart=("FirstCaseStart", "median"),
+        Turnovers=("Turnovers", "sum"),
+        TurnoverMinutes=("TurnoverMinutes", "sum"),
+        IdleMinutes=("IdleMinutes", "sum"),
+        OverlappingCases=("OverlappingCases", "sum"),
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        summary["MeanTurnoverMinutes"] = (summary["TurnoverMinutes"] / summary["Turnovers"]).round(1)
+    summary["IdleHours"] = (summary["IdleMinutes"] / 60).round(1)
+    return summary.drop(columns=["TurnoverMinutes", "IdleMinutes"])
+
+
+def format_clock(minutes):
+    if pd.isna(minutes):
+        return "-"
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
@@ -0,0 +1,320 @@
+import numpy as np
+import pandas as pd
+
+from utils.settings import FISCAL_YEAR_START_MONTH
+
+GRAINS = ["day", "week", "month", "quarter", "fiscal_year"]
+GRAIN_LABELS = {
+    "day": "Day",
+    "week": "ISO Week",
+    "month": "Month",
+    "quarter": "Quarter",
+    "fiscal_year": "Fiscal Year",
+}
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+
+def period_start(dates, grain):
+    """Return the first day of the period each date falls in."""
+    dates = pd.DatetimeIndex(dates).normalize()
+    if grain == "day":
+        return dates
+    if grain == "week":
+        return dates - pd.to_timedelta(dates.weekday, unit="D")
+    if grain == "month":
+        return dates.to_period("M").to_timestamp()
+    if grain == "quarter":
+        return dates.to_period("Q").to_timestamp()
+    if grain == "fiscal_year":
+        offset = (dates.month - FISCAL_YEAR_START_MONTH) % 12
+        return (dates.to_period("M") - offset).to_timestamp()
+    raise ValueError(f"Unknown grain '{grain}'. Expected one of {', '.join(GRAINS)}.")
+
+
+def period_label(starts, grain):
+    starts = pd.DatetimeIndex(starts)
+    if grain == "day":
+        return starts.strftime("%Y-%m-%d")
+    if grain == "week":
+        iso = starts.isocalendar()
+        return pd.Index([f"{year}-W{week:02d}" for year, week in zip(iso["year"], iso["week"])])
+    if grain == "month":
+        return starts.strftime("%Y-%m")
+    if grain == "quarter":
+        return pd.Index([f"{year}-Q{quarter}" for year, quarter in zip(starts.year, starts.quarter)])
+    end_years = starts.year + (FISCAL_YEAR_START_MONTH != 1)
+    return pd.Index([f"FY{year}" for year in end_years])
+
+
+def monthly_capacity(dm_df):
+    """Available hours per Specialty and month from the Available Time summary."""
+    capacity = pd.DataFrame(
+        {
+            "Specialty": dm_df["Services"].to_numpy(),
+            "Date": pd.to_datetime(
+                pd.DataFrame({"year": dm_df["Year"], "month": dm_df["Month"], "day": 1}), errors="coerce"
+            ),
+            "AvailableHours": pd.to_numeric(dm_df["Sum"], errors="coerce").fillna(0).to_numpy(),
+        }
+    ).dropna(subset=["Specialty", "Date"])
+    capacity.attrs["grain"] = "month"
+    return capacity
+
+
+def case_hours(total_df):
+    """Patient in-room hours per case keyed by Specialty and case date."""
+    return pd.DataFrame(
+        {
+            "Specialty": total_df["Specialty"].to_numpy(),
+            "Date": pd.to_datetime(total_df["Case Start Date"]).to_numpy(),
+            "PatientHours": pd.to_numeric(total_df["Total Patient In Room Minutes"], errors="coerce").fillna(0).to_numpy() / 60,
+        }
+    ).dropna(subset=["Specialty", "Date"])
+
+
+def aggregate_utilization(cases, capacity, grain="month", by_specialty=True, matched=True):
+    """Aggregate patient and available hours over a time grain.
+
+    cases holds Specialty/Date/PatientHours rows and capacity holds
+    Specialty/Date/AvailableHours rows at the grain in capacity.attrs
+    ("month" or "day"). Both are reduced with bincount over integer-coded
+    (specialty, period) keys. With matched=True, capacity only counts for
+    specialty/month pairs that had cases, as the dashboards always have.
+    """
+    base_grain = capacity.attrs.get("grain", "month")
+    if GRAINS.index(grain) < GRAINS.index(base_grain):
+        raise ValueError(f"'{grain}' utilization needs capacity at '{grain}' grain or finer; got '{base_grain}'.")
+
+    # Integer codes for specialties and base periods shared by both inputs
+    specialty_codes, specialties = pd.factorize(
+        np.concatenate([cases["Specialty"].to_numpy(), capacity["Specialty"].to_numpy()])
+    )
+    base_dates = np.concatenate(
+        [period_start(cases["Date"], base_grain).to_numpy(), period_start(capacity["Date"], base_grain).to_numpy()]
+    )
+    base_codes, base_starts = pd.factorize(base_dates)
+    n_specialties, n_base = len(specialties), len(base_starts)
+    n_cases = len(cases)
+
+    # Reduce to one cell per (specialty, base period)
+    base_keys = specialty_codes * n_base + base_codes
+    size = n_specialties * n_base
+    patient = np.bincount(base_keys[:n_cases], weights=cases["PatientHours"].to_numpy(), minlength=size)
+    case_count = np.bincount(base_keys[:n_cases], minlength=size)
+    available = np.bincount(base_keys[n_cases:], weights=capacity["AvailableHours"].to_numpy(), minlength=size)
+    if matched:
+        # Presence is judged per specialty and month, so days without cases still count
+        month_codes, month_starts = pd.factorize(period_start(base_starts, "month"))
+        cell_months = np.tile(month_codes, n_specialties) + np.repeat(np.arange(n_specialties), n_base) * len(month_starts)
+        month_has_cases = np.bincount(cell_months, weights=case_count, minlength=n_specialties * len(month_starts)) > 0
+        available[~month_has_cases[cell_months]] = 0
+
+    # Roll base periods up to the requested grain
+    target_starts_per_base = period_start(base_starts, grain)
+    target_codes, target_starts = pd.factorize(target_starts_per_base)
+    n_target = len(target_starts)
+    cell_specialty = np.repeat(np.arange(n_specialties), n_base)
+    cell_target = np.tile(target_codes, n_specialties)
+    group_specialty = cell_specialty if by_specialty else np.zeros_like(cell_specialty)
+    n_groups = n_specialties if by_specialty else 1
+    keys = group_specialty * n_target + cell_target
+
+    used = (case_count > 0) | (available > 0)
+    patient_total = np.bincount(keys[used], weights=patient[used], minlength=n_groups * n_target)
+    available_total = np.bincount(keys[used], weights=available[used], minlength=n_groups * n_target)
+    present = np.bincount(keys[used], minlength=n_groups * n_target) > 0
+
+    group_keys = np.flatnonzero(present)
+    starts = pd.DatetimeIndex(target_starts[group_keys % n_target])
+    result = pd.DataFrame(
+        {
+            "PeriodStart": starts,
+            "Period": period_label(starts, grain),
+            "TotalPatientInRoomHours": patient_total[group_keys],
+            "TotalAvailableHours": available_total[group_keys],
+        }
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = result["TotalPatientInRoomHours"] / result["TotalAvailableHours"] * 100
+    result["UtilizationRate"] = rates.where(result["TotalAvailableHours"] > 0)
+
+    if by_specialty:
+        result.insert(2, "Specialty", specialties[group_keys // n_target])
+        return result.sort_values(["PeriodStart", "Specialty"], ignore_index=True)
+    return result.sort_values("PeriodStart", ignore_index=True)
+
+
+def weekday_utilization(total_df, dm_df):
+    """Patient and available hours per weekday, summed over matching months.
+
+    Only Specialty/Year/Month combinations present in both the cases and the
+    Available Time summary contribute, so each weekday's rate compares hours
+    over the same months. The result always has one row per weekday.
+    """
+    months = pd.to_datetime(
+        pd.DataFrame({"year": total_df["Year"], "month": total_df["Month"], "day": 1}), errors="coerce"
+    )
+    capacity_months = pd.to_datetime(
+        pd.DataFrame({"year": dm_df["Year"], "month": dm_df["Month"], "day": 1}), errors="coerce"
+    )
+
+    # Integer-code the (specialty, month) keys of both sides together
+    specialty_codes, specialties = pd.factorize(
+        np.concatenate([total_df["Specialty"].to_numpy(), dm_df["Services"].to_numpy()])
+    )
+    month_codes, month_starts = pd.factorize(np.concatenate([months.to_numpy(), capacity_months.to_numpy()]))
+    size = len(specialties) * len(month_starts)
+    key_codes = np.where(
+        (specialty_codes >= 0) & (month_codes >= 0), specialty_codes * len(month_starts) + month_codes, -1
+    )
+    n_cases = len(total_df)
+    case_keys, capacity_keys = key_codes[:n_cases], key_codes[n_cases:]
+    in_cases = np.bincount(case_keys[case_keys >= 0], minlength=size) > 0
+    in_capacity = np.bincount(capacity_keys[capacity_keys >= 0], minlength=size) > 0
+    matched = np.append(in_cases & in_capacity, False)  # key -1 maps to the trailing False
+
+    weekday_codes = pd.Categorical(total_df["Case Start Day"], categories=WEEKDAYS).codes
+    case_rows = (weekday_codes >= 0) & matched[case_keys]
+    hours = pd.to_numeric(total_df["Total Patient In Room Minutes"], errors="coerce").fillna(0).to_numpy() / 60
+    patient = np.bincount(weekday_codes[case_rows], weights=hours[case_rows], minlength=len(WEEKDAYS))
+
+    capacity_rows = matched[capacity_keys]
+    available = dm_df.loc[capacity_rows, WEEKDAYS].apply(pd.to_numeric, errors="coerce").sum().to_numpy()
+
+    result = pd.DataFrame(
+        {
+            "Weekday": pd.Categorical(WEEKDAYS, categories=WEEKDAYS, ordered=True),
+            "TotalPatientInRoomHours": patient,
+            "TotalAvailableHours": available,
+        }
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["UtilizationRate"] = np.where(available > 0, patient / available * 100, np.nan)
+    return result
+
+
+def _padded(columns, size):
+    # Columns added before a specialty first appeared are shorter; it had no hours then
+    matrix = np.zeros((len(columns), size))
+    for index, column in enumerate(columns):
+        matrix[index, :len(column)] = column
+    return matrix
+
+
+class MonthlyTrends:
+    """Monthly patient and available hours per specialty, with running totals.
+
+    Months are contiguous from the first to the latest. Adding a month
+    appends one column of per-specialty hours and one of running totals
+    (the previous running totals plus the month), so it costs
+    O(specialties) whatever the history. A trailing window is the
+    difference of two running totals, and year over year compares a month
+    with the one twelve months earlier.
+    """
+
+    def __init__(self):
+        self.specialties = []
+        self._specialty_index = {}
+        self.months = []
+        self._patient = []
+        self._available = []
+        # Running totals before each month, plus one after the latest
+        self._running_patient = [np.zeros(0)]
+        self._running_available = [np.zeros(0)]
+
+    @classmethod
+    def from_monthly(cls, monthly):
+        """Build from Specialty/Date/PatientHours/AvailableHours rows at month grain."""
+        trends = cls()
+        starts = period_start(monthly["Date"], "month")
+        for start, rows in monthly.groupby(starts, sort=True):
+            trends.add_month(
+                start,
+                dict(zip(rows["Specialty"], rows["PatientHours"])),
+                dict(zip(rows["Specialty"], rows["AvailableHours"])),
+            )
+        return trends
+
+    def add_month(self, start, patient_hours, available_hours):
+        """Append a month from {specialty: hours} dicts; skipped months are added empty."""
+        start = pd.Timestamp(start).to_period("M")
+        if self.months and start <= self.months[-1]:
+            raise ValueError(f"Months must be added in order; {start} is not after {self.months[-1]}.")
+        while self.months and self.months[-1] + 1 < start:
+            self._append(self.months[-1] + 1, {}, {})
+        self._append(start, patient_hours, available_hours)
+
+    def _append(self, month, patient_hours, available_hours):
+        for specialty in list(patient_hours) + list(available_hours):
+            if specialty not in self._specialty_index:
+                self._specialty_index[specialty] = len(self.specialties)
+                self.specialties.append(specialty)
+        size = len(self.specialties)
+        patient, available = np.zeros(size), np.zeros(size)
+        for hours, column in [(patient_hours, patient), (available_hours, available)]:
+            for specialty, value in hours.items():
+                column[self._specialty_index[specialty]] += value
+
+        self.months.append(month)
+        self._patient.append(patient)
+        self._available.append(available)
+        for running, column in [(self._running_patient, patient), (self._running_available, available)]:
+            previous = running[-1]
+            total = column.copy()
+            total[:len(previous)] += previous
+            running.append(total)
+
+    def _frame(self, month_index, patient, available, by_specialty):
+        starts = pd.PeriodIndex(self.months, freq="M").to_timestamp()[month_index]
+        if by_specialty:
+            n = len(self.specialties)
+            result = pd.DataFrame(
+                {
+                    "PeriodStart": np.repeat(starts, n),
+                    "Specialty": np.tile(np.array(self.specialties, dtype=object), len(starts)),
+                    "TotalPatientInRoomHours": patient.ravel(),
+                    "TotalAvailableHours": available.ravel(),
+                }
+            )
+            result = result[(result["TotalPatientInRoomHours"] > 0) | (result["TotalAvailableHours"] > 0)]
+        else:
+            result = pd.DataFrame(
+                {
+                    "PeriodStart": starts,
+                    "TotalPatientInRoomHours": patient.sum(axis=1),
+                    "TotalAvailableHours": available.sum(axis=1),
+                }
+            )
+        result.insert(1, "Period", period_label(result["PeriodStart"], "month"))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = result["TotalPatientInRoomHours"] / result["TotalAvailableHours"] * 100
+        result["UtilizationRate"] = rates.where(result["TotalAvailableHours"] > 0)
+        return result.reset_index(drop=True)
+
+    def rolling(self, window, by_specialty=False):
+        """Utilization over the trailing window months ending at each month with a full window."""
+        size = len(self.specialties)
+        running_patient = _padded(self._running_patient, size)
+        running_available = _padded(self._running_available, size)
+        ends = np.arange(window, len(self.months) + 1)
+        return self._frame(
+            ends - 1,
+            running_patient[ends] - running_patient[ends - window],
+            running_available[ends] - running_available[ends - window],
+            by_specialty,
+        )
+
+    def year_over_year(self, by_specialty=False):
+        """Monthly utilization with the rate of the same month a year earlier and the change."""
+        keys = ["Specialty", "PeriodStart"] if by_specialty else ["PeriodStart"]
+        size = len(self.specialties)
+        result = self._frame(
+            np.arange(len(self.months)), _padded(self._patient, size), _padded(self._available, size), by_specialty
+        )
+        prior = result[keys + ["UtilizationRate"]].assign(PeriodStart=result["PeriodStart"] + pd.DateOffset(years=1))
+        result = result.merge(prior.rename(columns={"UtilizationRate": "PriorYearRate"}), on=keys, how="left")
+        result["Year"] = result["PeriodStart"].dt.year
+        result["Month"] = result["PeriodStart"].dt.month
+        result["YearOverYearChange"] = result["UtilizationRate"] - result["PriorYearRate"]
+        return result
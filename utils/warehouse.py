@@ -0,0 +1,685 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.overrides import case_id_column, case_ids
+from utils.settings import DATABASE_PATH, DATABASE_KEEP_VERSIONS, DEFAULT_SITE
+from utils.store_codec import encode_frame, decode_frame
+from utils.utilization import WEEKDAYS
+
+# File-based store for processed datasets. Every processed table is written
+# once as compact frames (for export and rebuilding the case table) and as a
+# narrow, indexed fact table the dashboards aggregate with SQL, so filters
+# are pushed down to the index and only the columns a chart needs are read.
+# Every site has its own datasets, and its own current one; the version leads
+# every index, so each dataset is a contiguous partition of the tables.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    version TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    created TEXT NOT NULL,
+    capacity_version TEXT,
+    store TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    version TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    frame TEXT NOT NULL,
+    PRIMARY KEY (version, chunk)
+);
+CREATE TABLE IF NOT EXISTS cases (
+    version TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    specialty TEXT,
+    surgeon TEXT,
+    case_date TEXT,
+    year INTEGER,
+    month INTEGER,
+    weekday TEXT,
+    minutes REAL,
+    case_id TEXT,
+    start TEXT
+);
+CREATE INDEX IF NOT EXISTS cases_period ON cases (version, year, month, specialty);
+CREATE INDEX IF NOT EXISTS cases_specialty ON cases (version, specialty, year, month);
+CREATE UNIQUE INDEX IF NOT EXISTS cases_row ON cases (version, row);
+CREATE INDEX IF NOT EXISTS cases_case_id ON cases (version, case_id);
+CREATE TABLE IF NOT EXISTS monthly (
+    version TEXT NOT NULL,
+    specialty TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    cases INTEGER NOT NULL,
+    minutes REAL NOT NULL,
+    PRIMARY KEY (version, specialty, year, month)
+);
+CREATE TABLE IF NOT EXISTS patches (
+    version TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    specialty TEXT,
+    total_hours REAL,
+    PRIMARY KEY (version, row)
+);
+CREATE TABLE IF NOT EXISTS capacity (
+    version TEXT NOT NULL,
+    specialty TEXT,
+    year INTEGER,
+    month INTEGER,
+    monday REAL,
+    tuesday REAL,
+    wednesday REAL,
+    thursday REAL,
+    friday REAL,
+    available_hours REAL
+);
+CREATE INDEX IF NOT EXISTS capacity_period ON capacity (version, year, month, specialty);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS overrides (
+    case_id TEXT PRIMARY KEY,
+    specialty TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+"""
+
+# Bumped when the dataset tables change; they are rebuilt from the browser stores on first use
+SCHEMA_VERSION = 6
+DATASET_TABLES = ["datasets", "frames", "cases", "monthly", "patches", "capacity", "state"]
+
+# Store fields kept in the database; the case-level parts are rebuilt from the frame
+STORE_FIELDS = ["lineage", "manifest", "occupancy", "surgeon_sketches"]
+
+_schema_ready = set()
+_lock = threading.Lock()
+
+
+def connect(path=None):
+    path = path or DATABASE_PATH
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with _lock:
+        if path not in _schema_ready:
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                connection.executescript("".join(f"DROP TABLE IF EXISTS {table};" for table in DATASET_TABLES))
+            connection.executescript(SCHEMA)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            _schema_ready.add(path)
+    return connection
+
+
+def _text(series):
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _number(series):
+    values = pd.to_numeric(series, errors="coerce")
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def _capacity_rows(version, dm_df):
+    dm_df = dm_df.dropna(subset=["Services", "Year", "Month"])
+    columns = [[version] * len(dm_df), _text(dm_df["Services"]), _number(dm_df["Year"]), _number(dm_df["Month"])]
+    columns += [_number(dm_df[day]) for day in WEEKDAYS]
+    columns.append(_number(dm_df["Sum"]))
+    return zip(*columns)
+
+
+def _case_rows(version, total_df, offset=0):
+    dates = pd.to_datetime(total_df["Case Start Date"], errors="coerce")
+    valid = dates.notna()
+    starts = pd.to_datetime(total_df["Patient In Room Date/Time"], errors="coerce")
+    id_column = case_id_column(total_df)
+    columns = [
+        [version] * len(total_df),
+        range(offset, offset + len(total_df)),
+        _text(total_df["Specialty"]),
+        _text(total_df["Primary Surgeon"]) if "Primary Surgeon" in total_df else [None] * len(total_df),
+        dates.dt.strftime("%Y-%m-%d").where(valid, None).tolist(),
+        _number(dates.dt.year.where(valid)),
+        _number(dates.dt.month.where(valid)),
+        _text(total_df["Case Start Day"]) if "Case Start Day" in total_df else [None] * len(total_df),
+        _number(total_df["Total Patient In Room Minutes"]),
+        case_ids(total_df[id_column]).tolist() if id_column else [None] * len(total_df),
+        starts.dt.strftime("%Y-%m-%d %H:%M:%S").where(starts.notna(), None).tolist(),
+    ]
+    return zip(*columns)
+
+
+def _monthly_totals(specialties, years, months, minutes, sign=1):
+    """Case count and minutes per (specialty, year, month), signed for adding or removing cases."""
+    frame = pd.DataFrame({"specialty": specialties, "year": years, "month": months, "minutes": minutes})
+    frame = frame.dropna(subset=["specialty", "year", "month"])
+    totals = frame.groupby(["specialty", "year", "month"], sort=False).agg(
+        cases=("minutes", "size"), minutes=("minutes", "sum")
+    )
+    return [
+        (specialty, int(year), int(month), sign * int(cases), sign * float(minutes))
+        for (specialty, year, month), cases, minutes in zip(totals.index, totals["cases"], totals["minutes"])
+    ]
+
+
+def _add_monthly(connection, version, totals):
+    # Monthly aggregates are kept additive, so chunks and patches only touch the months they contain
+    connection.executemany(
+        "INSERT INTO monthly VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (version, specialty, year, month) "
+        "DO UPDATE SET cases = cases + excluded.cases, minutes = minutes + excluded.minutes",
+        [(version,) + total for total in totals],
+    )
+    connection.execute("DELETE FROM monthly WHERE version = ? AND cases <= 0", (version,))
+
+
+def has_capacity(version):
+    # Asked of the database every time (an index lookup): another process may have pruned it
+    if not version:
+        return False
+    with closing(connect()) as connection:
+        return connection.execute("SELECT 1 FROM capacity WHERE version = ? LIMIT 1", (version,)).fetchone() is not None
+
+
+def save_capacity(version, dm_df):
+    """Write the Available Time summary under its upload version (once)."""
+    if not version or has_capacity(version):
+        return
+    with closing(connect()) as connection:
+        with connection:
+            # Sites processed in parallel may share a workbook; only the first writes it
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("SELECT 1 FROM capacity WHERE version = ? LIMIT 1", (version,)).fetchone() is None:
+                connection.executemany("INSERT INTO capacity VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _capacity_rows(version, dm_df))
+
+
+class DatasetWriter:
+    """Write a processed dataset chunk by chunk, then make it current in one step.
+
+    Each chunk is appended to the fact table and stored as frames in its own
+    short transaction, under a pending version no dataset refers to yet, so
+    the full case table never has to be held at once and the database is
+    never locked while a chunk is being processed: sites processed in
+    parallel only wait for each other's chunk writes. finish() renames the
+    pending rows to the dataset's version and makes it current for its site
+    in a single transaction; until then readers keep seeing the previous
+    dataset. abort() deletes the pending rows.
+    """
+
+    def __init__(self):
+        self.version = f"pending-{os.getpid()}-{time.time_ns()}"
+        self.rows = 0
+        self.chunks = 0
+        self.connection = connect()
+
+    def write(self, total_chunk):
+        dates = pd.to_datetime(total_chunk["Case Start Date"], errors="coerce")
+        monthly = _monthly_totals(
+            total_chunk["Specialty"].to_numpy(), dates.dt.year.to_numpy(), dates.dt.month.to_numpy(),
+            pd.to_numeric(total_chunk["Total Patient In Room Minutes"], errors="coerce").fillna(0).to_numpy(),
+        )
+        frame = json.dumps(encode_frame(total_chunk))
+        cases = list(_case_rows(self.version, total_chunk, self.rows))
+        with self.connection:
+            self.connection.execute("INSERT INTO frames VALUES (?, ?, ?)", (self.version, self.chunks, frame))
+            self.connection.executemany("INSERT INTO cases VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", cases)
+            _add_monthly(self.connection, self.version, monthly)
+        self.rows += len(total_chunk)
+        self.chunks += 1
+
+    def finish(self, processed_data, dm_df=None, capacity_version=None):
+        lineage = processed_data.get("lineage") or {}
+        version = lineage.get("version") or processed_data["manifest"]["version"]
+        site = lineage.get("site") or DEFAULT_SITE
+        store = {field: processed_data[field] for field in STORE_FIELDS if field in processed_data}
+        connection = self.connection
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            # The version was only known once every chunk had been seen
+            for table in ["cases", "monthly", "patches", "frames"]:
+                connection.execute(f"DELETE FROM {table} WHERE version = ?", (version,))
+                connection.execute(f"UPDATE {table} SET version = ? WHERE version = ?", (version, self.version))
+            connection.execute(
+                "INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?)",
+                (version, site, datetime.now().isoformat(timespec="seconds"), capacity_version, json.dumps(store)),
+            )
+            connection.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (_current_key(site), version))
+            connection.commit()
+            if dm_df is not None:
+                save_capacity(capacity_version, dm_df)
+            prune(connection)
+        except Exception:
+            connection.rollback()
+            self._discard()
+            raise
+        finally:
+            connection.close()
+        return version
+
+    def abort(self):
+        try:
+            self.connection.rollback()
+            self._discard()
+        finally:
+            self.connection.close()
+
+    def _discard(self):
+        with self.connection:
+            for table in ["cases", "monthly", "patches", "frames"]:
+                self.connection.execute(f"DELETE FROM {table} WHERE version = ?", (self.version,))
+
+
+def save_dataset(total_df, processed_data, dm_df=None, capacity_version=None):
+    """Persist a processed dataset and make it the current one."""
+    writer = DatasetWriter()
+    try:
+        writer.write(total_df)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.finish(processed_data, dm_df, capacity_version)
+
+
+def _current_key(site):
+    return f"current:{site}"
+
+
+def prune(connection, keep=None):
+    # Keep each site's most recent datasets and the capacity tables they refer to
+    keep = DATABASE_KEEP_VERSIONS if keep is None else keep
+    stale = [
+        row[0] for row in connection.execute(
+            "SELECT version FROM (SELECT version, ROW_NUMBER() OVER "
+            "(PARTITION BY site ORDER BY created DESC, rowid DESC) AS age FROM datasets) WHERE age > ?",
+            (keep,),
+        )
+    ]
+    with connection:
+        for version in stale:
+            connection.execute("DELETE FROM datasets WHERE version = ?", (version,))
+            connection.execute("DELETE FROM frames WHERE version = ?", (version,))
+            connection.execute("DELETE FROM cases WHERE version = ?", (version,))
+            connection.execute("DELETE FROM monthly WHERE version = ?", (version,))
+            connection.execute("DELETE FROM patches WHERE version = ?", (version,))
+        connection.execute(
+            "DELETE FROM capacity WHERE version NOT IN "
+            "(SELECT capacity_version FROM datasets WHERE capacity_version IS NOT NULL)"
+        )
+
+
+def has_dataset(version):
+    # Asked of the database every time (a primary-key lookup): another process may have pruned it
+    if not version:
+        return False
+    with closing(connect()) as connection:
+        return connection.execute("SELECT 1 FROM datasets WHERE version = ?", (version,)).fetchone() is not None
+
+
+def current_store(site=DEFAULT_SITE):
+    """A site's current dataset as a processed store that refers to the database."""
+    return current_sites().get(site)
+
+
+def current_sites():
+    """{site: current dataset as a processed store that refers to the database}."""
+    with closing(connect()) as connection:
+        rows = connection.execute(
+            "SELECT d.site, d.version, d.store FROM state s JOIN datasets d ON d.version = s.value "
+            "WHERE s.key = 'current:' || d.site ORDER BY d.site"
+        ).fetchall()
+    return {site: dict(json.loads(store), warehouse=version) for site, version, store in rows}
+
+
+def dataset_revision(version=None, site=DEFAULT_SITE):
+    """(version, capacity version, overrides revision) of a saved dataset, or of a site's current one.
+
+    Returns None when there is no such dataset. The overrides revision changes
+    whenever specialty overrides patch the dataset in place.
+    """
+    with closing(connect()) as connection:
+        return connection.execute(
+            "SELECT version, capacity_version, json_extract(store, '$.lineage.overrides') FROM datasets "
+            "WHERE version = COALESCE(?, (SELECT value FROM state WHERE key = ?))",
+            (version, _current_key(site)),
+        ).fetchone()
+
+
+def dataset_store(version):
+    """A saved dataset as a processed store that refers to the database, or None."""
+    with closing(connect()) as connection:
+        row = connection.execute("SELECT store FROM datasets WHERE version = ?", (version,)).fetchone()
+    return dict(json.loads(row[0]), warehouse=version) if row else None
+
+
+def list_datasets():
+    """Saved datasets, newest first, with their site, creation time, capacity version and whether they are current."""
+    with closing(connect()) as connection:
+        rows = connection.execute(
+            "SELECT d.version, d.site, d.created, d.capacity_version, d.version IS s.value FROM datasets d "
+            "LEFT JOIN state s ON s.key = 'current:' || d.site ORDER BY d.created DESC, d.version"
+        ).fetchall()
+    return [
+        {"version": version, "site": site, "created": created, "capacity_version": capacity, "current": bool(current)}
+        for version, site, created, capacity, current in rows
+    ]
+
+
+def load_frame(version):
+    with closing(connect()) as connection:
+        chunks = [row[0] for row in connection.execute(
+            "SELECT frame FROM frames WHERE version = ? ORDER BY chunk", (version,)
+        )]
+        patches = connection.execute(
+            "SELECT row, specialty, total_hours FROM patches WHERE version = ?", (version,)
+        ).fetchall()
+    if not chunks:
+        return None
+    frames = [decode_frame(json.loads(chunk)) for chunk in chunks]
+    frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    if patches:
+        # Specialty overrides applied since the dataset was saved
+        rows = [patch[0] for patch in patches]
+        frame.iloc[rows, frame.columns.get_loc("Specialty")] = [patch[1] for patch in patches]
+        if "Total Hours" in frame:
+            frame.iloc[rows, frame.columns.get_loc("Total Hours")] = [
+                np.nan if patch[2] is None else patch[2] for patch in patches
+            ]
+    return frame
+
+
+def query_override_changes(version):
+    """A dataset's cases whose saved specialty override differs from their specialty.
+
+    Cases are matched to the overrides table by case ID through the
+    (version, case_id) index. Columns are named as in the processed case
+    table, with the override in "New Specialty".
+    """
+    with closing(connect()) as connection:
+        return pd.read_sql_query(
+            'SELECT c.row AS "Row", c.case_id AS "Case ID", c.surgeon AS "Primary Surgeon", '
+            'c.specialty AS "Specialty", o.specialty AS "New Specialty", c.year AS "Year", c.month AS "Month", '
+            'c.weekday AS "Case Start Day", c.start AS "Patient In Room Date/Time", '
+            'c.minutes AS "Total Patient In Room Minutes" '
+            "FROM cases c JOIN overrides o ON o.case_id = c.case_id "
+            "WHERE c.version = ? AND c.specialty IS NOT o.specialty ORDER BY c.row",
+            connection,
+            params=[version],
+        )
+
+
+def _specialty_manifest(connection, version, manifest, previous, specialties):
+    # Only the specialties cases moved between can change; they are counted again through
+    # the (version, specialty) index, and all surgeons only if a case had no specialty before
+    moved = sorted({specialty for specialty in list(previous) + list(specialties) if specialty is not None})
+    counts = dict(connection.execute(
+        f"SELECT specialty, COUNT(DISTINCT surgeon) FROM cases WHERE version = ? "
+        f"AND specialty IN ({', '.join('?' * len(moved))}) GROUP BY specialty",
+        [version] + moved,
+    ).fetchall())
+    surgeon_counts = {specialty: count for specialty, count in manifest["surgeon_counts"].items() if specialty not in moved}
+    surgeon_counts.update({specialty: count for specialty, count in counts.items() if count})
+    surgeon_count = manifest["surgeon_count"]
+    if any(specialty is None for specialty in previous):
+        surgeon_count = connection.execute(
+            "SELECT COUNT(DISTINCT surgeon) FROM cases WHERE version = ? AND specialty IS NOT NULL", (version,)
+        ).fetchone()[0]
+    return dict(
+        manifest,
+        specialties=sorted(set(manifest["specialties"]).difference(moved).union(counts)),
+        surgeon_counts=dict(sorted(surgeon_counts.items())),
+        surgeon_count=surgeon_count,
+    )
+
+
+def patch_dataset(version, rows, specialties, total_hours, processed_data):
+    """Update the specialty of individual cases in place through the (version, row) index.
+
+    Returns processed_data with its manifest brought up to date, as saved.
+    """
+    rows = [int(row) for row in rows]
+    total_hours = _number(pd.Series(total_hours, dtype="float64"))
+    with closing(connect()) as connection:
+        with connection:
+            # Move the patched cases' monthly contributions from their old specialty to the new one
+            before = []
+            for start in range(0, len(rows), 500):
+                batch = rows[start:start + 500]
+                before += connection.execute(
+                    f"SELECT row, specialty, year, month, minutes FROM cases WHERE version = ? "
+                    f"AND row IN ({', '.join('?' * len(batch))})",
+                    [version] + batch,
+                ).fetchall()
+            new_specialty = dict(zip(rows, specialties))
+            years = [case[2] for case in before]
+            months = [case[3] for case in before]
+            minutes = [case[4] or 0.0 for case in before]
+            _add_monthly(
+                connection,
+                version,
+                _monthly_totals([case[1] for case in before], years, months, minutes, sign=-1)
+                + _monthly_totals([new_specialty[case[0]] for case in before], years, months, minutes),
+            )
+            connection.executemany(
+                "UPDATE cases SET specialty = ? WHERE version = ? AND row = ?",
+                zip(specialties, [version] * len(rows), rows),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO patches VALUES (?, ?, ?, ?)",
+                zip([version] * len(rows), rows, specialties, total_hours),
+            )
+            manifest = _specialty_manifest(
+                connection, version, processed_data["manifest"], [case[1] for case in before], specialties
+            )
+            processed_data = dict(processed_data, manifest=manifest)
+            store = {field: processed_data[field] for field in STORE_FIELDS if field in processed_data}
+            connection.execute("UPDATE datasets SET store = ? WHERE version = ?", (json.dumps(store), version))
+    return processed_data
+
+
+def save_overrides(overrides):
+    created = datetime.now().isoformat(timespec="seconds")
+    with closing(connect()) as connection:
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO overrides VALUES (?, ?, ?)",
+                zip(overrides["Case ID"], overrides["Specialty"], [created] * len(overrides)),
+            )
+
+
+def load_overrides():
+    with closing(connect()) as connection:
+        rows = connection.execute("SELECT case_id, specialty FROM overrides ORDER BY case_id").fetchall()
+    return pd.DataFrame(rows, columns=["Case ID", "Specialty"])
+
+
+def capacity_version(shared_files, version):
+    # The current Available Time upload, else the one saved with the dataset
+    uploaded = (shared_files or {}).get("versions", {}).get("dm")
+    if uploaded and "dm" in (shared_files or {}):
+        return uploaded
+    with closing(connect()) as connection:
+        row = connection.execute("SELECT capacity_version FROM datasets WHERE version = ?", (version,)).fetchone()
+    return row[0] if row else None
+
+
+def _filters(year=None, months=None, specialty=None):
+    clauses, params = [], []
+    if year:
+        clauses.append("year = ?")
+        params.append(int(year))
+    if months:
+        months = list(map(int, months))
+        clauses.append(f"month IN ({', '.join('?' * len(months))})")
+        params.extend(months)
+    if specialty:
+        clauses.append("specialty = ?")
+        params.append(specialty)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def query_case_hours(version, year=None, months=None, specialty=None, grain="day"):
+    """Patient hours per Specialty and day (or month), shaped like case_hours()."""
+    where, params = _filters(year, months, specialty)
+    bucket = "case_date" if grain == "day" else "substr(case_date, 1, 8) || '01'"
+    with closing(connect()) as connection:
+        rows = connection.execute(
+            f"SELECT specialty, {bucket} AS bucket, TOTAL(minutes) / 60.0 FROM cases "
+            f"WHERE version = ? AND specialty IS NOT NULL AND case_date IS NOT NULL{where} "
+            "GROUP BY specialty, bucket",
+            [version] + params,
+        ).fetchall()
+    return pd.DataFrame(
+        {
+            "Specialty": [row[0] for row in rows],
+            "Date": pd.to_datetime([row[1] for row in rows]),
+            "PatientHours": np.array([row[2] for row in rows], dtype=float),
+        }
+    )
+
+
+def query_capacity(version, year=None, months=None, specialty=None):
+    """Available hours per Specialty and month, shaped like monthly_capacity()."""
+    where, params = _filters(year, months, specialty)
+    with closing(connect()) as connection:
+        rows = connection.execute(
+            f"SELECT specialty, year, month, TOTAL(available_hours) FROM capacity WHERE version = ?{where} "
+            "GROUP BY specialty, year, month",
+            [version] + params,
+        ).fetchall()
+    capacity = pd.DataFrame(
+        {
+            "Specialty": [row[0] for row in rows],
+            "Date": pd.to_datetime(
+                pd.DataFrame({"year": [row[1] for row in rows], "month": [row[2] for row in rows], "day": 1}),
+                errors="coerce",
+            ),
+            "AvailableHours": np.array([row[3] for row in rows], dtype=float),
+        }
+    ).dropna(subset=["Date"])
+    capacity.attrs["grain"] = "month"
+    return capacity
+
+
+def query_monthly(version, capacity):
+    """Patient and available hours per Specialty and month from the monthly aggregates.
+
+    Capacity only counts for specialty/month pairs that had cases, as in
+    aggregate_utilization with matched=True.
+    """
+    with closing(connect()) as connection:
+        rows = connection.execute(
+            "SELECT m.specialty, m.year, m.month, m.cases, m.minutes / 60.0, COALESCE(a.hours, 0) FROM monthly m "
+            "LEFT JOIN (SELECT specialty, year, month, TOTAL(available_hours) AS hours FROM capacity "
+            "WHERE version = ? GROUP BY specialty, year, month) a USING (specialty, year, month) "
+            "WHERE m.version = ? ORDER BY m.year, m.month, m.specialty",
+            [capacity, version],
+        ).fetchall()
+    return pd.DataFrame(
+        {
+            "Specialty": [row[0] for row in rows],
+            "Date": pd.to_datetime(
+                pd.DataFrame({"year": [row[1] for row in rows], "month": [row[2] for row in rows], "day": 1})
+            ),
+            "Cases": np.array([row[3] for row in rows], dtype=int),
+            "PatientHours": np.array([row[4] for row in rows], dtype=float),
+            "AvailableHours": np.array([row[5] for row in rows], dtype=float),
+        }
+    )
+
+
+def query_available_time(version):
+    """The Available Time summary rows, shaped like the uploaded sheet."""
+    with closing(connect()) as connection:
+        frame = pd.read_sql_query(
+            "SELECT specialty AS Services, year AS Year, month AS Month, monday AS Monday, tuesday AS Tuesday, "
+            "wednesday AS Wednesday, thursday AS Thursday, friday AS Friday, available_hours AS Sum "
+            "FROM capacity WHERE version = ?",
+            connection,
+            params=[version],
+        )
+    return frame
+
+
+def _weekday_frame(patient_hours, available_hours):
+    result = pd.DataFrame(
+        {
+            "Weekday": pd.Categorical(WEEKDAYS, categories=WEEKDAYS, ordered=True),
+            "TotalPatientInRoomHours": patient_hours,
+            "TotalAvailableHours": available_hours,
+        }
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["UtilizationRate"] = np.where(available_hours > 0, patient_hours / available_hours * 100, np.nan)
+    return result
+
+
+def query_weekday_utilization(version, capacity, year=None, months=None, specialty=None):
+    """Weekday utilization over Specialty/month pairs present on both sides (see weekday_utilization)."""
+    where, params = _filters(year, months, specialty)
+    day_columns = ", ".join(f"TOTAL({day.lower()})" for day in WEEKDAYS)
+    with closing(connect()) as connection:
+        patient = dict(
+            connection.execute(
+                f"WITH c AS (SELECT * FROM cases WHERE version = ?{where}), "
+                f"a AS (SELECT DISTINCT specialty, year, month FROM capacity WHERE version = ?{where}) "
+                "SELECT c.weekday, TOTAL(c.minutes) / 60.0 FROM c JOIN a USING (specialty, year, month) GROUP BY c.weekday",
+                [version] + params + [capacity] + params,
+            ).fetchall()
+        )
+        available = connection.execute(
+            f"WITH c AS (SELECT DISTINCT specialty, year, month FROM cases WHERE version = ?{where}) "
+            f"SELECT {day_columns} FROM capacity a JOIN c USING (specialty, year, month) WHERE a.version = ?{where}",
+            [version] + params + [capacity] + params,
+        ).fetchone()
+
+    return _weekday_frame(np.array([patient.get(day, 0.0) for day in WEEKDAYS]), np.array(available, dtype=float))
+
+
+def query_weekday_utilization_by_specialty(version, capacity, specialties, year=None, months=None):
+    """query_weekday_utilization for each specialty, from one pass over each table.
+
+    Returns {specialty: weekday frame}, equal to querying each specialty alone.
+    """
+    where, params = _filters(year, months)
+    day_columns = ", ".join(f"TOTAL({day.lower()})" for day in WEEKDAYS)
+    with closing(connect()) as connection:
+        patient = connection.execute(
+            f"WITH c AS (SELECT * FROM cases WHERE version = ?{where}), "
+            f"a AS (SELECT DISTINCT specialty, year, month FROM capacity WHERE version = ?{where}) "
+            "SELECT c.specialty, c.weekday, TOTAL(c.minutes) / 60.0 FROM c JOIN a USING (specialty, year, month) "
+            "GROUP BY c.specialty, c.weekday",
+            [version] + params + [capacity] + params,
+        ).fetchall()
+        available = connection.execute(
+            f"WITH c AS (SELECT DISTINCT specialty, year, month FROM cases WHERE version = ?{where}) "
+            f"SELECT a.specialty, {day_columns} FROM capacity a JOIN c USING (specialty, year, month) "
+            f"WHERE a.version = ?{where} GROUP BY a.specialty",
+            [version] + params + [capacity] + params,
+        ).fetchall()
+
+    patient_hours = {}
+    for specialty, weekday, hours in patient:
+        patient_hours.setdefault(specialty, {})[weekday] = hours
+    available_hours = {row[0]: row[1:] for row in available}
+    return {
+        specialty: _weekday_frame(
+            np.array([patient_hours.get(specialty, {}).get(day, 0.0) for day in WEEKDAYS]),
+            np.array(available_hours.get(specialty, [0.0] * len(WEEKDAYS)), dtype=float),
+        )
+        for specialty in specialties
+    }
+
+
+def query_cases(version, columns, year=None, months=None, specialty=None):
+    """Read only the requested case columns (fact-table names) for the filtered cases."""
+    where, params = _filters(year, months, specialty)
+    with closing(connect()) as connection:
+        return pd.read_sql_query(
+            f"SELECT {', '.join(columns)} FROM cases WHERE version = ?{where}", connection, params=[version] + params
+        )